@@ -5,24 +5,44 @@
 一个统一的脚本，用于管理和安装ComfyUI项目的所有Python依赖项。
 
 该脚本整合了以下逻辑：
-1. 从本地文件系统扫描所有`requirements.txt`文件。
-2. 使用直接的、基于优先级的策略解决版本冲突。
+1. 从本地文件系统扫描所有`requirements.txt`文件（以及节点的pyproject.toml和install.py，见requirements_scanner.py）。
+2. 对每个软件包的所有版本约束求交集，并结合本地索引元数据缓存选出最高的可用版本。
 3. 在一个统一的过程中安装所有软件包。
 
 这种方法简化了Dockerfile并集中了依赖项管理，
 使构建过程更加透明和可维护。
 """
 
+import argparse
 import sys
 import subprocess
 import logging
 import os
-import glob
-from collections import defaultdict
+import hashlib
+import json
+import platform
+import re
+import shutil
+import tempfile
+import threading
+import urllib.request
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from html.parser import HTMLParser
 from packaging.requirements import Requirement
+from packaging.specifiers import SpecifierSet
+from packaging.utils import canonicalize_name, parse_sdist_filename, parse_wheel_filename
+from packaging.version import InvalidVersion, Version
 from packaging.version import parse as parse_version
 import time
 
+from build_trace import Tracer
+from pinned_packages import PINNED_PACKAGES
+from pip_mirrors import PYPI_INDEX_URL, TORCH_INDEX_URL, get_selector, is_network_error
+from requirements_scanner import RequirementsScanner
+from slim_environment import slim
+
 # --- 基本设置 ---
 logging.basicConfig(
     level=logging.INFO,
@@ -30,6 +50,7 @@ logging.basicConfig(
     stream=sys.stdout
 )
 LOGGER = logging.getLogger(__name__)
+TRACER = Tracer("build_dependencies")
 
 # --- 配置 ---
 
@@ -45,32 +66,446 @@ MANUAL_PACKAGES = [
     "git+https://github.com/huggingface/diffusers"
 ]
 
-# 基础软件包，必须固定到特定版本。
+# 基础软件包，必须固定到特定版本（定义在 pinned_packages.py 中，与verify_dependencies.py共用）。
 # 它们在解决阶段被注入。
-# "numpy": "1.26.4"
-
-# PINNED_PACKAGES = {
-#     "torch": "2.5.1",
-#     "torchvision": "0.20.1",
-#     "torchaudio": "2.5.1",
-#     "xformers": "0.0.29.post1"
-# }
-
-PINNED_PACKAGES = {
-    "torch": "2.6.0",
-    "torchvision": "0.21.0",
-    "torchaudio": "2.6.0",
-    "xformers": "v0.0.29.post2",
-    "numpy": "1.24.4",  # 兼容mediapipe<2要求
-    "scipy": "1.12.0",  # 满足jax、scikit-image等>=1.12要求
-    "pillow": "9.5.0",   # 兼容simple-lama-inpainting<10.0.0要求
-    "timm": "0.4.12",    # 兼容torchscale要求
-    "opencv-contrib-python-headless": "4.8.1.78",  # 稳定版本，避免依赖冲突
-    "decord": "0.6.0"
-}
-
-# PyTorch专用下载源
-TORCH_INDEX_URL = "https://download.pytorch.org/whl/cu121"
+
+# 安装顺序分层：基础包 -> torch包 -> 优先包 -> 其余包
+BASE_PACKAGES = ["numpy", "scipy", "pillow"]
+TORCH_PACKAGES = ["torch", "torchvision", "torchaudio", "xformers"]
+PRIORITY_PACKAGES = ["timm", "opencv-contrib-python-headless"]
+
+# 安装模式：
+# - "batch"（默认）：将解析结果与PINNED_PACKAGES写入约束文件，每个层级只运行一次pip解析
+# - "serial"：旧模式，每个软件包单独启动一个pip进程
+INSTALL_MODE = os.environ.get("DEPENDENCY_INSTALL_MODE", "batch").lower()
+
+# 批量安装时使用的约束文件
+CONSTRAINTS_FILE = "/app/constraints.txt"
+
+# 最终的依赖清单，记录本次构建解析出的全部版本
+FINAL_REQUIREMENTS_FILE = "/app/final_requirements.txt"
+
+# 增量构建：记录上一次的输入指纹与解析计划，位于final_requirements.txt旁边
+PLAN_FILE = "/app/final_requirements.lock.json"
+# 设置为true时忽略上一次的计划，执行完整安装
+FORCE_FULL_INSTALL = os.environ.get("FORCE_FULL_INSTALL", "false").lower() in ("true", "1", "yes")
+
+# --- 分层锁文件 ---
+# --plan-tiers 把解析计划按安装层级拆分为独立的锁文件，--install-tier 单独安装其中一个层级，
+# 这样每个层级可以作为Docker镜像中单独缓存的一层：只有内容变化的层级及其之后的层才会重建。
+TIERS_DIR = os.environ.get("DEPENDENCY_TIERS_DIR", "/app/dependency_tiers")
+TIER_ORDER = ["base", "torch", "priority", "rest", "manual"]
+TIER_STATUS_FILE = "install_status.json"
+
+# --- 安装后精简 ---
+# 设置为true时，安装完成后在同一进程中按策略删除测试目录等内容（必须与安装处于同一镜像层才能减小体积）
+SLIM_ENVIRONMENT = os.environ.get("SLIM_ENVIRONMENT", "false").lower() in ("true", "1", "yes")
+
+# --- 冲突分析 ---
+# 安装前的冲突分析报告
+CONFLICT_REPORT_FILE = os.environ.get("CONFLICT_REPORT_FILE", "/app/dependency_conflicts.json")
+# 设置为true时，只要分析发现冲突就在任何pip调用之前中止构建
+STRICT_DEPENDENCIES = os.environ.get("STRICT_DEPENDENCIES", "false").lower() in ("true", "1", "yes")
+# 默认情况下 --plan-tiers 遇到无法满足的约束时以非零状态退出；设置为true时只报告，
+# 这些软件包不固定版本，由pip决定
+ALLOW_UNSATISFIABLE = os.environ.get("ALLOW_UNSATISFIABLE", "false").lower() in ("true", "1", "yes")
+
+# --- Wheel缓存 ---
+# 持久化的wheel缓存目录（构建时通过BuildKit缓存挂载保留），为空时禁用预取阶段。
+# 所有wheel先在有界的并发pip进程中下载或构建到此目录，随后的安装阶段完全离线进行。
+WHEELHOUSE_DIR = os.environ.get("WHEELHOUSE_DIR", "")
+# 预取阶段同时运行的pip进程数
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# --- 索引元数据缓存 ---
+# 记录每个软件包在索引中可用的版本，供版本解析器使用
+INDEX_METADATA_CACHE = os.environ.get("INDEX_METADATA_CACHE", "/app/.cache/index_metadata.json")
+# 可选的本地PEP 503索引目录（<root>/<project>/index.html），用于离线填充缓存
+LOCAL_INDEX_DIR = os.environ.get("LOCAL_INDEX_DIR", "")
+# 用于填充缓存中缺失软件包的远程索引
+PIP_INDEX_URL = os.environ.get("PIP_INDEX_URL", PYPI_INDEX_URL)
+# 设置为true时只使用缓存和本地索引，不访问网络
+INDEX_OFFLINE = os.environ.get("INDEX_OFFLINE", "false").lower() in ("true", "1", "yes")
+# 缓存条目的有效期（秒）
+INDEX_CACHE_TTL = 24 * 3600
+INDEX_FETCH_WORKERS = 16
+
+
+class _SimpleIndexParser(HTMLParser):
+    """解析PEP 503 HTML页面中的文件链接。"""
+
+    def __init__(self):
+        super().__init__()
+        self.files = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        attrs = dict(attrs)
+        href = attrs.get("href") or ""
+        filename = href.split("#", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+        if filename:
+            self.files.append({
+                "filename": filename,
+                "requires_python": attrs.get("data-requires-python"),
+                "yanked": "data-yanked" in attrs,
+            })
+
+
+class IndexMetadataCache:
+    """
+    软件包可用版本的本地缓存。
+
+    缓存以JSON形式保存在磁盘上，可以从本地PEP 503目录加载（便于离线测试），
+    也可以从远程简单索引（PEP 691 JSON或PEP 503 HTML）补全缺失的软件包。
+    """
+
+    def __init__(self, cache_path=INDEX_METADATA_CACHE):
+        self.cache_path = cache_path
+        self.packages = {}
+
+    def load(self):
+        """从磁盘加载缓存。"""
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                self.packages = json.load(f).get("packages", {})
+            LOGGER.info(f"已从 {self.cache_path} 加载 {len(self.packages)} 个软件包的索引元数据。")
+        except (OSError, ValueError) as e:
+            LOGGER.warning(f"读取索引元数据缓存失败: {self.cache_path}. 错误: {e}")
+
+    def save(self):
+        """将缓存写回磁盘。"""
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"packages": self.packages}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            LOGGER.warning(f"写入索引元数据缓存失败: {self.cache_path}. 错误: {e}")
+
+    def knows(self, name):
+        """缓存中是否存在该软件包。"""
+        return canonicalize_name(name) in self.packages
+
+    def load_local_index(self, root):
+        """从本地PEP 503目录加载所有软件包的版本信息。"""
+        if not os.path.isdir(root):
+            LOGGER.warning(f"本地索引目录不存在: {root}")
+            return
+        count = 0
+        for entry in os.scandir(root):
+            if not entry.is_dir():
+                continue
+            index_file = os.path.join(entry.path, "index.html")
+            if os.path.exists(index_file):
+                parser = _SimpleIndexParser()
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    parser.feed(f.read())
+                files = parser.files
+            else:
+                # 没有index.html时，直接使用目录中的分发文件
+                files = [{"filename": name, "requires_python": None, "yanked": False}
+                         for name in os.listdir(entry.path)]
+            self._store(entry.name, files)
+            count += 1
+        LOGGER.info(f"已从本地索引 {root} 加载 {count} 个软件包的版本信息。")
+
+    def fetch_missing(self, names, index_url=PIP_INDEX_URL, workers=INDEX_FETCH_WORKERS):
+        """并发地从远程索引获取缓存中缺失或已过期的软件包。"""
+        now = time.time()
+        missing = sorted({
+            canonicalize_name(name) for name in names
+            if now - self.packages.get(canonicalize_name(name), {}).get("fetched_at", 0) > INDEX_CACHE_TTL
+        })
+        if not missing:
+            return
+        LOGGER.info(f"正在从 {index_url} 获取 {len(missing)} 个软件包的版本信息...")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for name, files in zip(missing, executor.map(lambda n: self._fetch(index_url, n), missing)):
+                if files is not None:
+                    self._store(name, files)
+
+    def _fetch(self, index_url, name):
+        """获取单个软件包的文件列表，失败时返回None。"""
+        url = f"{index_url.rstrip('/')}/{name}/"
+        request = urllib.request.Request(url, headers={
+            "Accept": "application/vnd.pypi.simple.v1+json, text/html;q=0.1"
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                content_type = response.headers.get("Content-Type", "")
+                body = response.read().decode("utf-8")
+        except Exception as e:
+            LOGGER.warning(f"获取 {name} 的索引信息失败: {e}")
+            return None
+
+        if "json" in content_type:
+            return [{
+                "filename": item["filename"],
+                "requires_python": item.get("requires-python"),
+                "yanked": bool(item.get("yanked")),
+            } for item in json.loads(body).get("files", [])]
+        parser = _SimpleIndexParser()
+        parser.feed(body)
+        return parser.files
+
+    def _store(self, project, files):
+        """从文件名中提取版本号并写入缓存。"""
+        name = canonicalize_name(project)
+        versions = {}
+        for item in files:
+            version = self._version_from_filename(item["filename"])
+            if version is None:
+                continue
+            entry = versions.setdefault(str(version), {
+                "requires_python": item.get("requires_python"),
+                "yanked": item.get("yanked", False),
+            })
+            # 只要有一个文件未被撤回，该版本就可用
+            entry["yanked"] = entry["yanked"] and item.get("yanked", False)
+        self.packages[name] = {"fetched_at": time.time(), "versions": versions}
+
+    @staticmethod
+    def _version_from_filename(filename):
+        """从wheel或sdist文件名中解析版本号。"""
+        try:
+            if filename.endswith(".whl"):
+                return parse_wheel_filename(filename)[1]
+            if filename.endswith((".tar.gz", ".zip")):
+                return parse_sdist_filename(filename)[1]
+        except Exception:
+            return None
+        return None
+
+    def candidates(self, name):
+        """返回适用于当前解释器且未被撤回的所有版本。"""
+        python_version = platform.python_version()
+        result = []
+        for version, info in self.packages.get(canonicalize_name(name), {}).get("versions", {}).items():
+            if info.get("yanked"):
+                continue
+            requires_python = info.get("requires_python")
+            if requires_python:
+                try:
+                    if python_version not in SpecifierSet(requires_python):
+                        continue
+                except Exception:
+                    pass
+            try:
+                result.append(Version(version))
+            except InvalidVersion:
+                continue
+        return result
+
+class Wheelhouse:
+    """
+    以(名称, 版本, Python标签, CUDA标签)为键的持久化wheel目录。
+
+    同一Python标签和CUDA标签的wheel放在同一个子目录中，
+    wheelhouse.json记录每个键对应的wheel文件，使已构建的源码包在下一次构建时直接复用。
+    """
+
+    INDEX_NAME = "wheelhouse.json"
+
+    def __init__(self, root, workers=PREFETCH_WORKERS):
+        self.python_tag = f"cp{sys.version_info.major}{sys.version_info.minor}"
+        self.cuda_tag = self._detect_cuda_tag()
+        self.path = os.path.join(root, f"{self.python_tag}-{self.cuda_tag}")
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self.index = self._load_index()
+
+    @staticmethod
+    def _detect_cuda_tag():
+        """根据CUDA_VERSION环境变量或PyTorch下载源推断CUDA标签（例如cu121）。"""
+        cuda_version = os.environ.get("CUDA_VERSION", "")
+        if cuda_version:
+            major_minor = cuda_version.split(".")[:2]
+            return "cu" + "".join(major_minor)
+        tail = TORCH_INDEX_URL.rstrip("/").rsplit("/", 1)[-1]
+        return tail if tail.startswith("cu") else "cpu"
+
+    def _load_index(self):
+        index_path = os.path.join(self.path, self.INDEX_NAME)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        index_path = os.path.join(self.path, self.INDEX_NAME)
+        with open(f"{index_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(f"{index_path}.tmp", index_path)
+
+    @staticmethod
+    def key(name, version=None):
+        """返回缓存键；没有版本的规格（例如固定到提交的git+链接）直接以规格字符串作为键。"""
+        return f"{canonicalize_name(name)}=={version}" if version else name
+
+    def files(self, key):
+        """返回键对应的wheel路径，缺失任意文件时返回None。"""
+        filenames = self.index.get(key)
+        if not filenames:
+            return None
+        paths = [os.path.join(self.path, filename) for filename in filenames]
+        return paths if all(os.path.exists(path) for path in paths) else None
+
+    def offline_args(self):
+        """离线安装时使用的pip参数。"""
+        return ["--no-index", "--find-links", self.path]
+
+    def prefetch(self, jobs):
+        """
+        并发下载或构建缺失的wheel。
+
+        jobs为(key, pip规格, 下载源参数)的列表，返回未能获取的key列表。
+        """
+        missing = [job for job in jobs if self.files(job[0]) is None]
+        LOGGER.info(f"wheel缓存 {self.path}: 命中 {len(jobs) - len(missing)} 个, 需要获取 {len(missing)} 个。")
+        if not missing:
+            return []
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for (key, spec, _), ok in zip(missing, executor.map(lambda job: self._build_one(*job), missing)):
+                if not ok:
+                    failed.append(key)
+        self._save_index()
+        return failed
+
+    def _build_one(self, key, spec, index_args):
+        """使用`pip wheel --no-deps`下载现成的wheel，或从源码构建。"""
+        staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=self.path)
+        command = [sys.executable, "-m", "pip"] + get_selector().rewrite(
+            ["wheel", "--no-deps", "--wheel-dir", staging_dir, spec] + index_args)
+        started = time.time()
+        try:
+            with TRACER.span(f"pip wheel {spec}", "prefetch", spec=spec) as span:
+                result = subprocess.run(command, capture_output=True, text=True)
+                span.set(exit_code=result.returncode, status="ok" if result.returncode == 0 else "failed")
+            if result.returncode != 0:
+                LOGGER.error(f"获取 {spec} 的wheel失败:\n{result.stderr[-2000:]}")
+                return False
+            filenames = []
+            for filename in os.listdir(staging_dir):
+                if filename.endswith(".whl"):
+                    os.replace(os.path.join(staging_dir, filename), os.path.join(self.path, filename))
+                    filenames.append(filename)
+            with self._lock:
+                self.index[key] = sorted(filenames)
+            LOGGER.info(f"✓ {spec} -> {filenames} ({time.time() - started:.1f}秒)")
+            return True
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def complete(self, specs, index_args, constraints_file):
+        """
+        解析specs的完整依赖闭包，把缺失的传递依赖补充到缓存中。
+        已存在的wheel通过--find-links直接复用，返回是否成功。
+        """
+        command = [sys.executable, "-m", "pip"] + get_selector().rewrite(
+            ["wheel", "--wheel-dir", self.path, "--find-links", self.path, "-c", constraints_file] + specs + index_args)
+        with TRACER.span("pip wheel (complete)", "prefetch", packages=len(specs)) as span:
+            result = subprocess.run(command, capture_output=True, text=True)
+            span.set(exit_code=result.returncode, status="ok" if result.returncode == 0 else "failed")
+        if result.returncode != 0:
+            LOGGER.warning(f"补全wheel依赖失败，该层级将在线安装:\n{result.stderr[-2000:]}")
+            return False
+        return True
+
+
+class ConflictAnalyzer:
+    """
+    安装前的依赖冲突分析。
+
+    以 软件包 -> [(节点, 需求)] 的约束图为输入，找出：
+    - 被PINNED_PACKAGES覆盖而破坏的节点约束；
+    - 不同节点之间互相排斥的约束（索引元数据已知时按可用版本判断，否则比较'=='固定版本）。
+    整个分析只在内存中进行，不调用pip。
+    """
+
+    def __init__(self, origins, pinned, index_cache=None):
+        self.origins = origins
+        self.pinned = pinned
+        self.index_cache = index_cache
+
+    def analyze(self):
+        """返回报告字典。"""
+        started = time.time()
+        pinned_overrides = []
+        conflicts = []
+        nodes_affected = defaultdict(set)
+
+        for name, entries in sorted(self.origins.items()):
+            applicable = [(node, req) for node, req in entries if DependencyInstaller._marker_applies(req)]
+            if not applicable:
+                continue
+
+            if name in self.pinned:
+                version = self.pinned[name]
+                broken = [{"node": node, "requirement": str(req)} for node, req in applicable
+                          if req.specifier and not req.specifier.contains(version, prereleases=True)]
+                if broken:
+                    pinned_overrides.append({"package": name, "pinned": version, "broken_nodes": broken})
+                    for item in broken:
+                        nodes_affected[item["node"]].add(name)
+                continue
+
+            if len({node for node, _ in applicable}) < 2:
+                continue
+            pairs = self._conflicting_pairs(applicable)
+            combined = reduce(lambda a, b: a & b, (req.specifier for _, req in applicable), SpecifierSet())
+            unsatisfiable = False
+            if self.index_cache is not None and self.index_cache.knows(name):
+                unsatisfiable = not list(combined.filter(self.index_cache.candidates(name)))
+            if pairs or unsatisfiable:
+                conflicts.append({
+                    "package": name,
+                    "combined": str(combined),
+                    "unsatisfiable": unsatisfiable,
+                    "constraints": [{"node": node, "requirement": str(req)} for node, req in applicable],
+                    "pairs": pairs,
+                })
+                for node, _ in applicable:
+                    nodes_affected[node].add(name)
+
+        return {
+            "generated": time.time(),
+            "seconds": round(time.time() - started, 4),
+            "summary": {
+                "packages": len(self.origins),
+                "nodes": len({node for entries in self.origins.values() for node, _ in entries}),
+                "pinned_overrides": len(pinned_overrides),
+                "conflicts": len(conflicts),
+                "nodes_affected": len(nodes_affected),
+            },
+            "pinned_overrides": pinned_overrides,
+            "conflicts": conflicts,
+            "nodes_affected": {node: sorted(names) for node, names in sorted(nodes_affected.items())},
+        }
+
+    @staticmethod
+    def _conflicting_pairs(applicable):
+        """来自不同节点、且一方的'=='版本不满足另一方约束的需求对。"""
+        pairs = []
+        for node, req in applicable:
+            for spec in req.specifier:
+                if spec.operator != "==" or "*" in spec.version:
+                    continue
+                for other_node, other in applicable:
+                    if other_node == node or not other.specifier:
+                        continue
+                    if not other.specifier.contains(spec.version, prereleases=True):
+                        pairs.append({"pinned_by": node, "version": spec.version,
+                                      "rejected_by": other_node, "requirement": str(other)})
+        return pairs
+
 
 class DependencyInstaller:
     """协调依赖项的获取、解决和安装。"""
@@ -78,18 +513,225 @@ class DependencyInstaller:
     def __init__(self):
         """初始化依赖安装器。"""
         self.requirements = defaultdict(list)
+        # 软件包 -> [(来源节点, 需求)]，用于冲突分析
+        self.requirement_origins = defaultdict(list)
+        # 软件包 -> `name @ url` 形式的直接URL需求（git+链接、-e等），由pip直接从URL安装
+        self.direct_requirements = {}
+        # 需求文件中声明的额外下载源参数，用于长尾层级
+        self.index_options = []
+        self.scanner = RequirementsScanner()
+        self.scan_result = None
         self.resolved_versions = {}
+        self.unsatisfiable = {}
+        self.install_failures = []
+        self.index_cache = IndexMetadataCache()
+        self.wheelhouse = Wheelhouse(WHEELHOUSE_DIR) if WHEELHOUSE_DIR else None
+        self.offline_tiers = set()
+        self.constraints_file = CONSTRAINTS_FILE
 
     def run(self):
+        """执行整个安装流程，并把各阶段的追踪写入构建追踪文件。"""
+        try:
+            with TRACER.span("build_dependencies", "total"):
+                self._run_stages()
+        finally:
+            TRACER.log_summary()
+            TRACER.save()
+
+    def plan_tiers(self, tiers_dir=TIERS_DIR, allow_unsatisfiable=ALLOW_UNSATISFIABLE):
+        """
+        只解析不安装：把解析计划按层级写成独立的锁文件。
+
+        存在无法满足的约束时不写锁文件并返回False，除非allow_unsatisfiable为True。
+        """
+        process = TRACER.process
+        TRACER.process = f"{process}:plan"
+        try:
+            with TRACER.span("plan_tiers", "total"):
+                LOGGER.info(f"正在生成分层锁文件到 {tiers_dir}...")
+                os.makedirs(tiers_dir, exist_ok=True)
+                req_files = self._stage(self._find_requirement_files)
+                fingerprint, input_hashes = self._stage(self._compute_fingerprint, req_files)
+                self._stage(self._gather_requirements, req_files)
+                self._stage(self._load_index_metadata)
+                self._stage(self._detect_conflicts)
+                self._stage(self._resolve_versions)
+                if self.unsatisfiable and not allow_unsatisfiable:
+                    LOGGER.error(f"✗ {len(self.unsatisfiable)} 个软件包的约束无法满足，不生成锁文件"
+                                 f"（详见 {CONFLICT_REPORT_FILE}；使用 --allow-unsatisfiable 或 "
+                                 f"ALLOW_UNSATISFIABLE=true 可忽略）。")
+                    return False
+                self._write_resolved_requirements_file(os.path.join(tiers_dir, "final_requirements.txt"))
+                self._write_plan(fingerprint, input_hashes, os.path.join(tiers_dir, "plan.json"))
+                self._write_tier_files(tiers_dir)
+                return True
+        finally:
+            TRACER.save()
+            TRACER.process = process
+
+    @staticmethod
+    def _tier_file(tiers_dir, tier_name, suffix=".txt"):
+        return os.path.join(tiers_dir, f"{TIER_ORDER.index(tier_name) + 1:02d}-{tier_name}{suffix}")
+
+    def _write_tier_files(self, tiers_dir):
+        """
+        每个层级写入一个锁文件和一个约束文件。约束文件只包含该层级及其之前层级的固定版本，
+        因此一个层级的文件内容只在它自己或更早的层级变化时才会改变。
+        锁文件本身也可以直接用 `pip install -r` 安装。
+        """
+        members_by_tier = dict(self._build_install_tiers(sorted(self.resolved_versions)))
+        cumulative = {}
+        for tier_name in TIER_ORDER[:-1]:
+            members = members_by_tier.get(tier_name, [])
+            for name in members:
+                if self.resolved_versions.get(name):
+                    cumulative[name] = self.resolved_versions[name]
+            constraints_path = self._tier_file(tiers_dir, tier_name, ".constraints.txt")
+            with open(constraints_path, 'w', encoding='utf-8') as f:
+                f.write("# This file is auto-generated by build_dependencies.py\n")
+                f.write(f"# Pins of tier '{tier_name}' and all earlier tiers.\n\n")
+                for name in sorted(cumulative):
+                    f.write(f"{name}=={cumulative[name]}\n")
+            with open(self._tier_file(tiers_dir, tier_name), 'w', encoding='utf-8') as f:
+                f.write("# This file is auto-generated by build_dependencies.py\n")
+                f.write(f"# Tier '{tier_name}': python build_dependencies.py --install-tier {tier_name}\n\n")
+                for arg_name, value in zip(*[iter(self._online_index_args(tier_name))] * 2):
+                    f.write(f"{arg_name} {value}\n")
+                f.write(f"-c {os.path.basename(constraints_path)}\n")
+                for name in members:
+                    f.write(f"{self._package_spec(name)}\n")
+            LOGGER.info(f"层级 '{tier_name}': {len(members)} 个软件包 -> {self._tier_file(tiers_dir, tier_name)}")
+
+        with open(self._tier_file(tiers_dir, "manual"), 'w', encoding='utf-8') as f:
+            f.write("# This file is auto-generated by build_dependencies.py\n")
+            f.write("# Tier 'manual': installed one by one with --no-deps\n\n")
+            # 写入固定后的规格，安装阶段不会再取到比计划时更新的版本
+            for spec in MANUAL_PACKAGES:
+                f.write(f"{self._pin_manual_spec(spec)[0]}\n")
+        LOGGER.info(f"层级 'manual': {len(MANUAL_PACKAGES)} 个软件包 -> {self._tier_file(tiers_dir, 'manual')}")
+
+    @staticmethod
+    def _read_tier_specs(path):
+        """读取锁文件中的软件包行（忽略注释和pip选项）。"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f
+                    if line.strip() and not line.lstrip().startswith(('#', '-'))]
+
+    @staticmethod
+    def _read_tier_index_options(path):
+        """读取锁文件中的下载源选项（约束文件引用除外），返回 [[选项, 值]]。"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.split(None, 1) for line in (raw.strip() for raw in f)
+                    if line.startswith('--') and ' ' in line]
+
+    def install_tier(self, tier_name, tiers_dir=TIERS_DIR):
+        """
+        安装单个层级。最后一个层级（manual）安装完成后，如果所有层级都没有失败，
+        把计划文件写入PLAN_FILE，供运行时的增量构建使用。
+        """
+        process = TRACER.process
+        TRACER.process = f"{process}:{tier_name}"
+        try:
+            with TRACER.span(f"install_tier {tier_name}", "total"):
+                tier_file = self._tier_file(tiers_dir, tier_name)
+                specs = self._read_tier_specs(tier_file)
+                if tier_name == "rest":
+                    self.index_options = self._read_tier_index_options(tier_file)
+                LOGGER.info(f"正在安装层级 '{tier_name}' ({len(specs)} 个软件包)...")
+                if tier_name == TIER_ORDER[0]:
+                    self._stage(self._install_build_tools)
+                if tier_name == "manual":
+                    self._stage(self._install_manual_packages, specs)
+                elif specs:
+                    names = []
+                    for spec in specs:
+                        req = Requirement(spec)
+                        name = req.name.lower()
+                        if req.url:
+                            self.direct_requirements[name] = spec
+                        exact = [s.version for s in req.specifier if s.operator == "=="]
+                        self.resolved_versions[name] = exact[0] if exact else None
+                        names.append(name)
+                    self.constraints_file = self._tier_file(tiers_dir, tier_name, ".constraints.txt")
+                    tiers = [(tier_name, names)]
+                    if INSTALL_MODE == "serial":
+                        self._stage(self._install_serial, tiers)
+                    else:
+                        if self.wheelhouse:
+                            self._stage(self._prefetch_wheels, tiers)
+                        self._stage(self._install_batch, tiers)
+                self._stage(self._slim_environment)
+                status = self._record_tier_status(tiers_dir, tier_name)
+                if tier_name == TIER_ORDER[-1]:
+                    self._finalize_tiers(tiers_dir, status)
+        finally:
+            TRACER.log_summary()
+            TRACER.save()
+            TRACER.process = process
+
+    def _record_tier_status(self, tiers_dir, tier_name):
+        """记录每个层级的安装失败列表，返回全部层级的状态。"""
+        status_path = os.path.join(tiers_dir, TIER_STATUS_FILE)
+        status = {}
+        if os.path.exists(status_path):
+            with open(status_path, 'r', encoding='utf-8') as f:
+                status = json.load(f)
+        status[tier_name] = self.install_failures
+        with open(status_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f, indent=2)
+        return status
+
+    def _finalize_tiers(self, tiers_dir, status):
+        """验证安装结果，所有层级都成功时发布最终清单和依赖计划。"""
+        with open(os.path.join(tiers_dir, "plan.json"), 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+        self.resolved_versions = plan["resolved"]
+        self._stage(self._verify_installation)
+        shutil.copyfile(os.path.join(tiers_dir, "final_requirements.txt"), FINAL_REQUIREMENTS_FILE)
+        missing = [tier for tier in TIER_ORDER if tier not in status]
+        failed = {tier: failures for tier, failures in status.items() if failures}
+        if missing or failed:
+            LOGGER.warning(f"层级未完整安装 (缺少: {missing}, 失败: {failed})，不保存依赖计划，下次构建将重试。")
+            return
+        shutil.copyfile(os.path.join(tiers_dir, "plan.json"), PLAN_FILE)
+        LOGGER.info(f"所有层级安装完成，依赖计划已保存到 {PLAN_FILE}")
+
+    def _stage(self, func, *args):
+        """在一个追踪span中执行一个阶段。"""
+        with TRACER.span(func.__name__.lstrip("_"), "stage"):
+            return func(*args)
+
+    def _run_stages(self):
         """执行整个安装流程。"""
         LOGGER.info("开始统一的依赖安装流程...")
-        self._install_build_tools()
-        self._gather_requirements()
-        self._detect_conflicts()
-        self._resolve_versions()
-        self._write_resolved_requirements_file()
-        self._install_packages()
-        self._verify_installation()
+        req_files = self._stage(self._find_requirement_files)
+        fingerprint, input_hashes = self._stage(self._compute_fingerprint, req_files)
+        previous_plan = None if FORCE_FULL_INSTALL else self._load_previous_plan()
+
+        if previous_plan and previous_plan.get("fingerprint") == fingerprint:
+            LOGGER.info(f"依赖输入未发生变化 (指纹: {fingerprint[:12]})，跳过解析与安装。")
+            return
+
+        self._stage(self._gather_requirements, req_files)
+        self._stage(self._load_index_metadata)
+        # 冲突分析在任何pip调用之前进行，严格模式下发现冲突时立即中止
+        self._stage(self._detect_conflicts)
+        if not previous_plan:
+            # 增量构建时构建工具已在上一次安装
+            self._stage(self._install_build_tools)
+        self._stage(self._resolve_versions)
+        self._stage(self._write_resolved_requirements_file)
+        if previous_plan:
+            self._log_changed_inputs(previous_plan.get("inputs", {}), input_hashes)
+            self._stage(self._install_plan_diff, previous_plan)
+        else:
+            self._stage(self._install_packages)
+        self._stage(self._slim_environment)
+        self._stage(self._verify_installation)
+        if self.install_failures:
+            LOGGER.warning(f"存在 {len(self.install_failures)} 个安装失败的软件包，不保存依赖计划，下次构建将重试。")
+        else:
+            self._write_plan(fingerprint, input_hashes)
         LOGGER.info("统一的依赖安装流程完成。")
 
     def _install_build_tools(self):
@@ -98,74 +740,113 @@ class DependencyInstaller:
         self._run_pip(["install", "--upgrade", "pip"])
         self._run_pip(["install", "setuptools<68", "wheel<0.41"])
 
-    def _gather_requirements(self):
-        """从本地文件系统扫描并收集所有依赖需求。"""
+    def _find_requirement_files(self):
+        """
+        扫描/app和/app/custom_nodes中的依赖声明文件，返回读取过的全部文件
+        （包括通过-r/-c引用的文件），它们都参与输入指纹的计算。
+        """
         custom_nodes_dir = "/app/custom_nodes"
-        LOGGER.info(f"在 /app 和 {custom_nodes_dir} 中扫描 'requirements*.txt' 文件...")
+        LOGGER.info(f"在 /app 和 {custom_nodes_dir} 中扫描依赖声明文件...")
 
         # 首先处理ComfyUI主依赖文件
-        req_files = ["/app/requirements.txt"]
-
-        # 查找custom_nodes中的所有依赖文件
-        pattern = os.path.join(custom_nodes_dir, "**/requirements*.txt")
-        custom_node_reqs = glob.glob(pattern, recursive=True)
-        req_files.extend(custom_node_reqs)
-
-        # 过滤掉不存在的文件路径，以防万一
-        req_files = [f for f in req_files if os.path.exists(f)]
+        sources = self.scanner.find_sources(["/app/requirements.txt"], custom_nodes_dir)
+        self.scan_result = self.scanner.scan(sources)
+        self.scanner.save()
+        LOGGER.info(f"扫描了 {len(self.scan_result.files)} 个文件 (解析 {self.scanner.stats['parsed']} 个, "
+                    f"使用缓存 {self.scanner.stats['cached']} 个)")
+        return self.scan_result.files
 
+    def _gather_requirements(self, req_files):
+        """收集扫描到的依赖需求、约束、直接URL需求和下载源选项。"""
         if not req_files:
             LOGGER.warning("未找到任何 requirements 文件。")
             return
 
         LOGGER.info(f"找到 {len(req_files)} 个需求文件: {req_files}")
+        scan = self.scan_result
 
-        for file_path in req_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    LOGGER.info(f"正在处理: {file_path}")
-                    for line in content.splitlines():
-                        req_str = line.strip()
-                        if not req_str or req_str.startswith('#') or req_str.startswith('-'):
-                            continue
-                        try:
-                            req = Requirement(req_str)
-                            self.requirements[req.name.lower()].append(req)
-                        except Exception as e:
-                            LOGGER.warning(f"无法解析 '{file_path}' 中的依赖: '{req_str}'. 错误: {e}")
-            except Exception as e:
-                LOGGER.error(f"读取文件失败: {file_path}. 错误: {e}")
+        for file_path, req in scan.requirements:
+            name = req.name.lower()
+            self.requirements[name].append(req)
+            self.requirement_origins[name].append((self._node_name(file_path), req))
+            if req.url:
+                previous = self.direct_requirements.get(name)
+                if previous and previous != str(req):
+                    LOGGER.warning(f"'{name}' 存在多个直接URL需求，使用 {req} (来自 {file_path})，忽略 {previous}")
+                self.direct_requirements[name] = str(req)
+
+        # -c 约束只限制已经被需要的软件包，不会引入新的软件包
+        for file_path, req in scan.constraints:
+            name = req.name.lower()
+            if name in self.requirements and not req.url:
+                self.requirements[name].append(req)
+                self.requirement_origins[name].append((self._node_name(file_path), req))
+
+        for option, value, file_path in scan.index_options:
+            if "download.pytorch.org" in value:
+                # torch层级使用TORCH_INDEX_URL，其他PyTorch下载源可能带来不匹配的CUDA版本
+                LOGGER.info(f"忽略 {file_path} 中的PyTorch下载源: {value}")
+                continue
+            # 节点的 --index-url 只作为额外的下载源，不替换默认源
+            option = "--extra-index-url" if option == "--index-url" else option
+            if [option, value] not in self.index_options:
+                self.index_options.append([option, value])
+                LOGGER.info(f"使用 {file_path} 中声明的下载源选项: {option} {value}")
+
+        for file_path, value, error in scan.errors:
+            LOGGER.warning(f"无法解析 '{file_path}' 中的依赖: '{value}'. 错误: {error}")
 
         LOGGER.info(f"共收集到 {len(self.requirements)} 个唯一的软件包。")
 
+    @staticmethod
+    def _node_name(file_path):
+        """需求文件所属的自定义节点名称，ComfyUI主依赖记为'ComfyUI'。"""
+        rel = os.path.relpath(file_path, "/app/custom_nodes")
+        if rel.startswith(".."):
+            return "ComfyUI"
+        return rel.split(os.sep)[0]
+
     def _detect_conflicts(self):
-        """预检测版本冲突并报告潜在问题。"""
+        """
+        在安装之前构建软件包到节点的约束图并分析冲突，
+        写入JSON报告并输出简短摘要。严格模式下发现冲突时中止构建。
+        """
         LOGGER.info("正在预检测版本冲突...")
-        conflicts_found = 0
-        
-        for name, reqs in self.requirements.items():
-            if len(reqs) <= 1:
-                continue
-                
-            # 收集所有版本约束
-            constraints = []
-            for req in reqs:
-                for spec in req.specifier:
-                    constraints.append(f"{spec.operator}{spec.version}")
-            
-            if len(set(constraints)) > 1:
-                LOGGER.warning(f"发现 '{name}' 的版本冲突: {set(constraints)}")
-                conflicts_found += 1
-        
-        if conflicts_found > 0:
-            LOGGER.warning(f"总共发现 {conflicts_found} 个包存在版本冲突，将尝试智能解决。")
+        pinned = {name.lower(): version for name, version in PINNED_PACKAGES.items()}
+        # 所有opencv-*变体在解析阶段都会被统一为opencv-contrib-python-headless，分析时同样合并
+        origins = defaultdict(list)
+        for name, entries in self.requirement_origins.items():
+            origins["opencv-contrib-python-headless" if name.startswith("opencv-") else name].extend(entries)
+        report = ConflictAnalyzer(origins, pinned, self.index_cache).analyze()
+
+        try:
+            with open(CONFLICT_REPORT_FILE, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            LOGGER.warning(f"无法写入冲突报告 {CONFLICT_REPORT_FILE}: {e}")
+
+        for item in report["pinned_overrides"]:
+            nodes = ", ".join(f"{b['node']} ({b['requirement']})" for b in item["broken_nodes"])
+            LOGGER.warning(f"固定版本 {item['package']}=={item['pinned']} 破坏了以下节点的约束: {nodes}")
+        for item in report["conflicts"]:
+            kind = "无法同时满足" if item["unsatisfiable"] else "存在互斥的固定版本"
+            nodes = ", ".join(f"{c['node']} ({c['requirement']})" for c in item["constraints"])
+            LOGGER.warning(f"'{item['package']}' 的约束{kind}: {nodes}")
+
+        summary = report["summary"]
+        if summary["pinned_overrides"] or summary["conflicts"]:
+            LOGGER.warning(
+                f"冲突分析: {summary['pinned_overrides']} 个固定版本覆盖、{summary['conflicts']} 个包存在冲突，"
+                f"涉及 {summary['nodes_affected']} 个节点 ({report['seconds']:.3f}秒)，详见 {CONFLICT_REPORT_FILE}"
+            )
+            if STRICT_DEPENDENCIES:
+                LOGGER.error("严格模式 (STRICT_DEPENDENCIES=true): 存在依赖冲突，在安装前中止构建。")
+                sys.exit(1)
         else:
-            LOGGER.info("未发现明显的版本冲突。")
+            LOGGER.info(f"未发现版本冲突 ({report['seconds']:.3f}秒)。")
 
-    def _write_resolved_requirements_file(self):
+    def _write_resolved_requirements_file(self, output_path=FINAL_REQUIREMENTS_FILE):
         """将解析后的依赖项写入一个最终的requirements.txt文件以供记录。"""
-        output_path = "/app/final_requirements.txt"
         LOGGER.info(f"正在将最终的依赖计划写入: {output_path}")
 
         try:
@@ -176,12 +857,8 @@ class DependencyInstaller:
                 f.write("# This file is auto-generated by build_dependencies.py\n")
                 f.write("# It contains the final, resolved versions of all dependencies for this build.\n\n")
                 for name in sorted_packages:
-                    version = self.resolved_versions[name]
-                    if version:
-                        f.write(f"{name}=={version}\n")
-                    else:
-                        # 如果没有指定版本，则只写入包名
-                        f.write(f"{name}\n")
+                    # 没有指定版本时只写入包名，直接URL需求写入 `name @ url`
+                    f.write(f"{self._package_spec(name)}\n")
             
             LOGGER.info(f"最终的依赖计划已成功写入 {output_path}")
         except Exception as e:
@@ -206,82 +883,448 @@ class DependencyInstaller:
             LOGGER.info("已将所有OpenCV变体替换为 'opencv-contrib-python-headless'。")
 
 
-        # 将固定版本的包注入到需求列表中
-        for name, version in PINNED_PACKAGES.items():
-            self.requirements[name.lower()].append(Requirement(f"{name}=={version}"))
-            
+        pinned = {name.lower(): version for name, version in PINNED_PACKAGES.items()}
+        for name in pinned:
+            self.requirements.setdefault(name, [])
+
         for name, reqs in self.requirements.items():
-            pinned_versions = set()
-            for req in reqs:
-                # 寻找'=='指定的版本，因为它们是不可协商的
-                for spec in req.specifier:
-                    if spec.operator == '==':
-                        pinned_versions.add(spec.version)
-            
-            if len(pinned_versions) > 1:
-                # 硬性冲突：请求了多个不同的'=='版本。
-                # 策略：选择最高的版本并警告用户。
-                highest_version = sorted(list(pinned_versions), key=parse_version, reverse=True)[0]
-                LOGGER.warning(
-                    f"'{name}'存在冲突: 请求了多个固定版本 {pinned_versions}。 "
-                    f"已解决为最高版本: {highest_version}。"
-                )
-                self.resolved_versions[name] = highest_version
-            elif len(pinned_versions) == 1:
-                # 简单情况：只固定了一个版本。
-                self.resolved_versions[name] = pinned_versions.pop()
+            applicable = [req for req in reqs if self._marker_applies(req)]
+            if reqs and not applicable and name not in pinned:
+                LOGGER.info(f"'{name}' 的环境标记不适用于当前环境，已跳过。")
+                continue
+
+            if name in pinned:
+                # 固定版本不可协商，与之不兼容的约束已由冲突分析报告
+                self.resolved_versions[name] = pinned[name]
+                continue
+
+            if name in self.direct_requirements:
+                # 直接URL需求由pip从URL安装，不参与版本选择
+                self.resolved_versions[name] = None
+                continue
+
+            combined = reduce(lambda a, b: a & b, (req.specifier for req in applicable), SpecifierSet())
+
+            if not self.index_cache.knows(name):
+                # 缓存中没有该软件包的信息，回退到只看'=='的旧策略
+                self.resolved_versions[name] = self._highest_exact_pin(name, applicable)
+                continue
+
+            matching = list(combined.filter(self.index_cache.candidates(name)))
+            if matching:
+                self.resolved_versions[name] = str(max(matching))
             else:
-                # 未找到固定版本。让pip自行决定版本。
-                # 将来可以在这里添加更复杂的逻辑（例如，尊重'>='）。
+                self.unsatisfiable[name] = sorted({str(req) for req in applicable})
+                LOGGER.error(f"'{name}' 的约束无法同时满足: {self.unsatisfiable[name]} (合并后: '{combined}')")
+                # 任何固定版本都会违反其中一部分约束，不写入已知无效的版本
                 self.resolved_versions[name] = None
-        
+
+        if self.unsatisfiable:
+            LOGGER.error(f"共有 {len(self.unsatisfiable)} 个软件包的约束无法满足: {sorted(self.unsatisfiable)}")
+        unresolved = sorted(name for name, version in self.resolved_versions.items()
+                            if not version and name not in self.unsatisfiable)
+        if unresolved:
+            LOGGER.warning(f"以下 {len(unresolved)} 个软件包没有可用的版本信息，将由pip决定版本: {unresolved}")
+
         LOGGER.info(f"已为 {len(self.resolved_versions)} 个软件包解决版本。")
 
-    def _install_packages(self):
-        """使用解析后的版本安装所有软件包。"""
-        LOGGER.info(f"正在安装所有 {len(self.resolved_versions)} 个解析后的软件包...")
-        
-        # 按依赖层次排序：基础包 -> 科学计算包 -> 深度学习包 -> 其他包
-        base_packages = ["numpy", "scipy", "pillow"]
-        torch_packages = ["torch", "torchvision", "torchaudio", "xformers"]
-        priority_packages = ["timm", "opencv-contrib-python-headless"]
-        
-        # 构建安装顺序：基础包 -> torch包 -> 优先包 -> 其余包
-        sorted_packages = []
-        for pkg_list in [base_packages, torch_packages, priority_packages]:
-            for pkg in pkg_list:
-                if pkg in self.resolved_versions:
-                    sorted_packages.append(pkg)
-        
+    def _load_index_metadata(self):
+        """加载索引元数据缓存，并补全缺失的软件包。"""
+        self.index_cache.load()
+        if LOCAL_INDEX_DIR:
+            self.index_cache.load_local_index(LOCAL_INDEX_DIR)
+        if not INDEX_OFFLINE:
+            manual_names = [self._manual_name(spec) for spec in MANUAL_PACKAGES]
+            self.index_cache.fetch_missing(list(self.requirements.keys()) + [name for name in manual_names if name])
+        self.index_cache.save()
+
+    @staticmethod
+    def _marker_applies(req):
+        """判断需求的环境标记是否适用于当前环境。"""
+        if req.marker is None:
+            return True
+        try:
+            return req.marker.evaluate({"extra": ""})
+        except Exception:
+            return True
+
+    @staticmethod
+    def _highest_exact_pin(name, reqs):
+        """旧策略：在所有'=='约束中选择最高的版本，没有则返回None。"""
+        pinned_versions = set()
+        for req in reqs:
+            for spec in req.specifier:
+                if spec.operator == '==':
+                    pinned_versions.add(spec.version)
+
+        if len(pinned_versions) > 1:
+            # 硬性冲突：请求了多个不同的'=='版本。
+            # 策略：选择最高的版本并警告用户。
+            highest_version = sorted(list(pinned_versions), key=parse_version, reverse=True)[0]
+            LOGGER.warning(
+                f"'{name}'存在冲突: 请求了多个固定版本 {pinned_versions}。 "
+                f"已解决为最高版本: {highest_version}。"
+            )
+            return highest_version
+        if len(pinned_versions) == 1:
+            return pinned_versions.pop()
+        return None
+
+    def _install_packages(self, names=None, manual_packages=None):
+        """
+        使用解析后的版本安装软件包。
+
+        names为None时安装全部解析结果，否则只安装给定的软件包；
+        manual_packages为None时安装全部MANUAL_PACKAGES。
+        """
+        names = sorted(self.resolved_versions) if names is None else sorted(names)
+        LOGGER.info(f"正在安装 {len(names)} 个解析后的软件包 (模式: {INSTALL_MODE})...")
+
+        tiers = self._build_install_tiers(names)
+        if INSTALL_MODE == "serial":
+            self._install_serial(tiers)
+        else:
+            self._write_constraints_file()
+            if self.wheelhouse:
+                self._prefetch_wheels(tiers)
+            self._install_batch(tiers)
+
+        self._install_manual_packages(MANUAL_PACKAGES if manual_packages is None else manual_packages)
+
+    def _build_install_tiers(self, names):
+        """按依赖层次将软件包分组：基础包 -> torch包 -> 优先包 -> 其余包。"""
+        tiers = []
+        assigned = set()
+        for tier_name, pkg_list in [("base", BASE_PACKAGES),
+                                    ("torch", TORCH_PACKAGES),
+                                    ("priority", PRIORITY_PACKAGES)]:
+            members = [pkg for pkg in pkg_list if pkg in names]
+            assigned.update(members)
+            tiers.append((tier_name, members))
+
         # 添加剩余的包
-        remaining = [pkg for pkg in sorted(self.resolved_versions.keys()) 
-                    if pkg not in sorted_packages]
-        sorted_packages.extend(remaining)
+        remaining = [pkg for pkg in names if pkg not in assigned]
+        tiers.append(("rest", remaining))
+        return [(tier_name, members) for tier_name, members in tiers if members]
 
-        for name in sorted_packages:
-            version = self.resolved_versions[name]
-            install_args = []
+    def _package_spec(self, name):
+        """构建软件包字符串（例如，'numpy==1.26.4'、'requests'或'name @ git+https://...'）。"""
+        if name in self.direct_requirements and name not in PINNED_PACKAGES:
+            return self.direct_requirements[name]
+        version = self.resolved_versions.get(name)
+        return f"{name}=={version}" if version else name
 
-            # 构建软件包字符串（例如，'numpy==1.26.4'或'requests'）
-            package_spec = f"{name}=={version}" if version else name
-            
-            # 对torch的下载源进行特殊处理
-            if name.lower() in ["torch", "torchvision", "torchaudio"]:
-                install_args.extend(["--index-url", TORCH_INDEX_URL, "--extra-index-url", "https://pypi.org/simple"])
-            
+    def _tier_index_args(self, tier_name):
+        """返回某个层级使用的下载源参数；已完整预取的层级从wheel缓存离线安装。"""
+        if tier_name in self.offline_tiers:
+            return self.wheelhouse.offline_args()
+        return self._online_index_args(tier_name)
+
+    def _online_index_args(self, tier_name):
+        """返回某个层级专用的在线下载源参数。"""
+        # 对torch的下载源进行特殊处理
+        if tier_name == "torch":
+            return ["--index-url", TORCH_INDEX_URL, "--extra-index-url", PYPI_INDEX_URL]
+        if tier_name == "rest":
+            # 自定义节点需求文件中声明的额外下载源只用于长尾依赖
+            return [arg for option in self.index_options for arg in option]
+        return []
+
+    def _prefetch_wheels(self, tiers):
+        """预取阶段：并发下载/构建所有层级的wheel，再补全各层级的传递依赖。"""
+        LOGGER.info(f"正在使用 {self.wheelhouse.workers} 个并发进程预取wheel...")
+        jobs = []
+        for tier_name, members in tiers:
+            index_args = self._online_index_args(tier_name)
+            for name in members:
+                version = self.resolved_versions.get(name)
+                if version:
+                    jobs.append((Wheelhouse.key(name, version), self._package_spec(name), index_args))
+        failed = self.wheelhouse.prefetch(jobs)
+        if failed:
+            LOGGER.warning(f"以下 {len(failed)} 个wheel预取失败，将在安装阶段重试: {failed}")
+
+        for tier_name, members in tiers:
+            specs = [self._package_spec(name) for name in members]
+            if self.wheelhouse.complete(specs, self._online_index_args(tier_name), self.constraints_file):
+                self.offline_tiers.add(tier_name)
+        LOGGER.info(f"可离线安装的层级: {sorted(self.offline_tiers)}")
+
+    def _write_constraints_file(self):
+        """将解析计划和PINNED_PACKAGES写入pip约束文件。"""
+        constraints = {name: version for name, version in self.resolved_versions.items() if version}
+        # PINNED_PACKAGES始终优先
+        for name, version in PINNED_PACKAGES.items():
+            constraints[name.lower()] = version
+
+        with open(CONSTRAINTS_FILE, 'w', encoding='utf-8') as f:
+            f.write("# This file is auto-generated by build_dependencies.py\n")
+            f.write("# Constraints applied to every batched pip resolver pass.\n\n")
+            for name in sorted(constraints):
+                f.write(f"{name}=={constraints[name]}\n")
+        LOGGER.info(f"已写入 {len(constraints)} 条约束到 {CONSTRAINTS_FILE}")
+
+    def _install_serial(self, tiers):
+        """旧模式：每个软件包单独运行一次pip。"""
+        for tier_name, members in tiers:
+            for name in members:
+                package_spec = self._package_spec(name)
+                install_args = []
+                if name.lower() in ["torch", "torchvision", "torchaudio"]:
+                    install_args = self._tier_index_args("torch")
+                try:
+                    self._run_pip(["install", package_spec] + install_args)
+                except subprocess.CalledProcessError:
+                    self.install_failures.append(package_spec)
+                    LOGGER.error(f"安装 {package_spec} 失败。构建可能会失败。")
+
+    def _install_batch(self, tiers):
+        """每个层级运行一次受约束的pip解析；失败时二分定位出问题的软件包。"""
+        failed = []
+        for tier_name, members in tiers:
+            specs = [self._package_spec(name) for name in members]
+            LOGGER.info(f"正在批量安装层级 '{tier_name}' ({len(specs)} 个软件包)...")
+            failed.extend(self._bisect_install(specs, self._tier_index_args(tier_name)))
+
+        self.install_failures.extend(failed)
+        if failed:
+            LOGGER.error(f"以下 {len(failed)} 个软件包安装失败，构建可能会失败: {failed}")
+        else:
+            LOGGER.info("所有层级均已批量安装成功。")
+
+    def _bisect_install(self, specs, index_args, first_pass=True):
+        """
+        尝试在一次pip调用中安装specs；若失败则对半拆分递归重试，
+        返回最终无法安装的软件包列表。
+
+        只有首次调用会使用完整的网络重试，拆分后的子集只尝试一次，
+        以免确定性的解析失败被重复执行。
+        """
+        command = ["install", "-c", self.constraints_file] + specs + index_args
+        try:
+            if first_pass:
+                self._run_pip(command)
+            else:
+                self._run_pip(command, retries=1)
+            return []
+        except subprocess.CalledProcessError:
+            if len(specs) == 1:
+                LOGGER.error(f"已定位到安装失败的软件包: {specs[0]}")
+                return specs
+
+        mid = len(specs) // 2
+        LOGGER.warning(f"批量安装 {len(specs)} 个软件包失败，正在二分定位 ({mid} + {len(specs) - mid})...")
+        return (self._bisect_install(specs[:mid], index_args, first_pass=False) +
+                self._bisect_install(specs[mid:], index_args, first_pass=False))
+
+    @staticmethod
+    def _manual_name(spec):
+        """返回手动软件包规格中的包名，git+链接等无法解析的规格返回None。"""
+        try:
+            return canonicalize_name(Requirement(spec).name)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _resolve_vcs_commit(spec):
+        """把git+链接固定到具体提交（`git ls-remote`），失败时返回None。"""
+        url, _, fragment = spec[len("git+"):].partition("#")
+        head, _, tail = url.rpartition("/")
+        tail, _, ref = tail.partition("@")
+        repo = f"{head}/{tail}"
+        if re.fullmatch(r"[0-9a-f]{40}", ref):
+            commit = ref
+        else:
             try:
-                self._run_pip(["install", package_spec] + install_args)
-            except subprocess.CalledProcessError:
-                LOGGER.error(f"安装 {package_spec} 失败。构建可能会失败。")
+                result = subprocess.run(["git", "ls-remote", repo] + ([ref, f"{ref}^{{}}"] if ref else ["HEAD"]),
+                                        capture_output=True, text=True, timeout=60)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                LOGGER.warning(f"无法解析 {spec} 的提交: {e}")
+                return None
+            lines = [line.split() for line in result.stdout.splitlines() if line.strip()]
+            if result.returncode != 0 or not lines:
+                LOGGER.warning(f"无法解析 {spec} 的提交: {result.stderr.strip()[-500:]}")
+                return None
+            # 附注标签优先使用解引用后（^{}）的提交
+            commit = next((sha for sha, name in lines if name.endswith("^{}")), lines[0][0])
+        return f"git+{repo}@{commit}" + (f"#{fragment}" if fragment else "")
+
+    def _pin_manual_spec(self, spec):
+        """
+        把手动软件包规格固定到确定的版本或提交，返回(规格, wheel缓存键)。
+
+        已固定的软件包使用固定版本，其他软件包使用索引中满足约束的最高版本，
+        git+链接使用远程仓库当前的提交；无法确定时缓存键为None，此时不使用wheel缓存。
+        """
+        if spec.startswith("git+"):
+            pinned_spec = self._resolve_vcs_commit(spec)
+            return (pinned_spec, Wheelhouse.key(pinned_spec)) if pinned_spec else (spec, None)
+        try:
+            req = Requirement(spec)
+        except Exception:
+            return spec, None
+        if req.url:
+            return spec, None
+        name = canonicalize_name(req.name)
+        exact = [s.version for s in req.specifier if s.operator == "=="]
+        if exact:
+            return spec, Wheelhouse.key(name, exact[0])
+        pinned = {canonicalize_name(pkg): version for pkg, version in PINNED_PACKAGES.items()}
+        version = pinned.get(name) or self.resolved_versions.get(name) or self.resolved_versions.get(req.name)
+        if not version and self.index_cache.knows(name):
+            matching = list(req.specifier.filter(self.index_cache.candidates(name)))
+            version = str(max(matching)) if matching else None
+        if not version:
+            return spec, None
+        extras = f"[{','.join(sorted(req.extras))}]" if req.extras else ""
+        marker = f"; {req.marker}" if req.marker else ""
+        return f"{req.name}{extras}=={version}{marker}", Wheelhouse.key(name, version)
+
+    def _install_manual_packages(self, manual_packages):
+        """逐个安装手动指定的软件包。"""
+        LOGGER.info(f"正在安装 {len(manual_packages)} 个手动指定的软件包...")
+        pinned_specs = [self._pin_manual_spec(spec) for spec in manual_packages]
+        if self.wheelhouse:
+            # 源码构建的软件包（例如sageattention、git+链接）只在缓存缺失时构建一次；
+            # 缓存键包含解析出的版本或提交，上游发布新版本后会重新获取
+            self.wheelhouse.prefetch([(key, spec, []) for spec, key in pinned_specs if key])
 
-        LOGGER.info(f"正在安装 {len(MANUAL_PACKAGES)} 个手动指定的软件包...")
-        for package_spec in MANUAL_PACKAGES:
+        for original_spec, (package_spec, key) in zip(manual_packages, pinned_specs):
+            if package_spec != original_spec:
+                LOGGER.info(f"手动软件包 {original_spec} -> {package_spec}")
+            install_args = [package_spec]
+            wheel_files = self.wheelhouse.files(key) if self.wheelhouse and key else None
+            if wheel_files:
+                install_args = wheel_files + self.wheelhouse.offline_args()
             try:
                 # 使用--no-deps防止意外升级已固定版本的依赖包
-                self._run_pip(["install", "--no-deps", package_spec])
+                self._run_pip(["install", "--no-deps"] + install_args)
             except subprocess.CalledProcessError:
+                self.install_failures.append(original_spec)
                 LOGGER.error(f"安装手动指定的软件包 {package_spec} 失败。")
 
+    def _compute_fingerprint(self, req_files):
+        """根据所有构建输入计算指纹，返回(指纹, 各需求文件的哈希)。"""
+        input_hashes = {}
+        for file_path in req_files:
+            try:
+                with open(file_path, 'rb') as f:
+                    input_hashes[file_path] = hashlib.sha256(f.read()).hexdigest()
+            except OSError as e:
+                LOGGER.warning(f"无法读取需求文件以计算指纹: {file_path}. 错误: {e}")
+
+        payload = json.dumps({
+            "requirements": input_hashes,
+            "pinned": PINNED_PACKAGES,
+            "manual": MANUAL_PACKAGES,
+            "python": sys.version,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest(), input_hashes
+
+    def _load_previous_plan(self):
+        """读取上一次构建保存的计划，不存在或损坏时返回None。"""
+        if not os.path.exists(PLAN_FILE):
+            return None
+        try:
+            with open(PLAN_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            LOGGER.warning(f"读取上一次的依赖计划失败，将执行完整安装: {PLAN_FILE}. 错误: {e}")
+            return None
+
+    def _write_plan(self, fingerprint, input_hashes, plan_path=PLAN_FILE):
+        """保存本次的输入指纹与解析计划，供下一次增量构建使用。"""
+        plan = {
+            "fingerprint": fingerprint,
+            "inputs": input_hashes,
+            "resolved": self.resolved_versions,
+            "direct": self.direct_requirements,
+            "manual": MANUAL_PACKAGES,
+        }
+        try:
+            with open(plan_path, 'w', encoding='utf-8') as f:
+                json.dump(plan, f, indent=2, sort_keys=True)
+            LOGGER.info(f"依赖计划已保存到 {plan_path}")
+        except OSError as e:
+            LOGGER.error(f"保存依赖计划失败: {plan_path}. 错误: {e}")
+
+    def _log_changed_inputs(self, previous_inputs, input_hashes):
+        """记录自上次构建以来变化的需求文件。"""
+        for file_path in sorted(set(previous_inputs) | set(input_hashes)):
+            if file_path not in previous_inputs:
+                LOGGER.info(f"新增需求文件: {file_path}")
+            elif file_path not in input_hashes:
+                LOGGER.info(f"已删除需求文件: {file_path}")
+            elif previous_inputs[file_path] != input_hashes[file_path]:
+                LOGGER.info(f"已修改需求文件: {file_path}")
+
+    def _install_plan_diff(self, previous_plan):
+        """与上一次的计划比较，只安装、升级或移除发生变化的软件包。"""
+        previous = previous_plan.get("resolved", {})
+        added = [name for name in self.resolved_versions if name not in previous]
+        previous_direct = previous_plan.get("direct", {})
+        changed = [name for name in self.resolved_versions
+                   if name in previous and (previous[name] != self.resolved_versions[name]
+                                            or previous_direct.get(name) != self.direct_requirements.get(name))]
+        removed = [name for name in previous if name not in self.resolved_versions]
+        previous_manual = previous_plan.get("manual", [])
+        new_manual = [spec for spec in MANUAL_PACKAGES if spec not in previous_manual]
+
+        LOGGER.info(
+            f"增量安装: 新增 {len(added)} 个, 变更 {len(changed)} 个, "
+            f"移除 {len(removed)} 个, 新的手动软件包 {len(new_manual)} 个。"
+        )
+        for name in changed:
+            LOGGER.info(f"  {name}: {previous_direct.get(name) or previous[name]} -> "
+                        f"{self.direct_requirements.get(name) or self.resolved_versions[name]}")
+
+        if added or changed:
+            self._install_packages(added + changed, manual_packages=new_manual)
+        elif new_manual:
+            self._install_manual_packages(new_manual)
+        self._remove_packages(removed)
+
+    def _remove_packages(self, names):
+        """卸载不再需要的软件包，仍被其他已安装软件包依赖的除外。"""
+        if not names:
+            return
+        still_required = self._installed_dependency_names()
+        to_remove = [name for name in names if canonicalize_name(name) not in still_required]
+        kept = sorted(set(names) - set(to_remove))
+        if kept:
+            LOGGER.info(f"以下软件包不再被直接需要，但仍被其他软件包依赖，保留: {kept}")
+        if not to_remove:
+            return
+        try:
+            self._run_pip(["uninstall", "-y"] + to_remove)
+        except subprocess.CalledProcessError:
+            LOGGER.error(f"卸载软件包失败: {to_remove}")
+
+    @staticmethod
+    def _installed_dependency_names():
+        """返回当前环境中被任意已安装软件包依赖的软件包名集合。"""
+        from importlib import metadata as importlib_metadata
+
+        required = set()
+        for dist in importlib_metadata.distributions():
+            for req_str in dist.requires or []:
+                try:
+                    req = Requirement(req_str)
+                except Exception:
+                    continue
+                if DependencyInstaller._marker_applies(req):
+                    required.add(canonicalize_name(req.name))
+        return required
+
+    def _slim_environment(self):
+        """统计虚拟环境的空间占用，并在启用时按策略删除可安全删除的内容。"""
+        if not SLIM_ENVIRONMENT:
+            return
+        try:
+            slim(scope="venv", apply=True)
+        except Exception as e:
+            LOGGER.warning(f"精简虚拟环境时出现错误: {e}")
+
     def _verify_installation(self):
         """验证已安装包的兼容性。"""
         LOGGER.info("正在验证安装结果...")
@@ -303,25 +1346,73 @@ class DependencyInstaller:
 
 
     def _run_pip(self, args, retries=3, backoff_factor=2):
-        """使用通用选项、重试和错误处理来运行pip命令。"""
-        command = [sys.executable, "-m", "pip", "--no-cache-dir"] + args
-        LOGGER.info(f"执行: {' '.join(command)}")
-        
+        """
+        使用通用选项、重试和错误处理来运行pip命令。每次尝试和退避等待都记录为追踪span。
+        下载源由pip_mirrors替换为最快的健康镜像，失败后下一次尝试换用下一个镜像；
+        只有stderr中出现网络类错误时才把失败记到镜像上。
+        """
+        mirrors = get_selector()
+        span_name = f"pip {' '.join(arg for arg in args if not arg.startswith('-'))}"[:120]
+
+        tried = set()
         for attempt in range(retries):
+            attempt_args = mirrors.rewrite(args, tried)
+            tried.update(mirrors.mirrors_in(attempt_args))
+            command = [sys.executable, "-m", "pip", "--no-cache-dir"] + attempt_args
+            LOGGER.info(f"执行: {' '.join(command)}")
             try:
-                subprocess.run(command, check=True, stdout=sys.stdout, stderr=sys.stderr)
+                with TRACER.span(span_name, "pip", command=' '.join(command)[:2000], attempt=attempt + 1) as span:
+                    # stderr照常实时输出，同时保留末尾部分用于判断失败原因
+                    process = subprocess.Popen(command, stdout=sys.stdout, stderr=subprocess.PIPE,
+                                               text=True, errors="replace")
+                    stderr_tail = deque(maxlen=200)
+                    for line in process.stderr:
+                        sys.stderr.write(line)
+                        stderr_tail.append(line)
+                    returncode = process.wait()
+                    if returncode != 0:
+                        span.set(exit_code=returncode, status="failed")
+                        raise subprocess.CalledProcessError(returncode, command, stderr="".join(stderr_tail))
+                    span.set(exit_code=0)
+                mirrors.report(attempt_args, ok=True)
                 return  # 成功，退出函数
             except subprocess.CalledProcessError as e:
+                if is_network_error(e.stderr):
+                    mirrors.report(attempt_args, ok=False)
                 if attempt + 1 == retries:
                     LOGGER.error(f"命令在 {retries} 次尝试后最终失败。")
                     raise e
-                
+
+                if mirrors.rewrite(args, tried) != attempt_args:
+                    # 换用其他镜像重试，无需等待
+                    LOGGER.warning(f"命令失败 (尝试 {attempt + 1}/{retries})。将换用下一个镜像重试...")
+                    continue
                 sleep_time = backoff_factor * (2 ** attempt)
                 LOGGER.warning(
                     f"命令失败 (尝试 {attempt + 1}/{retries})。将在 {sleep_time} 秒后重试..."
                 )
-                time.sleep(sleep_time)
+                with TRACER.span("backoff", "backoff", seconds=sleep_time, attempt=attempt + 1):
+                    time.sleep(sleep_time)
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="解析并安装ComfyUI及所有自定义节点的Python依赖")
+    parser.add_argument("--plan-tiers", action="store_true", help="只解析依赖并写出分层锁文件，不安装")
+    parser.add_argument("--install-tier", choices=TIER_ORDER, help="只安装一个层级的锁文件")
+    parser.add_argument("--tiers-dir", default=TIERS_DIR, help="分层锁文件目录")
+    parser.add_argument("--allow-unsatisfiable", action="store_true", default=ALLOW_UNSATISFIABLE,
+                        help="--plan-tiers 遇到无法满足的约束时只报告，不以非零状态退出")
+    args = parser.parse_args(argv)
 
-if __name__ == "__main__":
     installer = DependencyInstaller()
-    installer.run() 
\ No newline at end of file
+    if args.plan_tiers:
+        return 0 if installer.plan_tiers(args.tiers_dir, args.allow_unsatisfiable) else 1
+    elif args.install_tier:
+        installer.install_tier(args.install_tier, args.tiers_dir)
+    else:
+        installer.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main()) 
\ No newline at end of file
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+构建阶段追踪。
+
+为依赖安装的每个阶段、每次pip调用、每次重试与退避等待，以及节点安装中的每次克隆记录span：
+墙钟时间、下载字节数（/proc/net/dev 中接收字节数的差值）和退出状态。
+结果写入 Chrome trace / Perfetto 可以直接打开的JSON文件（默认 /app/build_trace.json），
+每次运行（例如每个 --install-tier 的Docker RUN步骤）在文件中是一个独立的进程：
+进程ID按文件中已有的最大ID递增分配（容器中不同RUN步骤的PID会重复，不能直接使用），
+进程名标明脚本和层级，之前各次运行的事件全部保留。
+
+用法：
+    python build_trace.py summary /app/build_trace.json
+    python build_trace.py compare old_trace.json new_trace.json --threshold 10 --fail-on-regression
+
+注意：下载字节数是整个系统的网络接收量，并发执行的span（例如并行克隆）之间会互相重叠。
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+# 设置为空字符串时禁用追踪
+TRACE_FILE = os.environ.get("BUILD_TRACE_FILE", "/app/build_trace.json")
+
+
+def net_rx_bytes():
+    """所有非回环网卡累计接收的字节数，无法读取时返回None。"""
+    try:
+        with open("/proc/net/dev", 'r', encoding='utf-8') as f:
+            lines = f.readlines()[2:]
+    except OSError:
+        return None
+    total = 0
+    for line in lines:
+        interface, _, data = line.partition(":")
+        if interface.strip() == "lo":
+            continue
+        fields = data.split()
+        if fields:
+            total += int(fields[0])
+    return total
+
+
+class Span:
+    """一个正在进行的span，可以在结束前补充参数。"""
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = dict(args)
+
+    def set(self, **kwargs):
+        self.args.update(kwargs)
+
+
+class Tracer:
+    """收集span并写入Chrome trace格式的JSON文件。"""
+
+    def __init__(self, process, path=TRACE_FILE):
+        self.process = process
+        self.path = path
+        self.enabled = bool(path)
+        # 本次运行的标识；追踪文件中的进程ID在第一次保存时分配
+        self.run_id = uuid.uuid4().hex[:12]
+        self.pid = None
+        self.events = []
+        self.lock = threading.Lock()
+        self.thread_ids = {}
+
+    def _tid(self):
+        ident = threading.get_ident()
+        with self.lock:
+            return self.thread_ids.setdefault(ident, len(self.thread_ids) + 1)
+
+    @contextmanager
+    def span(self, name, category="stage", **args):
+        """
+        记录一个span。代码块抛出异常时状态记为error并继续抛出；
+        代码块可以通过 span.set(status=..., exit_code=...) 补充结果。
+        """
+        span = Span(name, category, args)
+        if not self.enabled:
+            yield span
+            return
+        rx_before = net_rx_bytes()
+        started = time.time()
+        try:
+            yield span
+        except BaseException as e:
+            span.args.setdefault("status", "error")
+            span.args.setdefault("error", f"{type(e).__name__}: {e}"[:500])
+            raise
+        finally:
+            duration = time.time() - started
+            rx_after = net_rx_bytes()
+            span.args.setdefault("status", "ok")
+            if rx_before is not None and rx_after is not None:
+                span.args["bytes_downloaded"] = rx_after - rx_before
+            event = {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": int(started * 1e6),
+                "dur": int(duration * 1e6),
+                "tid": self._tid(),
+                "args": span.args,
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def save(self):
+        """
+        把本次运行的事件追加到追踪文件，保留其他运行的事件；同一次运行再次保存时替换自己上一次写入的事件。
+        """
+        if not self.enabled:
+            return
+        existing = load_trace(self.path) if os.path.exists(self.path) else []
+        if self.pid is None:
+            self.pid = max((event.get("pid", 0) for event in existing if isinstance(event.get("pid"), int)),
+                           default=0) + 1
+        events = [event for event in existing if event.get("pid") != self.pid]
+        events.append({"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": self.process}})
+        events.append({"name": "process_labels", "ph": "M", "pid": self.pid, "args": {"labels": self.run_id}})
+        with self.lock:
+            events.extend(dict(event, pid=self.pid) for event in self.events)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            LOGGER.info(f"构建追踪已写入: {self.path}")
+        except OSError as e:
+            LOGGER.warning(f"无法写入构建追踪 {self.path}: {e}")
+
+    def log_summary(self):
+        if self.enabled:
+            for line in format_summary(summarize(self.events)):
+                LOGGER.info(line)
+
+
+def load_trace(path):
+    """读取追踪文件，返回事件列表（兼容对象格式和数组格式）。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get("traceEvents", []) if isinstance(data, dict) else data
+
+
+def summarize(events):
+    """按 (类别, 名称) 汇总span：次数、总耗时、最长耗时、下载字节数和失败次数。"""
+    rows = defaultdict(lambda: {"count": 0, "seconds": 0.0, "max": 0.0, "bytes": 0, "errors": 0})
+    for event in events:
+        if event.get("ph") != "X":
+            continue
+        row = rows[(event.get("cat", ""), event["name"])]
+        seconds = event.get("dur", 0) / 1e6
+        row["count"] += 1
+        row["seconds"] += seconds
+        row["max"] = max(row["max"], seconds)
+        row["bytes"] += event.get("args", {}).get("bytes_downloaded", 0) or 0
+        if event.get("args", {}).get("status") not in (None, "ok"):
+            row["errors"] += 1
+    return dict(rows)
+
+
+def format_summary(rows, limit=40):
+    lines = [f"{'类别':<10} {'名称':<48} {'次数':>6} {'总耗时(s)':>10} {'最长(s)':>9} {'下载(MB)':>9} {'失败':>5}"]
+    for (category, name), row in sorted(rows.items(), key=lambda item: item[1]["seconds"], reverse=True)[:limit]:
+        lines.append(f"{category:<10} {name[:48]:<48} {row['count']:>6} {row['seconds']:>10.2f} "
+                     f"{row['max']:>9.2f} {row['bytes'] / 1024 / 1024:>9.1f} {row['errors']:>5}")
+    return lines
+
+
+def compare(old_rows, new_rows, threshold_percent=10.0, min_seconds=1.0):
+    """
+    比较两份汇总，返回 (差异行, 回归列表)。
+    耗时增加超过threshold_percent且绝对值超过min_seconds的span视为回归。
+    """
+    diffs = []
+    regressions = []
+    for key in sorted(set(old_rows) | set(new_rows)):
+        old = old_rows.get(key, {}).get("seconds", 0.0)
+        new = new_rows.get(key, {}).get("seconds", 0.0)
+        delta = new - old
+        percent = (delta / old * 100) if old else float("inf") if new else 0.0
+        diffs.append((key, old, new, delta, percent))
+        if delta > min_seconds and percent > threshold_percent:
+            regressions.append(key)
+    diffs.sort(key=lambda item: abs(item[3]), reverse=True)
+    return diffs, regressions
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="构建追踪的汇总与比较")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summary_parser = subparsers.add_parser("summary", help="打印追踪文件的汇总表")
+    summary_parser.add_argument("trace", nargs="?", default=TRACE_FILE)
+    compare_parser = subparsers.add_parser("compare", help="比较两份追踪文件")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="视为回归的耗时增长百分比")
+    compare_parser.add_argument("--min-seconds", type=float, default=1.0, help="视为回归的最小耗时增长（秒）")
+    compare_parser.add_argument("--fail-on-regression", action="store_true", help="存在回归时以非零状态退出")
+    args = parser.parse_args(argv)
+
+    if args.command == "summary":
+        for line in format_summary(summarize(load_trace(args.trace)), limit=200):
+            print(line)
+        return 0
+
+    old_rows = summarize(load_trace(args.old))
+    new_rows = summarize(load_trace(args.new))
+    diffs, regressions = compare(old_rows, new_rows, args.threshold, args.min_seconds)
+    print(f"{'类别':<10} {'名称':<48} {'旧(s)':>9} {'新(s)':>9} {'变化(s)':>9} {'变化%':>8}")
+    for (category, name), old, new, delta, percent in diffs:
+        marker = " ✗" if (category, name) in regressions else ""
+        print(f"{category:<10} {name[:48]:<48} {old:>9.2f} {new:>9.2f} {delta:>+9.2f} {percent:>+7.1f}%{marker}")
+    old_total = sum(row["seconds"] for (category, _), row in old_rows.items() if category == "total")
+    new_total = sum(row["seconds"] for (category, _), row in new_rows.items() if category == "total")
+    print(f"总耗时: {old_total:.1f}秒 -> {new_total:.1f}秒 ({new_total - old_total:+.1f}秒)")
+    if regressions:
+        print(f"✗ {len(regressions)} 个span出现回归 (>{args.threshold}% 且 >{args.min_seconds}秒)")
+        return 1 if args.fail_on_regression else 0
+    print("✓ 未发现回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
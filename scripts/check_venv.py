@@ -2,12 +2,32 @@
 """
 虚拟环境状态检查脚本
 用于验证虚拟环境是否正确配置和可用
+
+使用 --probe 时在当前进程内收集相同的信息并输出JSON，
+不启动任何子进程，适合作为Docker HEALTHCHECK或就绪探针。
+核心包在工作线程中导入，即使某个导入卡住，探针也会在时间预算到期时输出结果。
 """
 
 import os
 import sys
 import subprocess
 import json
+import argparse
+import importlib
+import platform
+import threading
+import time
+
+try:
+    from verify_dependencies import PINNED_PACKAGES
+    CORE_MODULES = list(PINNED_PACKAGES)
+except ImportError:
+    CORE_MODULES = ["torch", "torchvision", "torchaudio", "xformers", "numpy"]
+
+VENV_PATH = "/venv"
+
+# 探针默认的时间预算（秒）
+PROBE_BUDGET = 5.0
 
 def check_venv_status():
     """检查虚拟环境状态"""
@@ -22,7 +42,7 @@ def check_venv_status():
     }
     
     # 检查虚拟环境目录
-    venv_path = "/venv"
+    venv_path = VENV_PATH
     if os.path.exists(venv_path):
         status["venv_exists"] = True
         print(f"✅ 虚拟环境目录存在: {venv_path}")
@@ -91,8 +111,114 @@ def check_venv_status():
     
     return status
 
+def import_core_modules(modules, results, import_started):
+    """依次导入核心包，把结果写入results（在工作线程中运行）。"""
+    for module in modules:
+        import_started[module] = time.perf_counter()
+        try:
+            imported = importlib.import_module(module)
+            results[module] = {
+                "ok": True,
+                "version": getattr(imported, "__version__", None),
+                "import_ms": round((time.perf_counter() - import_started[module]) * 1000, 1),
+            }
+        except Exception as e:
+            results[module] = {
+                "ok": False,
+                "error": f"{type(e).__name__}: {e}",
+                "import_ms": round((time.perf_counter() - import_started[module]) * 1000, 1),
+            }
+
+
+def probe_venv(fast=False, budget=PROBE_BUDGET):
+    """
+    在当前进程内检查虚拟环境，返回可序列化为JSON的结果。
+
+    fast为True时跳过核心包的导入检查。导入在守护线程中进行，主线程最多等到预算到期：
+    届时仍在导入的包标记为timeout，尚未开始的包标记为skipped，结果状态为timeout。
+    卡住的导入仍留在后台线程中，调用方应在输出结果后直接退出进程。
+    """
+    from importlib import metadata as importlib_metadata
+
+    started = time.perf_counter()
+    status = {
+        "status": "ok",
+        "venv_exists": os.path.isdir(VENV_PATH),
+        "venv_functional": VENV_PATH in sys.prefix,
+        "python_version": platform.python_version(),
+        "python_path": sys.executable,
+        "prefix": sys.prefix,
+        "pip_version": None,
+        "setuptools_version": None,
+        "packages_count": 0,
+        "core_imports": {},
+        "errors": [],
+        "elapsed_ms": 0.0,
+        "budget_ms": budget * 1000,
+    }
+
+    for name in ("pip", "setuptools"):
+        try:
+            status[f"{name}_version"] = importlib_metadata.version(name)
+        except importlib_metadata.PackageNotFoundError:
+            status["errors"].append(f"{name}未安装")
+
+    names = set()
+    for dist in importlib_metadata.distributions():
+        name = dist.metadata["Name"]
+        if name:
+            names.add(name.lower())
+    status["packages_count"] = len(names)
+
+    if not status["venv_functional"]:
+        status["errors"].append("虚拟环境未正确激活")
+
+    if not fast:
+        results, import_started = {}, {}
+        worker = threading.Thread(target=import_core_modules, args=(CORE_MODULES, results, import_started),
+                                  name="core-imports", daemon=True)
+        worker.start()
+        worker.join(max(0.0, budget - (time.perf_counter() - started)))
+        now = time.perf_counter()
+        for module in CORE_MODULES:
+            # 先取快照：预算到期后工作线程可能仍在写入
+            result = results.get(module)
+            if result is None and module in import_started:
+                result = {"ok": False, "timeout": True,
+                          "import_ms": round((now - import_started[module]) * 1000, 1)}
+            elif result is None:
+                result = {"ok": False, "skipped": True}
+            status["core_imports"][module] = result
+            if "error" in result:
+                status["errors"].append(f"导入{module}失败")
+
+    elapsed = time.perf_counter() - started
+    status["elapsed_ms"] = round(elapsed * 1000, 1)
+    if status["errors"]:
+        status["status"] = "error"
+    elif elapsed > budget or any(not result["ok"] for result in status["core_imports"].values()):
+        status["status"] = "timeout"
+    return status
+
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="检查虚拟环境状态")
+    parser.add_argument("--probe", action="store_true", help="在进程内检查并输出JSON，适合作为健康检查")
+    parser.add_argument("--fast", action="store_true", help="探针模式下跳过核心包的导入检查")
+    parser.add_argument("--budget", type=float, default=PROBE_BUDGET, help="探针模式的时间预算（秒）")
+    args = parser.parse_args()
+
+    if args.probe:
+        status = probe_venv(fast=args.fast, budget=args.budget)
+        print(json.dumps(status, ensure_ascii=False))
+        code = 0 if status["status"] == "ok" else 1
+        if any(result.get("timeout") for result in status["core_imports"].values()):
+            # 不等待仍卡在导入中的线程（解释器退出时可能被导入锁阻塞）
+            sys.stdout.flush()
+            os._exit(code)
+        return code
+
     print("🔍 检查虚拟环境状态...")
     print("=" * 50)
     
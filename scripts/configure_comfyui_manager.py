@@ -2,84 +2,178 @@
 """
 ComfyUI-Manager配置脚本
 用于解决国内服务器网络超时问题
+
+- 存在本地快照（manager_snapshot.py capture）且快照服务正在运行时，把channel_url指向本地快照服务；
+  服务没有运行时恢复上游频道，避免Manager请求一个无人监听的本地端口
+- 配置文件只在内容变化时写入
+- manager_util.py 的补丁按校验和验证，已打过补丁时不再重复修改
 """
 
-import os
+import configparser
+import hashlib
+import io
 import json
-import sys
+import os
+import re
+
+from manager_snapshot import CHANNEL_URL, LOCAL_URL, SNAPSHOT_DIR, is_serving, load_manifest
+
+MANAGER_PATH = "/app/custom_nodes/ComfyUI-Manager"
+# Manager新版本把配置放在用户目录下，旧版本放在节点目录下
+USER_CONFIG_PATHS = [
+    "/app/user/__manager/config.ini",
+    "/app/user/default/ComfyUI-Manager/config.ini",
+]
+LEGACY_CONFIG_PATH = os.path.join(MANAGER_PATH, "config.ini")
+PATCH_STATE_FILE = os.path.join(MANAGER_PATH, ".patch_state.json")
+
+# 网络超时相关设置
+TIMEOUT_SETTINGS = {
+    "DEFAULT": {
+        "timeout": "120",
+        "auto_fetch": "false",
+        "use_local_cache": "true",
+    },
+    "network": {
+        "connect_timeout": "60",
+        "read_timeout": "120",
+        "max_retries": "3",
+    },
+}
+
+# manager_util.py 超时补丁
+UTIL_PATCHES = [
+    (re.compile(r"timeout=aiohttp\.ClientTimeout\(total=10\)"), "timeout=aiohttp.ClientTimeout(total=120)"),
+    (re.compile(r"\btimeout=10\b"), "timeout=120"),
+]
+
+
+def sha256_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_patch_state():
+    try:
+        with open(PATCH_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_patch_state(state):
+    with open(PATCH_STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+
+def render_config(path, channel_url):
+    """读取已有配置并合并超时设置和channel_url，返回新内容。"""
+    config = configparser.ConfigParser(interpolation=None)
+    if os.path.exists(path):
+        config.read(path, encoding='utf-8')
+    for section, values in TIMEOUT_SETTINGS.items():
+        if section != "DEFAULT" and not config.has_section(section):
+            config.add_section(section)
+        for key, value in values.items():
+            config[section][key] = value
+    if not channel_url and config.get("default", "channel_url", fallback=None) == LOCAL_URL:
+        # 上次启动指向了本地快照服务，而这次服务没有运行
+        channel_url = CHANNEL_URL
+    if channel_url:
+        if not config.has_section("default"):
+            config.add_section("default")
+        config["default"]["channel_url"] = channel_url
+    buffer = io.StringIO()
+    config.write(buffer)
+    return buffer.getvalue()
+
+
+def write_config(path, channel_url):
+    """只在内容变化时写入配置文件。"""
+    content = render_config(path, channel_url)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                print(f"✅ 配置文件无需更新: {path}")
+                return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    print(f"✅ 配置文件已更新: {path}")
+
+
+def patch_manager_util(util_path):
+    """给manager_util.py打超时补丁，按校验和判断是否已打过补丁。"""
+    state = load_patch_state()
+    current = sha256_file(util_path)
+    if current == state.get("patched_sha256"):
+        print("✅ manager_util.py补丁已验证，无需修改")
+        return
+
+    with open(util_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    patched = content
+    for pattern, replacement in UTIL_PATCHES:
+        patched = pattern.sub(replacement, patched)
+
+    if patched != content:
+        with open(util_path, 'w', encoding='utf-8') as f:
+            f.write(patched)
+        expected = hashlib.sha256(patched.encode('utf-8')).hexdigest()
+        if sha256_file(util_path) != expected:
+            raise RuntimeError("写入后校验和不一致")
+        print("✅ manager_util.py超时时间已增加")
+    else:
+        print("✅ manager_util.py无需修改")
+
+    save_patch_state({
+        "original_sha256": current,
+        "patched_sha256": sha256_file(util_path),
+    })
+
 
 def configure_manager():
     """配置ComfyUI-Manager"""
-    manager_path = "/app/custom_nodes/ComfyUI-Manager"
-    
-    if not os.path.exists(manager_path):
+    if not os.path.exists(MANAGER_PATH):
         print("⚠️ ComfyUI-Manager未找到，跳过配置")
         return
-    
+
     print("🔧 配置ComfyUI-Manager...")
-    
-    # 创建配置文件
-    config_path = os.path.join(manager_path, "config.ini")
-    
-    config_content = """
-[DEFAULT]
-# 增加超时时间
-timeout = 120
-
-# 禁用自动获取
-auto_fetch = false
-
-# 使用本地缓存
-use_local_cache = true
-
-[network]
-# 连接超时
-connect_timeout = 60
-read_timeout = 120
-
-# 重试次数
-max_retries = 3
-"""
-    
-    try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            f.write(config_content)
-        print(f"✅ 配置文件已创建: {config_path}")
-    except Exception as e:
-        print(f"❌ 配置文件创建失败: {e}")
-    
-    # 修改manager_util.py增加超时时间
-    util_path = os.path.join(manager_path, "glob", "manager_util.py")
+
+    manifest = load_manifest(SNAPSHOT_DIR)
+    channel_url = None
+    if manifest and is_serving():
+        channel_url = LOCAL_URL
+        print(f"📦 使用本地快照 (版本 {manifest.get('version', '')[:12]}): {channel_url}")
+    elif manifest:
+        print("⚠️ Manager数据快照服务没有运行，不使用本地快照")
+    else:
+        print("⚠️ 未找到Manager数据快照，保持默认频道")
+
+    config_paths = [path for path in USER_CONFIG_PATHS + [LEGACY_CONFIG_PATH] if os.path.exists(path)]
+    for path in config_paths or [LEGACY_CONFIG_PATH]:
+        try:
+            write_config(path, channel_url)
+        except Exception as e:
+            print(f"❌ 配置文件写入失败 {path}: {e}")
+
+    util_path = os.path.join(MANAGER_PATH, "glob", "manager_util.py")
     if os.path.exists(util_path):
         try:
-            with open(util_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 增加超时时间
-            content = content.replace(
-                "timeout=aiohttp.ClientTimeout(total=10)",
-                "timeout=aiohttp.ClientTimeout(total=120)"
-            )
-            content = content.replace(
-                "timeout=10",
-                "timeout=120"
-            )
-            
-            with open(util_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            print("✅ manager_util.py超时时间已增加")
+            patch_manager_util(util_path)
         except Exception as e:
             print(f"⚠️ 修改manager_util.py失败: {e}")
-    
+
     # 创建禁用网络获取的标记文件
-    disable_fetch_file = os.path.join(manager_path, ".disable_fetch")
-    try:
-        with open(disable_fetch_file, 'w') as f:
-            f.write("# 禁用网络获取以避免超时\n")
-        print("✅ 已创建禁用网络获取标记")
-    except Exception as e:
-        print(f"⚠️ 创建禁用标记失败: {e}")
+    disable_fetch_file = os.path.join(MANAGER_PATH, ".disable_fetch")
+    if not os.path.exists(disable_fetch_file):
+        try:
+            with open(disable_fetch_file, 'w') as f:
+                f.write("# 禁用网络获取以避免超时\n")
+            print("✅ 已创建禁用网络获取标记")
+        except Exception as e:
+            print(f"⚠️ 创建禁用标记失败: {e}")
+
 
 def main():
     """主函数"""
@@ -87,5 +181,6 @@ def main():
     configure_manager()
     print("🎉 ComfyUI-Manager配置完成！")
 
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
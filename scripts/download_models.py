@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+并行、可断点续传、带校验的模型下载器。
+
+取代 entrypoint.sh 中串行的 `wget -q` 下载：
+1. 由清单文件驱动，每一项包含 url、目标目录、sha256 和大小。
+2. 服务器支持 Range 请求时，每个文件被拆分为多个分段并行下载；
+   所有文件的分段共享一个全局连接数上限和一个带宽上限。
+3. 下载进度保存在 .part 文件和 .part.json 状态文件中，中断后从已完成的字节继续。
+4. 在下载的同时按顺序计算已连续完成部分的sha256，全部完成后校验，
+   通过后原子地重命名到最终路径。
+
+清单格式（JSON数组）:
+    [{"url": "https://.../model.safetensors", "target": "checkpoints",
+      "sha256": "...", "size": 123, "filename": "可选，默认取URL的文件名"}]
+target 为相对路径时相对于 /app/models。
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+MODELS_DIR = "/app/models"
+MANIFEST_FILE = os.environ.get("MODEL_MANIFEST", "/app/models_manifest.json")
+FORCE_DOWNLOAD = os.environ.get("FORCE_DOWNLOAD_MODELS", "false").lower() in ("true", "1", "yes")
+
+# 全局同时打开的HTTP连接数
+MAX_CONNECTIONS = int(os.environ.get("DOWNLOAD_CONNECTIONS", "8"))
+# 每个文件最多拆分的分段数
+SEGMENTS_PER_FILE = int(os.environ.get("DOWNLOAD_SEGMENTS", "4"))
+# 小于该大小的分段不再继续拆分
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+# 全局带宽上限（字节/秒），0表示不限制，支持 K/M/G 后缀
+BANDWIDTH_LIMIT = os.environ.get("DOWNLOAD_BANDWIDTH_LIMIT", "0")
+
+CHUNK_SIZE = 1024 * 1024
+# 每写入这么多字节保存一次进度状态
+STATE_SAVE_INTERVAL = 16 * 1024 * 1024
+MAX_RETRIES = 5
+BACKOFF_BASE = 2.0
+HTTP_TIMEOUT = 60
+USER_AGENT = "ComfyUI-Docker-downloader"
+
+
+def parse_size(value):
+    """把 '20M'、'1.5G' 这样的字符串转换为字节数。"""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?)i?B?\s*", str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"无法解析大小: {value}")
+    number, unit = match.groups()
+    return int(float(number) * {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[unit.upper()])
+
+
+class TokenBucket:
+    """线程安全的令牌桶，用于限制所有连接的总带宽。"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount or self.tokens >= self.rate:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+
+class FileDownload:
+    """单个文件的下载状态：分段进度、增量哈希以及.part/.part.json文件。"""
+
+    def __init__(self, entry, models_dir=MODELS_DIR):
+        self.url = entry["url"]
+        filename = entry.get("filename") or os.path.basename(urllib.parse.urlparse(self.url).path)
+        target = entry.get("target", "")
+        directory = target if os.path.isabs(target) else os.path.join(models_dir, target)
+        self.path = os.path.join(directory, filename)
+        self.part_path = self.path + ".part"
+        self.state_path = self.path + ".part.json"
+        self.expected_sha256 = (entry.get("sha256") or "").lower() or None
+        self.expected_size = entry.get("size")
+        self.size = None
+        self.ranged = False
+        self.segments = []
+        self.lock = threading.Lock()
+        self.hasher = hashlib.sha256()
+        self.hashed_upto = 0
+        self.unsaved_bytes = 0
+        self.started = None
+        self.downloaded = 0
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def probe(self):
+        """用 Range: bytes=0-0 请求探测文件大小以及服务器是否支持分段下载。"""
+        request = urllib.request.Request(self.url, headers={"Range": "bytes=0-0", "User-Agent": USER_AGENT})
+        with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+            if response.status == 206:
+                content_range = response.headers.get("Content-Range", "")
+                total = content_range.rsplit("/", 1)[-1]
+                if total.isdigit():
+                    self.size = int(total)
+                    self.ranged = True
+                    return
+            length = response.headers.get("Content-Length")
+            self.size = int(length) if length and length.isdigit() else None
+            self.ranged = False
+
+    def plan(self, segments_per_file):
+        """恢复上一次的分段进度，或者为新的下载规划分段。"""
+        state = self._load_state()
+        if (self.ranged and state and state.get("url") == self.url and state.get("size") == self.size
+                and os.path.exists(self.part_path) and os.path.getsize(self.part_path) == self.size):
+            self.segments = state["segments"]
+            done = sum(segment[2] for segment in self.segments)
+            LOGGER.info(f"{self.name}: 从 {done / 1024 / 1024:.1f} MB 处继续下载")
+            return
+
+        if self.ranged and self.size:
+            count = max(1, min(segments_per_file, self.size // MIN_SEGMENT_SIZE))
+            step = -(-self.size // count)
+            self.segments = [[start, min(start + step, self.size) - 1, 0] for start in range(0, self.size, step)]
+        else:
+            # 不支持Range的服务器只能单连接从头下载
+            self.segments = [[0, (self.size or 0) - 1, 0]]
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.part_path, 'wb') as f:
+            if self.ranged and self.size:
+                f.truncate(self.size)
+        self._save_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"url": self.url, "size": self.size, "segments": self.segments}, f)
+        os.replace(tmp_path, self.state_path)
+        self.unsaved_bytes = 0
+
+    def record_progress(self, segment, amount):
+        """记录分段进度，推进增量哈希，并定期保存状态。"""
+        with self.lock:
+            segment[2] += amount
+            self.downloaded += amount
+            self.unsaved_bytes += amount
+            self._advance_hash()
+            if self.unsaved_bytes >= STATE_SAVE_INTERVAL:
+                self._save_state()
+
+    def _contiguous_end(self):
+        """从文件开头起已经连续下载完成的字节数。"""
+        end = 0
+        for start, stop, done in sorted(self.segments):
+            if start != end:
+                break
+            end = start + done
+            if start + done <= stop:
+                break
+        return end
+
+    def _advance_hash(self):
+        """把新的连续完成部分读入哈希。"""
+        end = self._contiguous_end()
+        if end <= self.hashed_upto:
+            return
+        with open(self.part_path, 'rb') as f:
+            f.seek(self.hashed_upto)
+            remaining = end - self.hashed_upto
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.hasher.update(chunk)
+                remaining -= len(chunk)
+        self.hashed_upto = end
+
+    def complete(self):
+        return all(start + done > stop for start, stop, done in self.segments) if self.size else False
+
+    def finalize(self):
+        """校验大小和sha256，通过后原子地重命名到最终路径。"""
+        with self.lock:
+            self._advance_hash()
+            actual_size = os.path.getsize(self.part_path)
+            if self.expected_size is not None and actual_size != self.expected_size:
+                raise ValueError(f"大小不符: 期望 {self.expected_size}, 实际 {actual_size}")
+            digest = self.hasher.hexdigest()
+            if self.expected_sha256 and digest != self.expected_sha256:
+                raise ValueError(f"sha256不符: 期望 {self.expected_sha256}, 实际 {digest}")
+            os.replace(self.part_path, self.path)
+            try:
+                os.remove(self.state_path)
+            except OSError:
+                pass
+            return digest
+
+    def discard(self):
+        for path in (self.part_path, self.state_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def download_segment(download, segment, bucket):
+    """下载一个分段的剩余部分，失败时按指数退避重试并从已完成的字节继续。"""
+    for attempt in range(MAX_RETRIES):
+        start, stop, done = segment
+        if download.size and start + done > stop:
+            return
+        headers = {"User-Agent": USER_AGENT}
+        if download.ranged:
+            headers["Range"] = f"bytes={start + done}-{stop}"
+        elif done:
+            # 不支持Range时无法续传，只能从头开始
+            with download.lock:
+                download.hasher = hashlib.sha256()
+                download.hashed_upto = 0
+                download.downloaded -= done
+                segment[2] = 0
+        try:
+            request = urllib.request.Request(download.url, headers=headers)
+            with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response, \
+                    open(download.part_path, 'r+b') as f:
+                f.seek(start + segment[2])
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    bucket.consume(len(chunk))
+                    f.write(chunk)
+                    f.flush()
+                    download.record_progress(segment, len(chunk))
+            if not download.size:
+                # 大小未知的单连接下载，以实际读取到的字节数为准
+                download.size = segment[2]
+                segment[1] = segment[2] - 1
+            if download.ranged and start + segment[2] <= stop:
+                raise IOError(f"分段提前结束: {start + segment[2]}/{stop + 1}")
+            return
+        except (urllib.error.URLError, OSError, IOError) as e:
+            if attempt + 1 == MAX_RETRIES:
+                raise
+            sleep_time = BACKOFF_BASE * (2 ** attempt)
+            LOGGER.warning(f"{download.name}: 分段 {start}-{stop} 失败 ({e})，{sleep_time}秒后重试...")
+            time.sleep(sleep_time)
+
+
+def load_manifest(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def download_all(entries, connections=MAX_CONNECTIONS, segments_per_file=SEGMENTS_PER_FILE,
+                 bandwidth_limit=0, force=FORCE_DOWNLOAD, models_dir=MODELS_DIR):
+    """下载清单中的所有文件，返回每个文件的结果列表。"""
+    bucket = TokenBucket(bandwidth_limit)
+    results = []
+    pending = []
+
+    for entry in entries:
+        download = FileDownload(entry, models_dir)
+        if os.path.exists(download.path) and not force:
+            if download.expected_size is None or os.path.getsize(download.path) == download.expected_size:
+                LOGGER.info(f"模型 {download.name} 已存在，跳过下载。")
+                results.append({"file": download.path, "status": "exists"})
+                continue
+            LOGGER.warning(f"模型 {download.name} 大小与清单不符，重新下载。")
+        try:
+            download.probe()
+            download.plan(segments_per_file)
+        except Exception as e:
+            LOGGER.error(f"✗ 无法开始下载 {download.url}: {e}")
+            results.append({"file": download.path, "status": "failed", "error": str(e)})
+            continue
+        pending.append(download)
+
+    with ThreadPoolExecutor(max_workers=max(1, connections)) as executor:
+        futures = {}
+        for download in pending:
+            download.started = time.time()
+            LOGGER.info(f"下载 {download.name} 到 {os.path.dirname(download.path)} "
+                        f"({(download.size or 0) / 1024 / 1024:.1f} MB, {len(download.segments)} 个分段)...")
+            for segment in download.segments:
+                futures[executor.submit(download_segment, download, segment, bucket)] = download
+
+        errors = {}
+        remaining = {download: len(download.segments) for download in pending}
+        for future in as_completed(futures):
+            download = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                errors.setdefault(download, str(e))
+            remaining[download] -= 1
+            if remaining[download]:
+                continue
+
+            elapsed = time.time() - download.started
+            if download in errors:
+                with download.lock:
+                    download._save_state()
+                LOGGER.error(f"✗ {download.name} 下载失败，已保存进度以便续传: {errors[download]}")
+                results.append({"file": download.path, "status": "failed", "error": errors[download]})
+                continue
+            try:
+                digest = download.finalize()
+            except Exception as e:
+                download.discard()
+                LOGGER.error(f"✗ {download.name} 校验失败: {e}")
+                results.append({"file": download.path, "status": "failed", "error": str(e)})
+                continue
+            speed = download.downloaded / elapsed / 1024 / 1024 if elapsed else 0
+            LOGGER.info(f"✓ {download.name} 下载完成 ({elapsed:.1f}秒, {speed:.1f} MB/s)")
+            results.append({"file": download.path, "status": "downloaded", "sha256": digest,
+                            "bytes": download.downloaded, "seconds": round(elapsed, 3)})
+    return results
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="并行、可续传、带校验的模型下载器")
+    parser.add_argument("--manifest", help="模型清单JSON文件")
+    parser.add_argument("--url", help="只下载单个URL")
+    parser.add_argument("--dir", help="单个URL的目标目录")
+    parser.add_argument("--sha256", help="单个URL的期望sha256")
+    parser.add_argument("--connections", type=int, default=MAX_CONNECTIONS, help="全局并发连接数")
+    parser.add_argument("--segments", type=int, default=SEGMENTS_PER_FILE, help="每个文件的最大分段数")
+    parser.add_argument("--limit", default=BANDWIDTH_LIMIT, help="全局带宽上限，例如 50M（字节/秒）")
+    parser.add_argument("--force", action="store_true", default=FORCE_DOWNLOAD, help="即使文件已存在也重新下载")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        entries = [{"url": args.url, "target": args.dir or "", "sha256": args.sha256}]
+    else:
+        manifest = args.manifest or MANIFEST_FILE
+        if not os.path.exists(manifest):
+            LOGGER.info(f"模型清单 {manifest} 不存在，跳过下载。")
+            return 0
+        entries = load_manifest(manifest)
+
+    results = download_all(entries, args.connections, args.segments, parse_size(args.limit), args.force)
+    failed = [r for r in results if r["status"] == "failed"]
+    LOGGER.info(f"模型下载完成: {len(results) - len(failed)}/{len(results)} 个成功。")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,16 +15,26 @@ echo "✅ Go代理配置:"
 echo "  GOPROXY=$GOPROXY"
 echo "  GOSUMDB=$GOSUMDB"
 
-# 配置pip镜像源（如果需要）
+# 配置pip镜像源：使用 pip_mirrors.py 探测出的最快健康镜像（结果有缓存），失败时使用清华镜像
+PIP_MIRROR=""
+if [ -f /app/scripts/pip_mirrors.py ]; then
+    PIP_MIRROR=$(python /app/scripts/pip_mirrors.py best pypi 2>/dev/null | tail -n 1)
+fi
+case "$PIP_MIRROR" in
+    http://*|https://*) ;;
+    *) PIP_MIRROR="https://pypi.tuna.tsinghua.edu.cn/simple" ;;
+esac
+PIP_MIRROR_HOST=$(echo "$PIP_MIRROR" | sed -E 's#^https?://([^/:]+).*#\1#')
+
 mkdir -p ~/.pip
 cat > ~/.pip/pip.conf << EOF
 [global]
-index-url = https://pypi.tuna.tsinghua.edu.cn/simple
-trusted-host = pypi.tuna.tsinghua.edu.cn
+index-url = $PIP_MIRROR
+trusted-host = $PIP_MIRROR_HOST
 timeout = 60
 EOF
 
-echo "✅ Pip镜像源已配置"
+echo "✅ Pip镜像源已配置: $PIP_MIRROR"
 
 # 配置npm镜像源（如果有Node.js依赖）
 if command -v npm &> /dev/null; then
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+在容器启动时一次性修正 /app/models 和 /app/custom_nodes 的所有者与权限。
+
+取代 set_permissions.sh 中的 `chown -R` 以及 entrypoint.sh 中多次 `find -exec chmod` 的组合：
+1. 每棵目录树只用 os.scandir 遍历一次，所有权与权限规则在同一次遍历中应用，
+   且只对与目标状态不一致的条目执行系统调用。
+2. 各顶层子目录在线程池中并行处理。
+3. 每棵目录树根部保存一个按目录记录mtime的日志。再次启动时，mtime未变化的目录
+   不再列出其中的文件，只继续检查已记录的子目录，因此只有发生变化的目录会被重新处理。
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import stat
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+OWNER_UID = int(os.environ.get("PERMISSIONS_UID", "1001"))
+OWNER_GID = int(os.environ.get("PERMISSIONS_GID", "1001"))
+
+# 每棵目录树的规则。mode为None表示不修改权限，只修改所有者。
+TREES = [
+    {"path": "/app/models", "file_mode": None, "exec_mode": None, "dir_mode": None},
+    {"path": "/app/custom_nodes", "file_mode": 0o664, "exec_mode": 0o775, "dir_mode": 0o755},
+]
+
+JOURNAL_NAME = ".permissions_journal.json"
+WORKERS = int(os.environ.get("PERMISSIONS_WORKERS", str(min(16, (os.cpu_count() or 1) * 2))))
+
+# 需要执行权限的文件：shell脚本、go二进制、exe/bin文件、服务类程序，以及bin/和go/目录下的所有文件
+EXEC_SUFFIXES = (".sh", ".exe", ".bin")
+EXEC_NAMES = {"go"}
+EXEC_NAME_PARTS = ("server", "daemon", "Service")
+EXEC_PARENT_DIRS = {"bin", "go"}
+
+
+def needs_exec(name, rel_parts):
+    """判断custom_nodes中的文件是否需要执行权限。"""
+    if name.endswith(EXEC_SUFFIXES) or name in EXEC_NAMES:
+        return True
+    if any(part in name for part in EXEC_NAME_PARTS):
+        return True
+    return any(part in EXEC_PARENT_DIRS for part in rel_parts)
+
+
+def rules_digest(tree):
+    """规则的摘要；规则变化时旧日志作废。"""
+    payload = json.dumps([OWNER_UID, OWNER_GID, tree["file_mode"], tree["exec_mode"], tree["dir_mode"],
+                          EXEC_SUFFIXES, sorted(EXEC_NAMES), EXEC_NAME_PARTS, sorted(EXEC_PARENT_DIRS)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TreeFixer:
+    """对一棵目录树应用所有者与权限规则。"""
+
+    def __init__(self, tree, journal, dry_run=False):
+        self.root = os.path.realpath(tree["path"])
+        self.tree = tree
+        self.journal = journal
+        self.dry_run = dry_run
+        self.stats = {"dirs_scanned": 0, "dirs_skipped": 0, "entries_checked": 0, "changed": 0, "errors": 0}
+
+    def fix_entry(self, path, st, desired_mode):
+        """只在所有者或权限与目标不一致时执行chown/chmod。"""
+        self.stats["entries_checked"] += 1
+        changed = False
+        try:
+            if st.st_uid != OWNER_UID or st.st_gid != OWNER_GID:
+                if not self.dry_run:
+                    os.chown(path, OWNER_UID, OWNER_GID, follow_symlinks=False)
+                changed = True
+            if desired_mode is not None and not stat.S_ISLNK(st.st_mode) and stat.S_IMODE(st.st_mode) != desired_mode:
+                if not self.dry_run:
+                    os.chmod(path, desired_mode)
+                changed = True
+        except OSError as e:
+            self.stats["errors"] += 1
+            if self.stats["errors"] <= 5:
+                LOGGER.warning(f"无法设置 {path} 的权限: {e}")
+        if changed:
+            self.stats["changed"] += 1
+
+    def walk(self, start):
+        """
+        从start开始遍历子树，返回该子树的新日志条目 {相对路径: {mtime_ns, subdirs}}。
+        """
+        new_journal = {}
+        stack = [start]
+        while stack:
+            path = stack.pop()
+            rel = os.path.relpath(path, self.root)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            self.fix_entry(path, st, self.tree["dir_mode"])
+
+            previous = self.journal.get(rel)
+            if previous and previous["mtime_ns"] == st.st_mtime_ns:
+                # 目录的直接条目未变化，只需继续检查已记录的子目录
+                self.stats["dirs_skipped"] += 1
+                new_journal[rel] = previous
+                stack.extend(os.path.join(path, name) for name in previous["subdirs"])
+                continue
+
+            self.stats["dirs_scanned"] += 1
+            subdirs = []
+            rel_parts = [] if rel == "." else rel.split(os.sep)
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.name == JOURNAL_NAME and path == self.root:
+                            continue
+                        try:
+                            entry_st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if stat.S_ISDIR(entry_st.st_mode):
+                            subdirs.append(entry.name)
+                            stack.append(entry.path)
+                            continue
+                        desired = self.tree["file_mode"]
+                        if desired is not None and needs_exec(entry.name, rel_parts):
+                            desired = self.tree["exec_mode"]
+                        self.fix_entry(entry.path, entry_st, desired)
+            except OSError as e:
+                self.stats["errors"] += 1
+                LOGGER.warning(f"无法读取目录 {path}: {e}")
+                continue
+
+            if not self.dry_run:
+                # 修改权限不会改变目录mtime，因此可以直接记录遍历前的值
+                new_journal[rel] = {"mtime_ns": st.st_mtime_ns, "subdirs": sorted(subdirs)}
+        return new_journal
+
+
+def journal_path(root):
+    return os.path.join(root, JOURNAL_NAME)
+
+
+def load_journal(root, digest):
+    try:
+        with open(journal_path(root), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("rules") != digest:
+        LOGGER.info(f"{root} 的权限规则已变化，忽略旧日志。")
+        return {}
+    return data.get("dirs", {})
+
+
+def save_journal(root, digest, dirs):
+    tmp_path = journal_path(root) + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"rules": digest, "dirs": dirs}, f)
+        os.replace(tmp_path, journal_path(root))
+        os.chown(journal_path(root), OWNER_UID, OWNER_GID)
+    except OSError as e:
+        LOGGER.warning(f"无法保存权限日志 {journal_path(root)}: {e}")
+
+
+def fix_tree(tree, executor, use_journal=True, dry_run=False):
+    """处理一棵目录树：根目录在当前线程处理，各顶层子目录并行处理。"""
+    root = os.path.realpath(tree["path"])
+    if not os.path.isdir(root):
+        LOGGER.info(f"{tree['path']} 不存在，跳过。")
+        return None
+
+    digest = rules_digest(tree)
+    journal = load_journal(root, digest) if use_journal else {}
+    fixer = TreeFixer(tree, journal, dry_run)
+
+    # 根目录本身总是重新列出（写入日志文件会改变它的mtime）
+    root_st = os.lstat(root)
+    fixer.fix_entry(root, root_st, tree["dir_mode"])
+    fixer.stats["dirs_scanned"] += 1
+    subdirs = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.name == JOURNAL_NAME:
+                continue
+            try:
+                entry_st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat.S_ISDIR(entry_st.st_mode):
+                subdirs.append(entry.path)
+            else:
+                desired = tree["file_mode"]
+                if desired is not None and needs_exec(entry.name, []):
+                    desired = tree["exec_mode"]
+                fixer.fix_entry(entry.path, entry_st, desired)
+
+    def walk_subtree(path):
+        # 每个子树使用独立的TreeFixer，避免线程间共享统计计数
+        subtree_fixer = TreeFixer(tree, journal, dry_run)
+        return subtree_fixer.walk(path), subtree_fixer.stats
+
+    new_journal = {".": {"mtime_ns": root_st.st_mtime_ns, "subdirs": sorted(os.path.basename(p) for p in subdirs)}}
+    for partial, stats in executor.map(walk_subtree, subdirs):
+        new_journal.update(partial)
+        for key, value in stats.items():
+            fixer.stats[key] += value
+
+    if use_journal and not dry_run:
+        save_journal(root, digest, new_journal)
+    return root, fixer.stats
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="一次遍历修正模型与自定义节点目录的所有者和权限")
+    parser.add_argument("--no-journal", action="store_true", help="忽略并且不写入目录mtime日志，执行完整遍历")
+    parser.add_argument("--dry-run", action="store_true", help="只统计需要修改的条目，不实际修改")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="并行处理子目录的线程数")
+    args = parser.parse_args(argv)
+
+    LOGGER.info(f"设置目录权限为{OWNER_UID}:{OWNER_GID}...")
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        for tree in TREES:
+            tree_started = time.time()
+            result = fix_tree(tree, executor, use_journal=not args.no_journal, dry_run=args.dry_run)
+            if result is None:
+                continue
+            root, stats = result
+            LOGGER.info(
+                f"{root}: 扫描 {stats['dirs_scanned']} 个目录, 跳过未变化的 {stats['dirs_skipped']} 个, "
+                f"检查 {stats['entries_checked']} 个条目, 修改 {stats['changed']} 个, "
+                f"错误 {stats['errors']} 个 ({time.time() - tree_started:.2f}秒)"
+            )
+            if stats["errors"]:
+                LOGGER.warning(f"{root} 中有部分条目无法设置权限，可能需要root权限")
+    LOGGER.info(f"权限设置完成 ({time.time() - started:.2f}秒)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
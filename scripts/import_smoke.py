@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+已安装软件包与自定义节点的并行导入冒烟测试。
+
+build_dependencies.py 只验证 numpy、torch 和 torchvision，其他软件包或自定义节点的导入问题
+要到运行时才会暴露。本脚本：
+1. 通过 importlib.metadata 把每个已安装的发行包映射到它的顶层模块；
+2. 在一组常驻的工作子进程中导入这些模块。工作进程先导入公共的重型依赖（默认 numpy、torch），
+   然后为每个模块fork一个子进程导入，超时的子进程会被杀死。因此每个模块的耗时是在已导入
+   公共依赖基础上的增量，导入失败或崩溃也不会影响其他模块；
+3. 自定义节点同样处理：节点工作进程只初始化一次ComfyUI（与 profile_custom_nodes.py 相同的方式，默认 --cpu），
+   再为每个节点fork子进程导入；
+4. 整个测试有固定的时间预算，按基线中记录的耗时从长到短调度，预算用完后剩余的条目记为skipped；
+5. 结果写入JSON报告。与基线相比，基线中导入成功、本次失败/超时/崩溃的条目视为回归，
+   存在回归时以退出码1结束（使构建失败）。没有回归时（或使用 --accept）可用 --update-baseline 更新基线。
+
+用法：
+    python import_smoke.py run [--jobs 4] [--budget 600] [--timeout 60] [--update-baseline] [--accept]
+"""
+
+import argparse
+import importlib
+import importlib.metadata
+import json
+import logging
+import os
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from profile_custom_nodes import COMFYUI_DIR, CUSTOM_NODES_DIR, bootstrap_comfyui, find_nodes, import_node
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+REPORT_FILE = os.environ.get("IMPORT_SMOKE_REPORT", "/app/import_smoke_report.json")
+BASELINE_FILE = os.environ.get("IMPORT_SMOKE_BASELINE", "/app/.cache/import_smoke_baseline.json")
+JOBS = int(os.environ.get("IMPORT_SMOKE_JOBS", str(os.cpu_count() or 1)))
+# 整个测试的时间预算和单个模块/节点的导入超时（秒）
+BUDGET = float(os.environ.get("IMPORT_SMOKE_BUDGET", "600"))
+IMPORT_TIMEOUT = float(os.environ.get("IMPORT_SMOKE_TIMEOUT", "60"))
+# 工作进程预先导入的公共依赖
+PRELOAD = [name for name in os.environ.get("IMPORT_SMOKE_PRELOAD", "numpy,torch").split(",") if name]
+# 不是真正可导入的包、或导入时有副作用的顶层名称
+SKIP_MODULES = {"setup", "test", "tests", "testing", "doc", "docs", "example", "examples", "benchmark",
+                "benchmarks", "scripts", "build", "conftest"} | \
+               {name for name in os.environ.get("IMPORT_SMOKE_SKIP", "").split(",") if name}
+COMFY_ARGS = ["--cpu"]
+FAILED_STATUSES = ("failed", "timeout", "crashed")
+# 没有基线耗时记录的条目按该耗时参与调度
+DEFAULT_COST = 1.0
+
+
+# --- 工作进程 ---
+
+def import_forked(kind, target, timeout):
+    """fork一个子进程导入目标，返回结果；超时的子进程被杀死。"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        result = {"status": "ok", "error": None}
+        started = time.perf_counter()
+        try:
+            if kind == "node":
+                result["node_classes"] = import_node(target)
+            else:
+                importlib.import_module(target)
+        except BaseException as e:
+            result.update(status="failed", error=f"{type(e).__name__}: {e}"[:1000])
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        os.write(write_fd, json.dumps(result).encode('utf-8'))
+        os._exit(0)
+
+    os.close(write_fd)
+    chunks = []
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            break
+        ready, _, _ = select.select([read_fd], [], [], remaining)
+        if ready:
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    os.close(read_fd)
+    if timed_out:
+        os.kill(pid, signal.SIGKILL)
+    _, status = os.waitpid(pid, 0)
+    if timed_out:
+        return {"status": "timeout", "seconds": round(timeout, 3), "error": f"导入超过 {timeout:.0f} 秒"}
+    try:
+        return json.loads(b"".join(chunks))
+    except ValueError:
+        detail = f"信号 {os.WTERMSIG(status)}" if os.WIFSIGNALED(status) else f"退出码 {os.waitstatus_to_exitcode(status)}"
+        return {"status": "crashed", "seconds": None, "error": f"导入子进程异常退出 ({detail})"}
+
+
+def run_worker(kind, preload, comfy_dir, comfy_args):
+    """工作进程入口：协议消息写到原来的stdout，其余输出全部转到stderr。"""
+    protocol = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    info = {"preload": {}, "error": None}
+    if kind == "node":
+        try:
+            bootstrap_comfyui(comfy_dir, comfy_args)
+        except BaseException as e:
+            info["error"] = f"ComfyUI初始化失败: {type(e).__name__}: {e}"[:1000]
+    else:
+        for name in preload:
+            started = time.perf_counter()
+            try:
+                importlib.import_module(name)
+                info["preload"][name] = round(time.perf_counter() - started, 3)
+            except BaseException as e:
+                # 预加载失败的模块会在子进程中重新导入，由冒烟测试本身报告失败
+                info["preload"][name] = f"{type(e).__name__}: {e}"[:200]
+    protocol.write(json.dumps(info) + "\n")
+    protocol.flush()
+
+    for line in sys.stdin:
+        task = json.loads(line)
+        result = import_forked(kind, task["target"], task["timeout"])
+        protocol.write(json.dumps(result) + "\n")
+        protocol.flush()
+    return 0
+
+
+class Worker:
+    """父进程中对一个工作进程的封装。"""
+
+    def __init__(self, kind, preload, comfy_dir, comfy_args):
+        self.command = [sys.executable, os.path.abspath(__file__), "_worker", kind,
+                        "--preload", ",".join(preload), "--comfy-dir", comfy_dir, "--comfy-args", *comfy_args]
+        self.proc = None
+        self.info = {}
+
+    def start(self, timeout):
+        env = dict(os.environ)
+        # 冒烟测试只在CPU上进行，避免导入时初始化CUDA
+        env.setdefault("CUDA_VISIBLE_DEVICES", "")
+        self.proc = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, text=True, env=env)
+        expired = threading.Event()
+
+        def kill():
+            expired.set()
+            self.proc.kill()
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            line = self.proc.stdout.readline()
+        finally:
+            timer.cancel()
+        if line:
+            self.info = json.loads(line)
+        elif expired.is_set():
+            # 启动时用完了剩余预算，不是导入失败
+            self.info = {"error": "工作进程启动超出时间预算", "status": "skipped"}
+        else:
+            self.info = {"error": f"工作进程启动失败，退出码 {self.proc.wait()}"}
+        return self.info
+
+    def run(self, target, timeout):
+        try:
+            self.proc.stdin.write(json.dumps({"target": target, "timeout": timeout}) + "\n")
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        except OSError:
+            line = ""
+        if not line:
+            self.stop()
+            return {"status": "crashed", "seconds": None, "error": "工作进程意外退出"}
+        return json.loads(line)
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+
+def run_targets(kind, targets, jobs, timeout, deadline, preload=(), comfy_dir=COMFYUI_DIR, comfy_args=COMFY_ARGS):
+    """在jobs个工作进程中导入targets（已按预计耗时排好序），返回 ({target: 结果}, 工作进程信息)。"""
+    queue = deque(targets)
+    results = {}
+    lock = threading.Lock()
+    worker_info = {}
+
+    def lane(_):
+        worker = None
+        while True:
+            with lock:
+                if not queue:
+                    break
+                target = queue.popleft()
+            remaining = deadline - time.monotonic()
+            if remaining <= 1:
+                results[target] = {"status": "skipped", "seconds": None, "error": "超出时间预算"}
+                continue
+            if worker is None:
+                worker = Worker(kind, preload, comfy_dir, comfy_args)
+                info = worker.start(remaining)
+                worker_info.setdefault("info", info)
+                if info.get("error"):
+                    # 工作进程无法初始化时，剩余条目都以同样的原因失败
+                    worker.stop()
+                    with lock:
+                        pending = [target] + list(queue)
+                        queue.clear()
+                    for name in pending:
+                        results[name] = {"status": info.get("status", "failed"), "seconds": None,
+                                         "error": info["error"]}
+                    break
+                # 工作进程启动占用了部分预算
+                remaining = deadline - time.monotonic()
+                if remaining <= 1:
+                    results[target] = {"status": "skipped", "seconds": None, "error": "超出时间预算"}
+                    continue
+            result = worker.run(target, min(timeout, remaining))
+            if result["status"] == "timeout" and remaining < timeout:
+                # 超时时间被剩余预算截短，不能视为导入失败
+                result.update(status="skipped", error="超出时间预算")
+            results[target] = result
+            if worker.proc is None:
+                worker = None
+        if worker is not None:
+            worker.stop()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(targets)))) as executor:
+        list(executor.map(lane, range(max(1, min(jobs, len(targets))))))
+    return results, worker_info.get("info", {})
+
+
+# --- 发现目标 ---
+
+def discover_modules():
+    """返回 {顶层模块: [发行包名]}，跳过私有模块、标准库同名模块和非包目录。"""
+    modules = {}
+    stdlib = getattr(sys, "stdlib_module_names", set())
+    for module, dists in importlib.metadata.packages_distributions().items():
+        if not module.isidentifier() or module.startswith("_") or module in SKIP_MODULES or module in stdlib:
+            continue
+        modules[module] = sorted(set(dists))
+    return modules
+
+
+def schedule(targets, baseline_entries):
+    """按基线耗时从长到短排序，耗时长的先开始，减少预算末尾的长尾。"""
+    def cost(target):
+        seconds = (baseline_entries.get(target) or {}).get("seconds")
+        return seconds if isinstance(seconds, (int, float)) else DEFAULT_COST
+    return sorted(targets, key=cost, reverse=True)
+
+
+# --- 报告与基线 ---
+
+def load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(data, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def compare(report, baseline):
+    """返回 (回归, 新增失败, 预算内未完成)，每项为 (类别, 名称, 条目) 列表。"""
+    regressions, new_failures, skipped = [], [], []
+    for section in ("modules", "nodes"):
+        previous = (baseline or {}).get(section, {})
+        for name, entry in report[section].items():
+            before = previous.get(name, {}).get("status")
+            if entry["status"] == "skipped":
+                skipped.append((section, name, entry))
+            elif entry["status"] in FAILED_STATUSES:
+                if before == "ok":
+                    regressions.append((section, name, entry))
+                elif before is None:
+                    new_failures.append((section, name, entry))
+    return regressions, new_failures, skipped
+
+
+def merge_baseline(report, baseline):
+    """新基线：本次结果，因预算未测试的条目保留旧基线中的记录。"""
+    merged = {"generated": report["generated"], "modules": {}, "nodes": {}}
+    for section in ("modules", "nodes"):
+        previous = (baseline or {}).get(section, {})
+        for name, entry in report[section].items():
+            if entry["status"] == "skipped" and name in previous:
+                merged[section][name] = previous[name]
+            else:
+                merged[section][name] = {"status": entry["status"], "seconds": entry["seconds"]}
+    return merged
+
+
+def log_summary(report):
+    for section, label in (("modules", "模块"), ("nodes", "节点")):
+        entries = report[section]
+        if not entries:
+            continue
+        counts = {}
+        for entry in entries.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        LOGGER.info(f"{label}: {len(entries)} 个 ({', '.join(f'{k} {v}' for k, v in sorted(counts.items()))})")
+        slowest = sorted(((entry["seconds"] or 0, name) for name, entry in entries.items()), reverse=True)[:10]
+        for seconds, name in slowest:
+            LOGGER.info(f"  {name[:50]:<50} {seconds:>8.2f}s")
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="已安装软件包与自定义节点的并行导入冒烟测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="导入所有模块和节点并与基线比较")
+    run_parser.add_argument("--jobs", type=int, default=JOBS, help="工作进程数")
+    run_parser.add_argument("--budget", type=float, default=BUDGET, help="总时间预算（秒）")
+    run_parser.add_argument("--timeout", type=float, default=IMPORT_TIMEOUT, help="单个模块或节点的导入超时（秒）")
+    run_parser.add_argument("--report", default=REPORT_FILE)
+    run_parser.add_argument("--baseline", default=BASELINE_FILE)
+    run_parser.add_argument("--update-baseline", action="store_true", help="没有回归（或使用--accept）时更新基线")
+    run_parser.add_argument("--accept", action="store_true", help="接受本次结果中的回归，不使构建失败")
+    run_parser.add_argument("--skip-modules", action="store_true", help="不测试已安装的软件包")
+    run_parser.add_argument("--skip-nodes", action="store_true", help="不测试自定义节点")
+    run_parser.add_argument("--nodes-dir", default=CUSTOM_NODES_DIR)
+    run_parser.add_argument("--comfy-dir", default=COMFYUI_DIR)
+    run_parser.add_argument("--comfy-args", nargs=argparse.REMAINDER, default=COMFY_ARGS,
+                            help="传给ComfyUI参数解析的参数（必须放在最后），默认 --cpu")
+
+    worker_parser = subparsers.add_parser("_worker")
+    worker_parser.add_argument("kind", choices=["module", "node"])
+    worker_parser.add_argument("--preload", default="")
+    worker_parser.add_argument("--comfy-dir", default=COMFYUI_DIR)
+    worker_parser.add_argument("--comfy-args", nargs=argparse.REMAINDER, default=[])
+
+    args = parser.parse_args(argv)
+
+    if args.command == "_worker":
+        return run_worker(args.kind, [name for name in args.preload.split(",") if name],
+                          args.comfy_dir, args.comfy_args)
+
+    started = time.monotonic()
+    deadline = started + args.budget
+    baseline = load_json(args.baseline)
+    report = {"generated": time.time(), "budget": args.budget, "timeout": args.timeout,
+              "preload": {}, "modules": {}, "nodes": {}}
+
+    if not args.skip_modules:
+        modules = discover_modules()
+        LOGGER.info(f"使用 {args.jobs} 个工作进程导入 {len(modules)} 个顶层模块（预加载: {', '.join(PRELOAD) or '无'}）...")
+        targets = schedule(modules, (baseline or {}).get("modules", {}))
+        results, info = run_targets("module", targets, args.jobs, args.timeout, deadline, preload=PRELOAD)
+        report["preload"] = info.get("preload", {})
+        for module, result in results.items():
+            report["modules"][module] = {"distributions": modules[module], **result}
+
+    if not args.skip_nodes and os.path.isdir(args.nodes_dir):
+        paths = {os.path.basename(path): path for path in find_nodes(args.nodes_dir)}
+        LOGGER.info(f"使用 {args.jobs} 个工作进程导入 {len(paths)} 个自定义节点...")
+        targets = schedule(paths, (baseline or {}).get("nodes", {}))
+        results, _ = run_targets("node", [paths[name] for name in targets], args.jobs, args.timeout, deadline,
+                                 comfy_dir=args.comfy_dir, comfy_args=args.comfy_args)
+        for name, path in paths.items():
+            report["nodes"][name] = {"path": path, **results[path]}
+
+    report["wall_time"] = round(time.monotonic() - started, 3)
+    regressions, new_failures, skipped = compare(report, baseline)
+    report["regressions"] = [f"{section}:{name}" for section, name, _ in regressions]
+    write_json(report, args.report)
+    log_summary(report)
+    LOGGER.info(f"导入冒烟测试耗时 {report['wall_time']:.1f} 秒（预算 {args.budget:.0f} 秒），报告: {args.report}")
+
+    for section, name, entry in new_failures:
+        LOGGER.warning(f"✗ {section}:{name} 导入失败（基线中没有记录）: {entry['error']}")
+    if skipped:
+        LOGGER.warning(f"{len(skipped)} 个条目因超出时间预算未测试: "
+                       f"{', '.join(f'{section}:{name}' for section, name, _ in skipped[:20])}")
+    for section, name, entry in regressions:
+        LOGGER.error(f"✗ 回归 {section}:{name} ({entry['status']}): {entry['error']}")
+    if baseline is None:
+        LOGGER.info(f"没有基线 {args.baseline}，本次不检查回归。")
+
+    if args.update_baseline and (not regressions or args.accept):
+        write_json(merge_baseline(report, baseline), args.baseline)
+        LOGGER.info(f"基线已更新: {args.baseline}")
+    if regressions and not args.accept:
+        LOGGER.error(f"✗ 发现 {len(regressions)} 个导入回归，使用 --accept 接受本次结果。")
+        return 1
+    LOGGER.info("✓ 导入冒烟测试通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+并发地克隆 custom_nodes.json 中列出的所有自定义节点仓库。
+
+与 install_custom_nodes.sh 相比：
+1. 使用有界的线程池并发克隆，而不是逐个克隆。
+2. 失败时使用带随机抖动的指数退避重试，而不是固定的5秒等待。
+3. 节点声明了 exclude 路径时，使用 blob 过滤 + 稀疏检出，
+   被排除的大文件（例如示例素材）根本不会被下载。
+4. 为每个仓库记录耗时和占用字节数，并写入JSON报告。
+5. 在 custom_nodes.json 旁边生成 custom_nodes.lock.json，记录每个仓库解析到的提交。
+   使用 --update 时，只对远程HEAD与锁文件不一致的仓库执行浅层fetch，
+   并且只有 requirements*.txt 发生变化时才重新解析依赖。
+
+custom_nodes.json 中的每一项可以是仓库URL字符串，也可以是对象：
+    {"url": "https://github.com/xxx/yyy.git", "exclude": ["assets/", "examples/"], "ref": "main"}
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from build_trace import Tracer
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+TRACER = Tracer("install_custom_nodes")
+
+# --- 配置 ---
+JSON_CONFIG = "/app/custom_nodes.json"
+TARGET_DIR = "/app/custom_nodes"
+REPORT_FILE = "/app/custom_nodes_install_report.json"
+# 依赖构建脚本，更新后requirements发生变化时调用
+BUILD_DEPENDENCIES_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build_dependencies.py")
+
+# 扫描requirements文件时跳过的目录
+SKIP_DIRS = {".git", "node_modules", "__pycache__", ".venv", "venv"}
+
+# 未找到JSON配置文件时使用的默认节点列表
+DEFAULT_REPOS = [
+    "https://github.com/Comfy-Org/ComfyUI-Manager.git"
+]
+
+# 同时进行的克隆数量
+CLONE_JOBS = int(os.environ.get("CLONE_JOBS", "8"))
+MAX_RETRIES = 3
+# 指数退避的基础等待时间（秒）：base * 2^attempt + 抖动
+BACKOFF_BASE = 2.0
+# 单次git操作的超时时间（秒）
+GIT_TIMEOUT = 1800
+
+
+def repo_name_from_url(url):
+    """从仓库URL推断目录名。"""
+    name = url.rstrip("/").rsplit("/", 1)[-1]
+    return name[:-4] if name.endswith(".git") else name
+
+
+def load_node_specs(config_path):
+    """读取节点配置，统一转换为 {name, url, exclude, ref} 字典列表。"""
+    if not os.path.exists(config_path):
+        LOGGER.info("未找到JSON配置文件，使用默认配置")
+        entries = DEFAULT_REPOS
+    else:
+        LOGGER.info(f"使用JSON配置文件: {config_path}")
+        with open(config_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+
+    specs = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"url": entry}
+        specs.append({
+            "name": entry.get("name") or repo_name_from_url(entry["url"]),
+            "url": entry["url"],
+            "exclude": list(entry.get("exclude", [])),
+            "ref": entry.get("ref"),
+        })
+    return specs
+
+
+def directory_size(path):
+    """统计目录下所有文件占用的字节数（不跟随符号链接）。"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def run_git(args, cwd=None):
+    """运行git命令，失败时抛出CalledProcessError。"""
+    return subprocess.run(["git"] + args, cwd=cwd, check=True, capture_output=True,
+                          text=True, timeout=GIT_TIMEOUT)
+
+
+def sparse_patterns(exclude):
+    """把exclude路径转换为非cone模式的稀疏检出规则。"""
+    return ["/*"] + [f"!/{path.strip('/')}/" if path.endswith("/") else f"!/{path.strip('/')}"
+                     for path in exclude]
+
+
+def clone_once(spec, dest):
+    """执行一次克隆；有排除路径时使用blob过滤和稀疏检出。"""
+    command = ["clone", "--depth=1"]
+    if spec["ref"]:
+        command += ["--branch", spec["ref"]]
+    if spec["exclude"]:
+        command += ["--filter=blob:none", "--no-checkout"]
+    run_git(command + [spec["url"], dest])
+
+    if spec["exclude"]:
+        run_git(["sparse-checkout", "set", "--no-cone"] + sparse_patterns(spec["exclude"]), cwd=dest)
+        run_git(["checkout"], cwd=dest)
+
+
+def lockfile_path(config_path):
+    """锁文件与节点配置文件放在同一目录下。"""
+    return os.path.splitext(config_path)[0] + ".lock.json"
+
+
+def load_lockfile(lock_path):
+    """读取锁文件，返回 {name: {url, ref, commit}}。"""
+    if not os.path.exists(lock_path):
+        return {}
+    try:
+        with open(lock_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("repos", {})
+    except (OSError, ValueError) as e:
+        LOGGER.warning(f"读取锁文件失败: {lock_path}. 错误: {e}")
+        return {}
+
+
+def write_lockfile(lock_path, specs, results, previous=None):
+    """根据本次的结果更新锁文件；没有新提交信息的仓库保留原有记录。"""
+    previous = previous or {}
+    by_name = {r["name"]: r for r in results}
+    repos = {}
+    for spec in specs:
+        commit = by_name.get(spec["name"], {}).get("commit") or previous.get(spec["name"], {}).get("commit")
+        if commit:
+            repos[spec["name"]] = {"url": spec["url"], "ref": spec["ref"], "commit": commit}
+    with open(lock_path, 'w', encoding='utf-8') as f:
+        json.dump({"repos": repos}, f, indent=2, sort_keys=True)
+    LOGGER.info(f"锁文件已更新: {lock_path} ({len(repos)} 个仓库)")
+
+
+def local_commit(path):
+    """返回本地仓库的HEAD提交，不是git仓库时返回None。"""
+    if not os.path.isdir(os.path.join(path, ".git")):
+        return None
+    try:
+        return run_git(["rev-parse", "HEAD"], cwd=path).stdout.strip()
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return None
+
+
+def requirement_hashes(path):
+    """计算节点目录下所有requirements*.txt文件的哈希。"""
+    hashes = {}
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for filename in files:
+            if filename.startswith("requirements") and filename.endswith(".txt"):
+                file_path = os.path.join(root, filename)
+                with open(file_path, 'rb') as f:
+                    hashes[os.path.relpath(file_path, path)] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def remote_commit(spec):
+    """使用一次ls-remote获取远程分支（或HEAD）当前指向的提交。"""
+    output = run_git(["ls-remote", spec["url"], spec["ref"] or "HEAD"]).stdout
+    for line in output.splitlines():
+        sha, _, ref = line.partition("\t")
+        if sha:
+            return sha
+    raise subprocess.CalledProcessError(1, "git ls-remote", stderr=f"远程仓库中找不到 {spec['ref'] or 'HEAD'}")
+
+
+def fetch_update(spec, dest):
+    """
+    以浅层fetch把节点目录更新到远程最新提交。
+
+    镜像构建时会删除.git目录，此时就地重新初始化仓库再fetch，
+    只覆盖受版本控制的文件，节点目录中下载的模型等未跟踪文件会被保留。
+    """
+    if not os.path.isdir(os.path.join(dest, ".git")):
+        run_git(["init", "-q"], cwd=dest)
+        run_git(["remote", "add", "origin", spec["url"]], cwd=dest)
+    if spec["exclude"]:
+        run_git(["sparse-checkout", "set", "--no-cone"] + sparse_patterns(spec["exclude"]), cwd=dest)
+    fetch = ["fetch", "--depth=1"]
+    if spec["exclude"]:
+        fetch.append("--filter=blob:none")
+    run_git(fetch + ["origin", spec["ref"] or "HEAD"], cwd=dest)
+    run_git(["reset", "-q", "--hard", "FETCH_HEAD"], cwd=dest)
+    return run_git(["rev-parse", "HEAD"], cwd=dest).stdout.strip()
+
+
+def update_repo(spec, target_dir, locked):
+    """检查并更新单个仓库，返回报告条目（包含requirements是否变化）。"""
+    dest = os.path.join(target_dir, spec["name"])
+    if os.path.isdir(dest + ".disabled") and not os.path.exists(dest):
+        # 被禁用列表禁用的节点（见 profile_custom_nodes.py），不重新克隆
+        LOGGER.info(f"{spec['name']} 已禁用，跳过更新")
+        return {"name": spec["name"], "url": spec["url"], "status": "disabled", "attempts": 0,
+                "duration": 0.0, "bytes": 0, "commit": locked.get("commit"), "error": None,
+                "requirements_changed": False}
+    if not (os.path.isdir(dest) and os.listdir(dest)):
+        result = clone_repo(spec, target_dir)
+        result["requirements_changed"] = result["status"] == "cloned"
+        return result
+
+    result = {
+        "name": spec["name"],
+        "url": spec["url"],
+        "status": "failed",
+        "attempts": 1,
+        "duration": 0.0,
+        "bytes": 0,
+        "commit": None,
+        "error": None,
+        "requirements_changed": False,
+    }
+    started = time.time()
+    try:
+        with TRACER.span(f"ls-remote {spec['name']}", "clone", url=spec["url"]):
+            remote = remote_commit(spec)
+        current = local_commit(dest) or locked.get("commit")
+        if remote == current:
+            result.update(status="up-to-date", commit=remote)
+        else:
+            before = requirement_hashes(dest)
+            with TRACER.span(f"fetch {spec['name']}", "clone", url=spec["url"]):
+                result["commit"] = fetch_update(spec, dest)
+            result["status"] = "updated"
+            result["requirements_changed"] = requirement_hashes(dest) != before
+            LOGGER.info(f"✓ {spec['name']} 已更新: {(current or '未知')[:10]} -> {result['commit'][:10]}"
+                        + (" (requirements已变化)" if result["requirements_changed"] else ""))
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+        result["error"] = (getattr(e, "stderr", None) or str(e)).strip()[-500:]
+        LOGGER.error(f"✗ 更新 {spec['name']} 失败: {result['error']}")
+    result["duration"] = round(time.time() - started, 3)
+    return result
+
+
+def update_nodes(specs, target_dir, lock, jobs=CLONE_JOBS):
+    """并发检查所有节点，只对远程提交与锁文件不一致的仓库执行fetch。"""
+    LOGGER.info(f"正在使用 {jobs} 个并发任务检查 {len(specs)} 个自定义节点的更新...")
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(lambda spec: update_repo(spec, target_dir, lock.get(spec["name"], {})), specs))
+
+
+def clone_repo(spec, target_dir, retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+    """克隆单个仓库并返回该仓库的报告条目。"""
+    dest = os.path.join(target_dir, spec["name"])
+    result = {
+        "name": spec["name"],
+        "url": spec["url"],
+        "status": "failed",
+        "attempts": 0,
+        "duration": 0.0,
+        "bytes": 0,
+        "commit": None,
+        "error": None,
+    }
+
+    if os.path.isdir(dest) and os.listdir(dest):
+        LOGGER.info(f"{spec['name']} 已存在，跳过克隆。")
+        result.update(status="exists", bytes=directory_size(dest), commit=local_commit(dest))
+        return result
+
+    partial = os.path.join(target_dir, f".{spec['name']}.partial")
+    started = time.time()
+    for attempt in range(retries):
+        result["attempts"] = attempt + 1
+        shutil.rmtree(partial, ignore_errors=True)
+        try:
+            LOGGER.info(f"正在克隆 {spec['name']}... (第 {attempt + 1}/{retries} 次尝试)")
+            with TRACER.span(f"clone {spec['name']}", "clone", url=spec["url"], attempt=attempt + 1):
+                clone_once(spec, partial)
+            result["commit"] = run_git(["rev-parse", "HEAD"], cwd=partial).stdout.strip()
+            os.replace(partial, dest)
+            result["status"] = "cloned"
+            result["error"] = None
+            break
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+            result["error"] = (getattr(e, "stderr", None) or str(e)).strip()[-500:]
+            if attempt + 1 == retries:
+                break
+            sleep_time = backoff_base * (2 ** attempt) + random.uniform(0, backoff_base)
+            LOGGER.warning(f"克隆 {spec['name']} 失败。{sleep_time:.1f}秒后重试...")
+            with TRACER.span("backoff", "backoff", seconds=round(sleep_time, 3), repo=spec["name"]):
+                time.sleep(sleep_time)
+
+    shutil.rmtree(partial, ignore_errors=True)
+    result["duration"] = round(time.time() - started, 3)
+    if result["status"] == "cloned":
+        result["bytes"] = directory_size(dest)
+        LOGGER.info(f"✓ {spec['name']} 克隆成功 ({result['duration']:.1f}秒, {result['bytes'] / 1024 / 1024:.1f} MB)")
+    else:
+        LOGGER.error(f"✗ {spec['name']} 克隆失败，已重试 {retries} 次: {result['error']}")
+    return result
+
+
+def install_nodes(specs, target_dir, jobs=CLONE_JOBS, retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+    """并发克隆所有节点，按配置顺序返回各仓库的报告条目。"""
+    os.makedirs(target_dir, exist_ok=True)
+    LOGGER.info(f"将使用 {jobs} 个并发任务安装 {len(specs)} 个自定义节点到目录: {target_dir}")
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(lambda spec: clone_repo(spec, target_dir, retries, backoff_base), specs))
+
+
+def write_report(results, report_path, wall_time):
+    """写入JSON报告：每个仓库的耗时与字节数，以及汇总信息。"""
+    summary = {
+        "total": len(results),
+        "succeeded": sum(1 for r in results if r["status"] in ("cloned", "exists", "updated", "up-to-date")),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "wall_time": round(wall_time, 3),
+        "clone_time": round(sum(r["duration"] for r in results), 3),
+        "bytes": sum(r["bytes"] for r in results),
+    }
+    report = {"summary": summary, "repos": results}
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    LOGGER.info(f"安装报告已写入: {report_path}")
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="并发克隆自定义节点仓库")
+    parser.add_argument("--config", default=JSON_CONFIG, help="节点配置JSON文件")
+    parser.add_argument("--target", default=TARGET_DIR, help="克隆目标目录")
+    parser.add_argument("--jobs", type=int, default=CLONE_JOBS, help="并发克隆数量")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES, help="每个仓库的最大尝试次数")
+    parser.add_argument("--backoff", type=float, default=BACKOFF_BASE, help="指数退避的基础等待秒数")
+    parser.add_argument("--report", default=REPORT_FILE, help="JSON报告输出路径")
+    parser.add_argument("--update", action="store_true",
+                        help="更新已安装的节点：只fetch远程提交与锁文件不一致的仓库")
+    parser.add_argument("--resolve-dependencies", action="store_true",
+                        help="更新后若有requirements变化，则运行build_dependencies.py增量安装依赖")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+    specs = load_node_specs(args.config)
+    lock_path = lockfile_path(args.config)
+    lock = load_lockfile(lock_path)
+
+    started = time.time()
+    with TRACER.span("update_nodes" if args.update else "install_nodes", "total", repos=len(specs)):
+        if args.update:
+            results = update_nodes(specs, args.target, lock, args.jobs)
+        else:
+            results = install_nodes(specs, args.target, args.jobs, args.retries, args.backoff)
+    TRACER.save()
+    summary = write_report(results, args.report, time.time() - started)
+    write_lockfile(lock_path, specs, results, lock)
+
+    LOGGER.info("================================================================")
+    LOGGER.info("自定义节点更新完成" if args.update else "自定义节点安装完成")
+    LOGGER.info(f"成功: {summary['succeeded']}/{summary['total']}，"
+                f"总耗时 {summary['wall_time']:.1f}秒 (累计克隆耗时 {summary['clone_time']:.1f}秒)")
+
+    if args.update:
+        changed = [r["name"] for r in results if r.get("requirements_changed")]
+        if changed:
+            LOGGER.info(f"以下节点的requirements发生变化: {changed}")
+            if args.resolve_dependencies:
+                LOGGER.info("正在增量解析并安装依赖...")
+                subprocess.run([sys.executable, BUILD_DEPENDENCIES_SCRIPT], check=False)
+        else:
+            LOGGER.info("没有节点的requirements发生变化，跳过依赖解析。")
+
+    if summary["failed"]:
+        LOGGER.warning(f"有 {summary['failed']} 个节点安装失败，已跳过")
+        # 仅在所有节点都安装失败时才以错误退出
+        if summary["succeeded"] == 0:
+            LOGGER.error("所有节点都安装失败，请检查网络连接")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+离线自定义节点包的流式安装与打包。
+
+旧的 install_custom_nodes_local.sh 先把zip解压到临时目录再 cp -rT 到 custom_nodes，
+每个字节写两次、需要两倍磁盘。本脚本：
+
+install: 把归档中的条目直接写到最终位置，边写边计算sha256。
+         - zip：每个条目独立压缩，多个线程各自打开归档并行解压；
+         - tar.zst：解压流是顺序的，主线程读取条目，小文件交给线程池写盘，大文件直接流式写入。
+           有 zstandard 模块时使用它，否则通过 zstd 命令行解压。
+         - 归档中只有一个顶层 custom_nodes/ 目录时自动去掉该前缀。
+         - 归档内嵌清单（.bundle_manifest.json）记录每个文件的sha256和权限，
+           写入时直接设置权限并校验内容，不需要事后再遍历目录修正权限。
+build:   把节点目录打包为带清单的zip或tar.zst（清单放在归档的第一个条目）。
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import shutil
+import stat
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+BUNDLE_CANDIDATES = ["/app/custom_nodes.tar.zst", "/app/custom_nodes.zip"]
+DEST_DIR = "/app/custom_nodes"
+MANIFEST_NAME = ".bundle_manifest.json"
+MANIFEST_VERSION = 1
+NESTED_PREFIX = "custom_nodes/"
+JOBS = int(os.environ.get("NODE_BUNDLE_JOBS", str(min(8, os.cpu_count() or 1))))
+CHUNK_SIZE = 1024 * 1024
+# tar流中不超过该大小的文件读入内存后交给线程池写盘，更大的文件在主线程中流式写入
+INLINE_LIMIT = 8 * 1024 * 1024
+ZSTD_LEVEL = 10
+ZIP_MAGIC = (b"PK\x03\x04", b"PK\x05\x06")
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def human_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+
+def detect_format(path):
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic in ZIP_MAGIC:
+        return "zip"
+    if magic == ZSTD_MAGIC:
+        return "tar.zst"
+    # 其他格式（tar、tar.gz等）交给tarfile自动识别
+    return "tar"
+
+
+def member_path(name, prefix=""):
+    """把归档中的条目名转换为相对于目标目录的路径，拒绝绝对路径和 .. 路径。"""
+    name = name.replace("\\", "/")
+    if name.startswith("/") or (len(name) > 1 and name[1] == ":"):
+        raise ValueError(f"不安全的路径: {name}")
+    rel = posixpath.normpath(name)
+    if rel == ".." or rel.startswith("../"):
+        raise ValueError(f"不安全的路径: {name}")
+    if rel == ".":
+        return ""
+    if prefix:
+        if rel == prefix.rstrip("/"):
+            return ""
+        if rel.startswith(prefix):
+            rel = rel[len(prefix):]
+    return rel
+
+
+def nested_prefix(names):
+    """所有条目都在唯一的顶层 custom_nodes 目录下时返回该前缀。"""
+    tops = {posixpath.normpath(name.replace("\\", "/")).split("/", 1)[0] for name in names}
+    tops.discard(".")
+    return NESTED_PREFIX if tops == {NESTED_PREFIX.rstrip("/")} else ""
+
+
+@contextlib.contextmanager
+def zstd_reader(path):
+    """返回解压后的字节流：优先使用zstandard模块，否则使用zstd命令行。"""
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+    if zstandard is not None:
+        with open(path, 'rb') as f:
+            with zstandard.ZstdDecompressor().stream_reader(f, read_size=CHUNK_SIZE) as reader:
+                yield reader
+        return
+    if not shutil.which("zstd"):
+        raise RuntimeError("解压tar.zst需要 zstandard 模块或 zstd 命令")
+    proc = subprocess.Popen(["zstd", "-dcq", path], stdout=subprocess.PIPE)
+    try:
+        yield proc.stdout
+    finally:
+        proc.stdout.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"zstd 解压失败，退出码 {proc.returncode}")
+
+
+@contextlib.contextmanager
+def zstd_writer(path, level):
+    """返回写入后即被压缩到path的字节流，使用全部CPU线程压缩。"""
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+    if zstandard is not None:
+        with open(path, 'wb') as f:
+            compressor = zstandard.ZstdCompressor(level=level, threads=-1)
+            with compressor.stream_writer(f, closefd=False) as writer:
+                yield writer
+        return
+    if not shutil.which("zstd"):
+        raise RuntimeError("生成tar.zst需要 zstandard 模块或 zstd 命令")
+    proc = subprocess.Popen(["zstd", "-T0", f"-{min(level, 19)}", "-qfo", path], stdin=subprocess.PIPE)
+    try:
+        yield proc.stdin
+    finally:
+        proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"zstd 压缩失败，退出码 {proc.returncode}")
+
+
+class HashingReader:
+    """读取时计算sha256的文件包装。"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+
+class BundleInstaller:
+    """把归档条目写到目标目录并按清单校验。"""
+
+    def __init__(self, dest, jobs=JOBS):
+        self.dest = os.path.abspath(dest)
+        self.dest_real = None
+        self.jobs = max(1, jobs)
+        self.manifest = None
+        self.lock = threading.Lock()
+        self.errors = []
+        self.failed = set()
+        self.installed = {}
+        self.dir_modes = {}
+        self.links = []
+        self.bytes_written = 0
+
+    def error(self, message, rel=None):
+        with self.lock:
+            self.errors.append(message)
+            if rel:
+                self.failed.add(rel)
+        LOGGER.error(f"✗ {message}")
+
+    def set_manifest(self, data):
+        manifest = json.loads(data)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"不支持的清单版本: {manifest.get('version')}")
+        self.manifest = manifest
+        self.dir_modes.update(manifest.get("dirs", {}))
+        LOGGER.info(f"归档清单: {len(manifest.get('files', {}))} 个文件，"
+                    f"{human_size(sum(f['size'] for f in manifest.get('files', {}).values()))}")
+
+    def target(self, rel):
+        """返回rel在目标目录中的路径并创建父目录；父目录经软链接指向目标目录之外时拒绝写入。"""
+        path = os.path.join(self.dest, rel)
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        real_parent = os.path.realpath(parent)
+        if real_parent != self.dest_real and not real_parent.startswith(self.dest_real + os.sep):
+            raise ValueError(f"{rel} 的父目录指向目标目录之外: {real_parent}")
+        if os.path.islink(path) or (os.path.lexists(path) and not os.path.isdir(path)):
+            os.unlink(path)
+        elif os.path.isdir(path):
+            raise ValueError(f"{rel} 在目标目录中是一个目录")
+        return path
+
+    def file_mode(self, rel, archive_mode):
+        if self.manifest and rel in self.manifest["files"]:
+            return self.manifest["files"][rel]["mode"]
+        return archive_mode or 0o644
+
+    def write_file(self, rel, source, archive_mode):
+        """把source流写到最终位置，写入时计算sha256并与清单比对。"""
+        try:
+            path = self.target(rel)
+            digest = hashlib.sha256()
+            size = 0
+            with open(path, 'wb') as f:
+                if isinstance(source, bytes):
+                    digest.update(source)
+                    f.write(source)
+                    size = len(source)
+                else:
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+            os.chmod(path, self.file_mode(rel, archive_mode) & 0o7777)
+            sha = digest.hexdigest()
+            expected = self.manifest["files"].get(rel) if self.manifest else None
+            if expected and expected["sha256"] != sha:
+                os.unlink(path)
+                self.error(f"{rel}: 校验和不一致（期望 {expected['sha256'][:12]}，实际 {sha[:12]}）", rel)
+                return
+            with self.lock:
+                self.installed[rel] = sha
+                self.bytes_written += size
+        except Exception as e:
+            self.error(f"{rel}: {e}", rel)
+
+    def make_dir(self, rel, mode):
+        if not rel:
+            return
+        try:
+            path = os.path.join(self.dest, rel)
+            if os.path.islink(path) or (os.path.lexists(path) and not os.path.isdir(path)):
+                os.unlink(path)
+            os.makedirs(path, exist_ok=True)
+            # 目录权限在全部写入后设置，避免只读目录导致后续写入失败
+            self.dir_modes.setdefault(rel, mode or 0o755)
+        except Exception as e:
+            self.error(f"{rel}/: {e}")
+
+    def finish_links(self):
+        """所有文件写完后再创建软链接和硬链接，文件写入不会经过归档中的链接。"""
+        for kind, rel, target in self.links:
+            try:
+                path = self.target(rel)
+                if kind == "symlink":
+                    os.symlink(target, path)
+                else:
+                    os.link(os.path.join(self.dest, target), path)
+                    with self.lock:
+                        self.installed[rel] = self.installed.get(target)
+            except Exception as e:
+                self.error(f"{rel}: 创建链接失败: {e}")
+
+    def finish_dirs(self):
+        # 由深到浅设置，父目录变为只读也不影响子目录
+        for rel in sorted(self.dir_modes, key=lambda r: r.count("/"), reverse=True):
+            path = os.path.join(self.dest, rel)
+            if os.path.isdir(path) and not os.path.islink(path):
+                os.chmod(path, self.dir_modes[rel] & 0o7777)
+
+    def verify(self):
+        """对比清单：缺少的文件、多出的文件和链接目标。"""
+        if not self.manifest:
+            LOGGER.warning("归档中没有清单，无法校验内容，权限按归档中的记录设置")
+            return
+        expected_files = set(self.manifest["files"])
+        missing = expected_files - set(self.installed)
+        extra = set(self.installed) - expected_files - set(self.manifest.get("symlinks", {}))
+        for rel in sorted(missing - self.failed):
+            self.error(f"{rel}: 清单中有但归档中缺少")
+        for rel in sorted(extra):
+            self.error(f"{rel}: 不在清单中")
+        for rel, target in self.manifest.get("symlinks", {}).items():
+            path = os.path.join(self.dest, rel)
+            if not os.path.islink(path) or os.readlink(path) != target:
+                self.error(f"{rel}: 软链接与清单不一致（期望指向 {target}）")
+
+    def install_zip(self, path):
+        with zipfile.ZipFile(path) as zf:
+            infos = zf.infolist()
+            prefix = nested_prefix(info.filename for info in infos)
+            if prefix:
+                LOGGER.info(f"检测到嵌套的 '{prefix}' 目录，安装时去掉该前缀")
+            members = []
+            for info in infos:
+                try:
+                    rel = member_path(info.filename, prefix)
+                except ValueError as e:
+                    self.error(str(e))
+                    continue
+                if rel == MANIFEST_NAME:
+                    self.set_manifest(zf.read(info))
+                elif rel:
+                    members.append((rel, info))
+
+        files = []
+        for rel, info in members:
+            mode = info.external_attr >> 16
+            if info.is_dir():
+                self.make_dir(rel.rstrip("/"), stat.S_IMODE(mode))
+            elif stat.S_ISLNK(mode):
+                files.append((rel, info, "symlink"))
+            else:
+                files.append((rel, info, "file"))
+        # 大文件先开始，线程之间负载更均衡
+        files.sort(key=lambda item: item[1].file_size, reverse=True)
+
+        local = threading.local()
+        handles = []
+
+        def extract(item):
+            rel, info, kind = item
+            if not hasattr(local, "zf"):
+                local.zf = zipfile.ZipFile(path)
+                with self.lock:
+                    handles.append(local.zf)
+            if kind == "symlink":
+                target = local.zf.read(info).decode('utf-8')
+                with self.lock:
+                    self.links.append(("symlink", rel, target))
+                return
+            try:
+                with local.zf.open(info) as source:
+                    self.write_file(rel, source, stat.S_IMODE(info.external_attr >> 16))
+            except Exception as e:
+                self.error(f"{rel}: {e}")
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                list(executor.map(extract, files))
+        finally:
+            for handle in handles:
+                handle.close()
+
+    def install_tar(self, fileobj):
+        pending = []
+        # 限制读入内存但尚未写盘的小文件数量
+        slots = threading.BoundedSemaphore(self.jobs * 2)
+        prefix = None
+
+        def write_and_release(rel, data, mode):
+            try:
+                self.write_file(rel, data, mode)
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor, \
+                tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+            for member in tar:
+                if prefix is None and posixpath.normpath(member.name) != ".":
+                    # 流式读取无法预先查看全部条目，按第一个条目判断是否有嵌套前缀
+                    prefix = nested_prefix([member.name])
+                    if prefix:
+                        LOGGER.info(f"检测到嵌套的 '{prefix}' 目录，安装时去掉该前缀")
+                try:
+                    rel = member_path(member.name, prefix or "")
+                except ValueError as e:
+                    self.error(str(e))
+                    continue
+                if not rel:
+                    continue
+                if rel == MANIFEST_NAME and member.isfile():
+                    self.set_manifest(tar.extractfile(member).read())
+                    continue
+                if member.isdir():
+                    self.make_dir(rel, member.mode)
+                elif member.issym():
+                    self.links.append(("symlink", rel, member.linkname))
+                elif member.islnk():
+                    try:
+                        self.links.append(("hardlink", rel, member_path(member.linkname, prefix or "")))
+                    except ValueError as e:
+                        self.error(str(e))
+                elif member.isfile():
+                    source = tar.extractfile(member)
+                    if member.size <= INLINE_LIMIT:
+                        data = source.read()
+                        slots.acquire()
+                        pending.append(executor.submit(write_and_release, rel, data, member.mode))
+                    else:
+                        self.write_file(rel, source, member.mode)
+                else:
+                    LOGGER.warning(f"跳过不支持的条目类型: {member.name}")
+            for future in pending:
+                future.result()
+
+    def install(self, bundle):
+        start = time.time()
+        os.makedirs(self.dest, exist_ok=True)
+        self.dest_real = os.path.realpath(self.dest)
+        fmt = detect_format(bundle)
+        LOGGER.info(f"安装节点包 {bundle} ({fmt}, {human_size(os.path.getsize(bundle))}) 到 {self.dest}，"
+                    f"{self.jobs} 个并发")
+        if fmt == "zip":
+            self.install_zip(bundle)
+        elif fmt == "tar.zst":
+            with zstd_reader(bundle) as stream:
+                self.install_tar(stream)
+        else:
+            with open(bundle, 'rb') as f:
+                self.install_tar(f)
+        self.finish_links()
+        self.verify()
+        self.finish_dirs()
+        elapsed = max(time.time() - start, 1e-6)
+        LOGGER.info(f"写入 {len(self.installed)} 个文件，{human_size(self.bytes_written)}，"
+                    f"耗时 {elapsed:.1f} 秒 ({human_size(self.bytes_written / elapsed)}/s)")
+        return not self.errors
+
+
+# --- 打包 ---
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def collect_tree(src, include_git=False):
+    """返回 (目录, 文件, 软链接) 列表，路径均为相对于src的posix路径。"""
+    dirs, files, symlinks = [], [], []
+    for root, dirnames, filenames in os.walk(src):
+        if not include_git and ".git" in dirnames:
+            dirnames.remove(".git")
+        dirnames.sort()
+        rel_root = os.path.relpath(root, src).replace(os.sep, "/")
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        for name in list(dirnames):
+            path = os.path.join(root, name)
+            if os.path.islink(path):
+                # 指向目录的软链接按软链接保存，不进入
+                dirnames.remove(name)
+                symlinks.append(rel_root + name)
+            else:
+                dirs.append(rel_root + name)
+        for name in sorted(filenames):
+            if not include_git and name == ".git":
+                continue
+            rel = rel_root + name
+            if rel == MANIFEST_NAME:
+                continue
+            path = os.path.join(root, name)
+            if os.path.islink(path):
+                symlinks.append(rel)
+            elif os.path.isfile(path):
+                files.append(rel)
+    return dirs, files, symlinks
+
+
+def build_manifest(src, dirs, files, symlinks, jobs=JOBS):
+    def describe(rel):
+        path = os.path.join(src, rel)
+        st = os.stat(path)
+        return rel, {"sha256": sha256_file(path), "size": st.st_size, "mode": stat.S_IMODE(st.st_mode)}
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        described = dict(executor.map(describe, files))
+    return {
+        "version": MANIFEST_VERSION,
+        "created": time.time(),
+        "files": described,
+        "dirs": {rel: stat.S_IMODE(os.stat(os.path.join(src, rel)).st_mode) for rel in dirs},
+        "symlinks": {rel: os.readlink(os.path.join(src, rel)) for rel in symlinks},
+    }
+
+
+def check_hash(rel, reader, manifest):
+    if reader.digest.hexdigest() != manifest["files"][rel]["sha256"]:
+        raise RuntimeError(f"{rel} 在打包过程中被修改")
+
+
+def write_zip(out, src, manifest, level):
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=level) as zf:
+        zf.writestr(MANIFEST_NAME, json.dumps(manifest, indent=1))
+        for rel, mode in manifest["dirs"].items():
+            info = zipfile.ZipInfo(rel + "/")
+            info.external_attr = ((stat.S_IFDIR | mode) << 16) | 0x10
+            zf.writestr(info, b"")
+        for rel, entry in manifest["files"].items():
+            path = os.path.join(src, rel)
+            info = zipfile.ZipInfo.from_file(path, rel)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = (stat.S_IFREG | entry["mode"]) << 16
+            with open(path, 'rb') as f, zf.open(info, 'w', force_zip64=entry["size"] > 2 ** 31) as dest:
+                reader = HashingReader(f)
+                shutil.copyfileobj(reader, dest, CHUNK_SIZE)
+            check_hash(rel, reader, manifest)
+        for rel, target in manifest["symlinks"].items():
+            info = zipfile.ZipInfo(rel)
+            info.external_attr = (stat.S_IFLNK | 0o777) << 16
+            zf.writestr(info, target)
+
+
+def write_tar(stream, src, manifest):
+    with tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+        data = json.dumps(manifest, indent=1).encode('utf-8')
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size, info.mode, info.mtime = len(data), 0o644, int(manifest["created"])
+        tar.addfile(info, io.BytesIO(data))
+        for rel, mode in manifest["dirs"].items():
+            info = tarfile.TarInfo(rel)
+            info.type, info.mode = tarfile.DIRTYPE, mode
+            tar.addfile(info)
+        for rel, entry in manifest["files"].items():
+            path = os.path.join(src, rel)
+            # 不使用gettarinfo，避免同一inode被记录为硬链接条目
+            info = tarfile.TarInfo(rel)
+            info.size, info.mode, info.mtime = entry["size"], entry["mode"], int(os.path.getmtime(path))
+            with open(path, 'rb') as f:
+                reader = HashingReader(f)
+                tar.addfile(info, reader)
+            check_hash(rel, reader, manifest)
+        for rel, target in manifest["symlinks"].items():
+            info = tarfile.TarInfo(rel)
+            info.type, info.linkname, info.mode = tarfile.SYMTYPE, target, 0o777
+            tar.addfile(info)
+
+
+def build(src, out, fmt=None, level=None, include_git=False, jobs=JOBS):
+    start = time.time()
+    fmt = fmt or ("zip" if out.endswith(".zip") else "tar.zst")
+    dirs, files, symlinks = collect_tree(src, include_git)
+    manifest = build_manifest(src, dirs, files, symlinks, jobs)
+    total = sum(entry["size"] for entry in manifest["files"].values())
+    LOGGER.info(f"打包 {src}: {len(files)} 个文件，{len(dirs)} 个目录，{len(symlinks)} 个软链接，{human_size(total)}")
+    tmp = out + ".tmp"
+    try:
+        if fmt == "zip":
+            write_zip(tmp, src, manifest, 6 if level is None else level)
+        else:
+            with zstd_writer(tmp, ZSTD_LEVEL if level is None else level) as stream:
+                write_tar(stream, src, manifest)
+        os.replace(tmp, out)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    LOGGER.info(f"✓ 已生成 {out} ({fmt}, {human_size(os.path.getsize(out))})，耗时 {time.time() - start:.1f} 秒")
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="离线自定义节点包的流式安装与打包")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    install_parser = subparsers.add_parser("install", help="安装节点包")
+    install_parser.add_argument("bundle", nargs="?", help=f"节点包路径，默认依次查找 {', '.join(BUNDLE_CANDIDATES)}")
+    install_parser.add_argument("--dest", default=DEST_DIR)
+    install_parser.add_argument("--jobs", type=int, default=JOBS)
+    install_parser.add_argument("--keep", action="store_true", help="安装后保留节点包")
+    build_parser = subparsers.add_parser("build", help="把节点目录打包为带清单的节点包")
+    build_parser.add_argument("src", help="节点目录，例如 ComfyUI/custom_nodes")
+    build_parser.add_argument("out", help="输出文件（.zip 或 .tar.zst）")
+    build_parser.add_argument("--format", choices=["zip", "tar.zst"])
+    build_parser.add_argument("--level", type=int, help=f"压缩级别（zip默认6，zstd默认{ZSTD_LEVEL}）")
+    build_parser.add_argument("--include-git", action="store_true", help="包含.git目录")
+    build_parser.add_argument("--jobs", type=int, default=JOBS)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if not os.path.isdir(args.src):
+            LOGGER.error(f"目录不存在: {args.src}")
+            return 1
+        build(args.src, args.out, args.format, args.level, args.include_git, args.jobs)
+        return 0
+
+    bundle = args.bundle or next((path for path in BUNDLE_CANDIDATES if os.path.isfile(path)), None)
+    if not bundle or not os.path.isfile(bundle):
+        LOGGER.info("未找到节点包，跳过本地节点安装。")
+        return 0
+    installer = BundleInstaller(args.dest, args.jobs)
+    if not installer.install(bundle):
+        LOGGER.error(f"✗ 节点包安装失败: {len(installer.errors)} 个错误")
+        return 1
+    LOGGER.info("✓ 节点包安装完成")
+    if not args.keep:
+        os.remove(bundle)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
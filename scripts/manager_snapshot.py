@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ComfyUI-Manager 数据快照。
+
+ComfyUI-Manager 打开页面时会从远程频道（默认是GitHub上的raw文件）下载节点列表、模型列表和扩展映射，
+在国内服务器上经常超时。本脚本：
+
+capture: 构建时把频道中的数据文件保存为带版本的快照（默认 /app/manager_snapshot），
+         下载失败的文件使用Manager仓库自带的副本。manifest.json 记录版本、每个文件的sha256和上游ETag。
+serve:   在 127.0.0.1:MANAGER_SNAPSHOT_PORT 上提供快照（支持 ETag / If-None-Match），
+         后台线程定期使用条件请求（If-None-Match / If-Modified-Since）从上游刷新，
+         只有内容确实变化且是合法JSON时才替换文件。刷新失败不影响已有快照的服务。
+start:   以后台进程启动serve并立即返回，不阻塞容器启动。
+
+configure_comfyui_manager.py 会把Manager的 channel_url 指向这个本地地址。
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+MANAGER_DIR = "/app/custom_nodes/ComfyUI-Manager"
+SNAPSHOT_DIR = os.environ.get("MANAGER_SNAPSHOT_DIR", "/app/manager_snapshot")
+CHANNEL_URL = os.environ.get("MANAGER_CHANNEL_URL", "https://raw.githubusercontent.com/ltdrdata/ComfyUI-Manager/main")
+HOST = "127.0.0.1"
+PORT = int(os.environ.get("MANAGER_SNAPSHOT_PORT", "8189"))
+LOCAL_URL = f"http://{HOST}:{PORT}"
+# 后台刷新间隔与首次刷新前的等待（秒），首次刷新延后以免与启动争用网络
+REFRESH_INTERVAL = int(os.environ.get("MANAGER_SNAPSHOT_REFRESH", str(6 * 3600)))
+REFRESH_DELAY = 120
+FETCH_TIMEOUT = 60
+LOG_FILE = "/app/.cache/manager_snapshot.log"
+MANIFEST_NAME = "manifest.json"
+# Manager从频道读取的数据文件
+DATA_FILES = [
+    "custom-node-list.json",
+    "extension-node-map.json",
+    "model-list.json",
+    "alter-list.json",
+    "github-stats.json",
+]
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def load_manifest(snapshot_dir=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(manifest, snapshot_dir=SNAPSHOT_DIR):
+    """按文件内容计算快照版本并原子地写入manifest。"""
+    digest = hashlib.sha256()
+    for name in sorted(manifest["files"]):
+        digest.update(f"{name}:{manifest['files'][name]['sha256']}\n".encode('utf-8'))
+    manifest["version"] = digest.hexdigest()[:16]
+    path = os.path.join(snapshot_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def write_file_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def fetch(url, etag=None, last_modified=None, timeout=FETCH_TIMEOUT):
+    """
+    条件请求下载一个文件。返回 (状态, 内容, ETag, Last-Modified)，
+    状态为 'changed'、'not-modified' 或 'error'。
+    """
+    request = urllib.request.Request(url, headers={"User-Agent": "comfyui-manager-snapshot"})
+    if etag:
+        request.add_header("If-None-Match", etag)
+    if last_modified:
+        request.add_header("If-Modified-Since", last_modified)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            data = response.read()
+            return "changed", data, response.headers.get("ETag"), response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return "not-modified", None, etag, last_modified
+        LOGGER.warning(f"下载 {url} 失败: HTTP {e.code}")
+    except (urllib.error.URLError, OSError) as e:
+        LOGGER.warning(f"下载 {url} 失败: {e}")
+    return "error", None, None, None
+
+
+def valid_json(data):
+    try:
+        json.loads(data)
+        return True
+    except ValueError:
+        return False
+
+
+def capture(snapshot_dir=SNAPSHOT_DIR, manager_dir=MANAGER_DIR, channel_url=CHANNEL_URL, offline=False):
+    """构建时保存快照，返回成功保存的文件数。"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest = {"channel_url": channel_url, "captured": time.time(), "files": {}}
+    for name in DATA_FILES:
+        status, data, etag, last_modified = ("error", None, None, None) if offline else \
+            fetch(f"{channel_url.rstrip('/')}/{name}")
+        source = "channel"
+        if status != "changed" or not valid_json(data):
+            # 回退到Manager仓库自带的副本（与仓库版本一致，但可能不是最新）
+            bundled = os.path.join(manager_dir, name)
+            if not os.path.isfile(bundled):
+                LOGGER.warning(f"✗ {name}: 频道和Manager仓库中都没有可用的副本")
+                continue
+            with open(bundled, 'rb') as f:
+                data = f.read()
+            etag = last_modified = None
+            source = "bundled"
+        write_file_atomic(os.path.join(snapshot_dir, name), data)
+        manifest["files"][name] = {"sha256": sha256_bytes(data), "size": len(data), "etag": etag,
+                                   "last_modified": last_modified, "source": source, "updated": time.time()}
+        LOGGER.info(f"✓ {name}: {len(data) / 1024:.0f} KB ({source})")
+    save_manifest(manifest, snapshot_dir)
+    LOGGER.info(f"Manager数据快照已保存到 {snapshot_dir} (版本 {manifest['version']}, {len(manifest['files'])} 个文件)")
+    return len(manifest["files"])
+
+
+class Snapshot:
+    """服务进程中的快照状态，刷新与读取之间加锁。"""
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR):
+        self.dir = snapshot_dir
+        self.lock = threading.Lock()
+        self.manifest = load_manifest(snapshot_dir) or {"channel_url": CHANNEL_URL, "files": {}}
+        # 客户端请求过、但快照中还没有的文件，下次刷新时尝试获取
+        self.wanted = set()
+
+    def get(self, name):
+        """返回 (内容, ETag)，文件不在快照中时返回 (None, None)。"""
+        with self.lock:
+            info = self.manifest["files"].get(name)
+            if not info:
+                if name.endswith(".json") and "/" not in name:
+                    self.wanted.add(name)
+                return None, None
+            with open(os.path.join(self.dir, name), 'rb') as f:
+                return f.read(), f'"{info["sha256"][:32]}"'
+
+    def refresh(self):
+        """对每个文件发送条件请求，返回发生变化的文件数。"""
+        with self.lock:
+            files = dict(self.manifest["files"])
+            names = sorted(set(files) | self.wanted)
+            channel_url = self.manifest.get("channel_url", CHANNEL_URL)
+        changed = updated = 0
+        for name in names:
+            info = files.get(name, {})
+            status, data, etag, last_modified = fetch(f"{channel_url.rstrip('/')}/{name}",
+                                                      info.get("etag"), info.get("last_modified"))
+            if status != "changed" or not valid_json(data):
+                continue
+            digest = sha256_bytes(data)
+            updated += 1
+            with self.lock:
+                self.wanted.discard(name)
+                if digest != info.get("sha256"):
+                    write_file_atomic(os.path.join(self.dir, name), data)
+                    changed += 1
+                self.manifest["files"][name] = {"sha256": digest, "size": len(data), "etag": etag,
+                                                "last_modified": last_modified, "source": "channel",
+                                                "updated": time.time()}
+        if updated:
+            # 内容未变但ETag变化时同样保存，下次刷新使用新的ETag
+            with self.lock:
+                save_manifest(self.manifest, self.dir)
+        if changed:
+            LOGGER.info(f"快照已刷新: {changed} 个文件发生变化 (版本 {self.manifest['version']})")
+        return changed
+
+    def refresh_forever(self, interval=REFRESH_INTERVAL, delay=REFRESH_DELAY):
+        time.sleep(delay)
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                LOGGER.warning(f"刷新快照失败: {e}")
+            time.sleep(interval)
+
+
+def make_handler(snapshot):
+    class SnapshotHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            name = self.path.split("?", 1)[0].lstrip("/")
+            if name == "__health":
+                body = json.dumps({"version": snapshot.manifest.get("version")}).encode('utf-8')
+                return self._send(200, body)
+            data, etag = snapshot.get(name)
+            if data is None:
+                return self._send(404, b"{}")
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._send(200, data, etag)
+
+        def _send(self, code, body, etag=None):
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-cache")
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SnapshotHandler
+
+
+def serve(snapshot_dir=SNAPSHOT_DIR, host=HOST, port=PORT, refresh=True):
+    snapshot = Snapshot(snapshot_dir)
+    server = ThreadingHTTPServer((host, port), make_handler(snapshot))
+    if refresh and REFRESH_INTERVAL > 0:
+        threading.Thread(target=snapshot.refresh_forever, daemon=True).start()
+    LOGGER.info(f"Manager数据快照服务: http://{host}:{port} (版本 {snapshot.manifest.get('version')})")
+    server.serve_forever()
+
+
+def is_serving(host=HOST, port=PORT, timeout=0.5):
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def start(snapshot_dir=SNAPSHOT_DIR, port=PORT, wait_seconds=3.0):
+    """在后台启动服务进程并立即返回；输出写入日志文件，不占用调用方的输出管道。"""
+    url = f"http://{HOST}:{port}"
+    if is_serving(port=port):
+        LOGGER.info(f"Manager数据快照服务已在运行: {url}")
+        return True
+    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+    with open(LOG_FILE, 'ab') as log:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--dir", snapshot_dir,
+                          "--port", str(port)],
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                         start_new_session=True, close_fds=True)
+    deadline = time.time() + wait_seconds
+    while time.time() < deadline:
+        if is_serving(port=port):
+            LOGGER.info(f"✓ Manager数据快照服务已启动: {url}")
+            return True
+        time.sleep(0.1)
+    LOGGER.warning(f"Manager数据快照服务未能在 {wait_seconds} 秒内启动，详见 {LOG_FILE}")
+    return False
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="ComfyUI-Manager数据快照")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    capture_parser = subparsers.add_parser("capture", help="保存快照（构建时）")
+    capture_parser.add_argument("--dir", default=SNAPSHOT_DIR)
+    capture_parser.add_argument("--manager-dir", default=MANAGER_DIR)
+    capture_parser.add_argument("--channel-url", default=CHANNEL_URL)
+    capture_parser.add_argument("--offline", action="store_true", help="只使用Manager仓库自带的副本")
+    for name, help_text in (("serve", "在前台提供快照服务"), ("start", "在后台启动快照服务")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--dir", default=SNAPSHOT_DIR)
+        sub.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args(argv)
+
+    if args.command == "capture":
+        capture(args.dir, args.manager_dir, args.channel_url, args.offline)
+        return 0
+    if not load_manifest(args.dir):
+        LOGGER.info(f"{args.dir} 中没有Manager数据快照，跳过。")
+        return 0
+    if args.command == "serve":
+        serve(args.dir, port=args.port)
+        return 0
+    start(args.dir, args.port)
+    # 服务启动失败时Manager仍会回退到自己的缓存，不阻止容器启动
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+模型目录索引。
+
+当 /app/models 软链接到网络存储时，每次刷新模型列表都要递归stat成千上万个文件。
+本脚本在启动时生成一个索引文件，记录每个模型的路径、大小、mtime，
+以及不加载张量、只读取文件头得到的 .safetensors 元数据（dtype、张量数量、参数量）。
+
+索引按目录记录mtime：再次运行时，mtime未变化的目录直接复用上次的结果，
+只列出发生变化的目录，因此更新的开销与变化的目录数量成正比。
+
+其他代码可以直接读取索引：
+    from model_index import list_models
+    for item in list_models("checkpoints"):
+        print(item["path"], item["size"], item.get("safetensors"))
+"""
+
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+MODELS_DIR = "/app/models"
+INDEX_FILE = os.environ.get("MODEL_INDEX_FILE", "/app/.cache/model_index.json")
+INDEX_VERSION = 1
+HEADER_WORKERS = int(os.environ.get("MODEL_INDEX_WORKERS", "8"))
+# safetensors头部长度的合理上限，超过则认为文件已损坏
+MAX_HEADER_SIZE = 100 * 1024 * 1024
+# __metadata__ 中过长的值（例如训练标签频率表）不写入索引
+MAX_METADATA_VALUE = 256
+SKIP_SUFFIXES = (".part", ".part.json", ".tmp", ".store-tmp")
+
+
+def read_safetensors_header(path):
+    """
+    只读取 .safetensors 的文件头：8字节小端长度 + JSON。
+    返回 dtype、张量数量、参数量和较短的 __metadata__ 项。
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(8)
+        if len(prefix) != 8:
+            raise ValueError("文件过短")
+        (length,) = struct.unpack("<Q", prefix)
+        if length > MAX_HEADER_SIZE:
+            raise ValueError(f"头部长度异常: {length}")
+        header = json.loads(f.read(length))
+
+    metadata = header.pop("__metadata__", None) or {}
+    dtypes = Counter()
+    parameters = 0
+    for tensor in header.values():
+        dtypes[tensor["dtype"]] += 1
+        count = 1
+        for dim in tensor["shape"]:
+            count *= dim
+        parameters += count
+    return {
+        "dtype": dtypes.most_common(1)[0][0] if dtypes else None,
+        "dtypes": dict(dtypes),
+        "tensors": len(header),
+        "parameters": parameters,
+        "metadata": {key: value for key, value in metadata.items()
+                     if isinstance(value, str) and len(value) <= MAX_METADATA_VALUE},
+    }
+
+
+def describe_file(path, st):
+    entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if path.endswith(".safetensors"):
+        try:
+            entry["safetensors"] = read_safetensors_header(path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            entry["error"] = str(e)
+    return entry
+
+
+def load_index(path=INDEX_FILE):
+    """读取索引；不存在或版本不匹配时返回None。"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get("version") == INDEX_VERSION else None
+
+
+def list_models(folder=None, index=None, path=INDEX_FILE):
+    """
+    从索引中列出模型。folder为模型子目录（例如"checkpoints"），None表示全部。
+    返回 [{"path": 相对folder的路径, "size", "mtime_ns", "safetensors"?}]，按路径排序。
+    """
+    index = index if index is not None else load_index(path)
+    if not index:
+        return []
+    prefix = "" if not folder else folder.strip("/") + "/"
+    models = []
+    for rel_dir, info in index["dirs"].items():
+        dir_prefix = "" if rel_dir == "." else rel_dir + "/"
+        for name, entry in info["files"].items():
+            rel_path = dir_prefix + name
+            if rel_path.startswith(prefix):
+                models.append(dict(entry, path=rel_path[len(prefix):]))
+    return sorted(models, key=lambda item: item["path"])
+
+
+def build_index(root=MODELS_DIR, previous=None, workers=HEADER_WORKERS):
+    """
+    遍历模型目录并返回 (新索引, 统计)。
+    mtime未变化的目录复用previous中的记录，不再列出目录内容。
+    """
+    real_root = os.path.realpath(root)
+    old_dirs = previous["dirs"] if previous and previous.get("root") == real_root else {}
+    dirs = {}
+    stats = {"dirs_scanned": 0, "dirs_reused": 0, "files": 0, "headers_read": 0}
+    pending = []
+
+    stack = [real_root]
+    # 目录软链接会被跟随，按(st_dev, st_ino)记录已入栈和已处理的目录，避免 up -> .. 之类的环路
+    queued = set()
+    processed = set()
+    while stack:
+        path = stack.pop()
+        rel = os.path.relpath(path, real_root).replace(os.sep, "/")
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        key = (st.st_dev, st.st_ino)
+        if key in processed:
+            continue
+        processed.add(key)
+        queued.add(key)
+
+        old = old_dirs.get(rel)
+        if old and old["mtime_ns"] == st.st_mtime_ns:
+            stats["dirs_reused"] += 1
+            dirs[rel] = old
+            stack.extend(os.path.join(path, name) for name in old["subdirs"])
+            continue
+
+        stats["dirs_scanned"] += 1
+        old_files = old["files"] if old else {}
+        info = {"mtime_ns": st.st_mtime_ns, "subdirs": [], "files": {}}
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or entry.name.endswith(SKIP_SUFFIXES):
+                        continue
+                    try:
+                        # 跟随软链接，这样model_store.py链接到存储中的模型同样会被索引
+                        entry_st = entry.stat()
+                    except OSError:
+                        continue
+                    if entry.is_dir():
+                        dir_key = (entry_st.st_dev, entry_st.st_ino)
+                        if dir_key in queued:
+                            continue
+                        queued.add(dir_key)
+                        info["subdirs"].append(entry.name)
+                        stack.append(entry.path)
+                        continue
+                    cached = old_files.get(entry.name)
+                    if cached and cached["size"] == entry_st.st_size and cached["mtime_ns"] == entry_st.st_mtime_ns:
+                        info["files"][entry.name] = cached
+                    else:
+                        pending.append((info, entry.name, entry.path, entry_st))
+        except OSError as e:
+            LOGGER.warning(f"无法读取目录 {path}: {e}")
+            continue
+        info["subdirs"].sort()
+        dirs[rel] = info
+
+    # 新增或变化的文件并行读取safetensors头部（网络存储上延迟远大于读取量）
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        described = executor.map(lambda item: describe_file(item[2], item[3]), pending)
+        for (info, name, path, _), entry in zip(pending, described):
+            info["files"][name] = entry
+            if "safetensors" in entry:
+                stats["headers_read"] += 1
+
+    stats["files"] = sum(len(info["files"]) for info in dirs.values())
+    index = {"version": INDEX_VERSION, "root": real_root, "generated": time.time(), "dirs": dirs}
+    return index, stats
+
+
+def save_index(index, path=INDEX_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="生成或更新模型目录索引")
+    parser.add_argument("--root", default=MODELS_DIR, help="模型目录")
+    parser.add_argument("--index", default=INDEX_FILE, help="索引文件路径")
+    parser.add_argument("--full", action="store_true", help="忽略已有索引，完整重建")
+    parser.add_argument("--workers", type=int, default=HEADER_WORKERS, help="并行读取文件头的线程数")
+    parser.add_argument("--list", metavar="FOLDER", nargs="?", const="", help="打印索引中的模型列表后退出")
+    args = parser.parse_args(argv)
+
+    if args.list is not None:
+        for item in list_models(args.list or None, path=args.index):
+            info = item.get("safetensors")
+            extra = f" {info['dtype']} {info['tensors']} tensors {info['parameters']:,} params" if info else ""
+            print(f"{item['path']}\t{item['size']}{extra}")
+        return 0
+
+    if not os.path.isdir(args.root):
+        LOGGER.info(f"{args.root} 不存在，跳过模型索引。")
+        return 0
+
+    started = time.time()
+    previous = None if args.full else load_index(args.index)
+    index, stats = build_index(args.root, previous, args.workers)
+    save_index(index, args.index)
+    LOGGER.info(
+        f"✓ 模型索引已更新: {stats['files']} 个文件, 扫描 {stats['dirs_scanned']} 个目录, "
+        f"复用 {stats['dirs_reused']} 个未变化的目录, 读取 {stats['headers_read']} 个safetensors头 "
+        f"({time.time() - started:.2f}秒) -> {args.index}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+内容寻址的模型存储与去重。
+
+同一个checkpoint、LoRA或ControlNet经常被复制到多个模型子目录甚至多个项目中，
+既浪费磁盘也浪费页缓存。本脚本：
+1. 扫描模型目录，计算每个文件的sha256。哈希缓存在sqlite数据库中，
+   文件的大小、mtime和inode未变化时直接复用，不重新读取文件。
+2. 以哈希为名把内容保存到 blobs/ 目录（blobs/<前两位>/<sha256>）；
+   复用已有blob前按缓存记录的大小和mtime校验，变化过的blob重新计算哈希，内容不符时重新放入存储。
+3. 把模型目录中的文件替换为指向blob的软链接（默认）或硬链接，
+   相同内容在磁盘上只保存一份。硬链接模式下模型文件与blob是同一个inode，
+   原地修改任意一个模型都会改变blob以及所有链接到它的文件，因此需要显式开启。
+4. 输出回收的字节数报告。
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import stat
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+MODELS_DIR = "/app/models"
+# 使用硬链接时，存储目录必须与模型目录位于同一文件系统
+STORE_DIR = os.environ.get("MODEL_STORE_DIR", "/root/data/model_store")
+LINK_MODE = os.environ.get("MODEL_STORE_LINK_MODE", "symlink")
+# 小于该大小的文件（配置、说明文件等）不参与去重
+MIN_SIZE = 1024 * 1024
+HASH_WORKERS = int(os.environ.get("MODEL_STORE_WORKERS", str(min(8, os.cpu_count() or 1))))
+CHUNK_SIZE = 8 * 1024 * 1024
+SKIP_SUFFIXES = (".part", ".part.json", ".tmp")
+
+
+def human_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    """blobs目录加上sqlite哈希缓存。"""
+
+    def __init__(self, root, link_mode=LINK_MODE):
+        self.root = os.path.realpath(root)
+        self.blobs_dir = os.path.join(self.root, "blobs")
+        self.link_mode = link_mode
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(self.root, "hashes.sqlite"))
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, ino INTEGER, sha256 TEXT)"
+        )
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest[:2], digest)
+
+    def cached_hashes(self):
+        """{路径: (size, mtime_ns, ino, sha256)}"""
+        return {row[0]: row[1:] for row in self.db.execute("SELECT path, size, mtime_ns, ino, sha256 FROM files")}
+
+    def remember(self, path, st, digest):
+        self.db.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, ino, sha256) VALUES (?, ?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, st.st_ino, digest),
+        )
+
+    def forget_missing(self, seen_paths, roots):
+        """删除扫描范围内已不存在的文件的缓存记录。"""
+        removed = 0
+        for (path,) in self.db.execute("SELECT path FROM files").fetchall():
+            if path not in seen_paths and any(path.startswith(root + os.sep) for root in roots):
+                self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+                removed += 1
+        return removed
+
+    def scan(self, roots):
+        """
+        遍历模型目录，返回 [(路径, stat)]，跳过blobs目录本身、软链接和小文件。
+        """
+        files = []
+        stack = list(roots)
+        while stack:
+            path = stack.pop()
+            if os.path.realpath(path) == self.root:
+                continue
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file(follow_symlinks=False) or entry.name.endswith(SKIP_SUFFIXES):
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                        if st.st_size >= MIN_SIZE:
+                            files.append((entry.path, st))
+            except OSError as e:
+                LOGGER.warning(f"无法读取目录 {path}: {e}")
+        return files
+
+    def hash_files(self, files, workers=HASH_WORKERS):
+        """复用缓存中大小、mtime和inode都未变化的哈希，其余文件在线程池中计算。"""
+        cache = self.cached_hashes()
+        hashes = {}
+        to_hash = []
+        for path, st in files:
+            cached = cache.get(path)
+            if cached and cached[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+                hashes[path] = cached[3]
+            else:
+                to_hash.append((path, st))
+
+        LOGGER.info(f"{len(files)} 个文件中 {len(hashes)} 个复用缓存的哈希，{len(to_hash)} 个需要计算")
+        if to_hash:
+            started = time.time()
+            total = sum(st.st_size for _, st in to_hash)
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                for (path, st), digest in zip(to_hash, executor.map(lambda item: sha256_file(item[0]), to_hash)):
+                    hashes[path] = digest
+                    self.remember(path, st, digest)
+            elapsed = time.time() - started
+            LOGGER.info(f"计算了 {human_size(total)} 的哈希 ({elapsed:.1f}秒)")
+        self.db.commit()
+        return hashes
+
+    def _replace_with_link(self, path, blob):
+        """用指向blob的链接原子地替换path。"""
+        tmp_path = f"{path}.store-tmp"
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        if self.link_mode == "symlink":
+            os.symlink(blob, tmp_path)
+        else:
+            os.link(blob, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _valid_blob(self, blob, digest):
+        """
+        已有的blob是否仍是digest的内容：大小、mtime和inode与缓存记录一致时直接信任记录，
+        否则（没有记录或被原地修改过）重新计算哈希。
+        """
+        try:
+            st = os.stat(blob)
+        except OSError:
+            return False
+        row = self.db.execute("SELECT size, mtime_ns, ino, sha256 FROM files WHERE path = ?", (blob,)).fetchone()
+        if row and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return row[3] == digest
+        actual = sha256_file(blob)
+        self.remember(blob, st, actual)
+        return actual == digest
+
+    def _ingest(self, path, digest):
+        """把文件内容放入blobs目录，返回blob路径。"""
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            if self._valid_blob(blob, digest):
+                return blob
+            LOGGER.warning(f"blob {digest[:12]} 的内容已被修改，使用 {path} 重新放入存储")
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp_blob = blob + ".tmp"
+        if self.link_mode == "symlink":
+            # 软链接模式下内容移动到存储中，原路径随后替换为软链接；
+            # blob只属于存储，设为只读防止经软链接的普通写入
+            os.replace(path, tmp_blob)
+            os.chmod(tmp_blob, stat.S_IMODE(os.stat(tmp_blob).st_mode) & ~0o222)
+        else:
+            # 硬链接与用户的文件共享inode，不修改其权限
+            os.link(path, tmp_blob)
+        os.replace(tmp_blob, blob)
+        self.remember(blob, os.stat(blob), digest)
+        return blob
+
+    def deduplicate(self, files, hashes, dry_run=False):
+        """把每个文件链接到对应的blob，返回报告。"""
+        by_hash = {}
+        for path, st in files:
+            by_hash.setdefault(hashes[path], []).append((path, st))
+
+        report = {"files": len(files), "unique": len(by_hash), "linked": 0, "reclaimed_bytes": 0,
+                  "errors": 0, "duplicates": []}
+        for digest, members in by_hash.items():
+            blob = self.blob_path(digest)
+            blob_ino = os.stat(blob).st_ino if os.path.exists(blob) else None
+            inodes = {blob_ino} if blob_ino is not None else set()
+            reclaim = 0
+            for path, st in members:
+                # 同一inode（已经是硬链接）的文件不占用额外空间
+                if st.st_ino not in inodes:
+                    if inodes:
+                        reclaim += st.st_size
+                    inodes.add(st.st_ino)
+            if reclaim:
+                report["duplicates"].append({"sha256": digest, "size": members[0][1].st_size,
+                                             "paths": sorted(path for path, _ in members)})
+            if dry_run:
+                report["reclaimed_bytes"] += reclaim
+                continue
+
+            try:
+                blob = self._ingest(members[0][0], digest)
+                blob_ino = os.stat(blob).st_ino
+            except OSError as e:
+                report["errors"] += 1
+                LOGGER.warning(f"无法把 {members[0][0]} 放入存储: {e}")
+                continue
+            for path, st in members:
+                if self.link_mode != "symlink" and st.st_ino == blob_ino:
+                    continue
+                try:
+                    self._replace_with_link(path, blob)
+                except OSError as e:
+                    report["errors"] += 1
+                    LOGGER.warning(f"无法链接 {path}: {e}")
+                    continue
+                report["linked"] += 1
+                new_st = os.stat(path)
+                self.remember(path, new_st, digest)
+            report["reclaimed_bytes"] += reclaim
+        self.db.commit()
+        report["duplicates"].sort(key=lambda item: item["size"] * (len(item["paths"]) - 1), reverse=True)
+        return report
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="内容寻址的模型存储：哈希去重并把模型目录链接到存储中")
+    parser.add_argument("--root", action="append", help=f"要扫描的模型目录，可重复指定（默认 {MODELS_DIR}）")
+    parser.add_argument("--store", default=STORE_DIR, help="存储目录（包含blobs和哈希缓存）")
+    parser.add_argument("--link-mode", choices=["hardlink", "symlink"], default=LINK_MODE, help="链接方式")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS, help="计算哈希的线程数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计可回收的空间，不修改任何文件")
+    parser.add_argument("--report", help="把JSON报告写入该文件（默认写入存储目录下的report.json）")
+    args = parser.parse_args(argv)
+
+    roots = [os.path.realpath(root) for root in (args.root or [MODELS_DIR])]
+    roots = [root for root in roots if os.path.isdir(root)]
+    if not roots:
+        LOGGER.info("没有找到需要扫描的模型目录，跳过。")
+        return 0
+
+    started = time.time()
+    store = ModelStore(args.store, args.link_mode)
+    try:
+        files = store.scan(roots)
+        removed = store.forget_missing({path for path, _ in files}, roots)
+        if removed:
+            LOGGER.info(f"清理了 {removed} 条已不存在文件的哈希缓存")
+        hashes = store.hash_files(files, args.workers)
+        report = store.deduplicate(files, hashes, dry_run=args.dry_run)
+    finally:
+        store.close()
+
+    report.update(roots=roots, store=args.store, link_mode=args.link_mode, dry_run=args.dry_run,
+                  seconds=round(time.time() - started, 3))
+    report_path = args.report or os.path.join(args.store, "report.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    verb = "可回收" if args.dry_run else "已回收"
+    LOGGER.info(f"✓ {report['files']} 个文件, {report['unique']} 份不同内容, "
+                f"{len(report['duplicates'])} 组重复, {verb} {human_size(report['reclaimed_bytes'])} "
+                f"({report['seconds']:.1f}秒)")
+    for item in report["duplicates"][:10]:
+        LOGGER.info(f"  {human_size(item['size'])} x {len(item['paths'])}: {', '.join(item['paths'])}")
+    if report["errors"]:
+        LOGGER.warning(f"{report['errors']} 个文件处理失败，详见报告 {report_path}")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
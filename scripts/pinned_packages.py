@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+核心依赖的固定版本表。
+
+build_dependencies.py 在解析时注入这些版本，verify_dependencies.py 在启动时按同一张表
+验证、修复并烘焙wheel。两者必须使用同一份版本，否则启动时的修复会把构建刻意避开的版本装回去。
+"""
+
+# "numpy": "1.26.4"
+
+# PINNED_PACKAGES = {
+#     "torch": "2.5.1",
+#     "torchvision": "0.20.1",
+#     "torchaudio": "2.5.1",
+#     "xformers": "0.0.29.post1"
+# }
+
+PINNED_PACKAGES = {
+    "torch": "2.6.0",
+    "torchvision": "0.21.0",
+    "torchaudio": "2.6.0",
+    "xformers": "v0.0.29.post2",
+    "numpy": "1.24.4",  # 兼容mediapipe<2要求
+    "scipy": "1.12.0",  # 满足jax、scikit-image等>=1.12要求
+    "pillow": "9.5.0",   # 兼容simple-lama-inpainting<10.0.0要求
+    "timm": "0.4.12",    # 兼容torchscale要求
+    "opencv-contrib-python-headless": "4.8.1.78",  # 稳定版本，避免依赖冲突
+    "decord": "0.6.0"
+}
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+pip / PyTorch 下载源的自适应选择。
+
+各脚本中只使用规范的下载源地址（PYPI_INDEX_URL、TORCH_INDEX_URL），
+实际调用pip前由 MirrorSelector.rewrite() 替换为当前最快的健康镜像：
+1. 并发探测每组镜像：请求一个项目的simple页面，记录首字节延迟和吞吐量；
+2. 健康分数（预计下载参考大小所需的秒数，失败次数越多越高）缓存在磁盘上，
+   有效期内不重复探测；
+3. pip调用失败时，下一次重试换用本次请求尚未尝试过的最佳镜像（按请求故障转移）；
+   只有网络类错误（连接、超时、HTTP错误）才记为镜像的失败，解析或构建失败与镜像无关。
+
+可以用本地的替身索引服务器测试，例如：
+    PIP_MIRRORS=http://127.0.0.1:9001/simple,http://127.0.0.1:9002/simple python pip_mirrors.py probe
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+# 规范的下载源地址，其他脚本只引用这两个常量
+PYPI_INDEX_URL = "https://pypi.org/simple"
+TORCH_INDEX_URL = "https://download.pytorch.org/whl/cu121"
+
+
+def _mirror_list(env_name, default):
+    value = os.environ.get(env_name, "")
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()] or default
+
+
+# 每组镜像：规范地址、候选镜像和用于探测的项目
+MIRROR_GROUPS = {
+    "pypi": {
+        "canonical": PYPI_INDEX_URL,
+        "mirrors": _mirror_list("PIP_MIRRORS", [
+            "https://pypi.tuna.tsinghua.edu.cn/simple",
+            "https://mirrors.aliyun.com/pypi/simple",
+            "https://mirrors.cloud.tencent.com/pypi/simple",
+            PYPI_INDEX_URL,
+        ]),
+        "probe_project": "pip",
+    },
+    "torch": {
+        "canonical": TORCH_INDEX_URL,
+        "mirrors": _mirror_list("TORCH_MIRRORS", [TORCH_INDEX_URL]),
+        "probe_project": "torchaudio",
+    },
+}
+ENABLED = os.environ.get("PIP_MIRROR_SELECTION", "true").lower() in ("true", "1", "yes")
+HEALTH_CACHE = os.environ.get("PIP_MIRROR_CACHE", "/app/.cache/pip_mirrors.json")
+# 健康分数的有效期（秒）
+HEALTH_TTL = int(os.environ.get("PIP_MIRROR_TTL", "1800"))
+PROBE_TIMEOUT = float(os.environ.get("PIP_MIRROR_PROBE_TIMEOUT", "5"))
+# 探测时最多读取的字节数
+PROBE_BYTES = 512 * 1024
+# 分数 = 首字节延迟 + 按探测吞吐量下载该大小所需的秒数
+REFERENCE_BYTES = 20 * 1024 * 1024
+INDEX_OPTIONS = ("-i", "--index-url", "--extra-index-url")
+INDEX_COMMANDS = ("install", "download", "wheel")
+# pip输出中表示下载源本身有问题的错误
+NETWORK_ERRORS = re.compile(
+    r"ConnectTimeout|ReadTimeout|timed out|Connection(Error|ResetError|RefusedError| reset| refused| aborted)"
+    r"|NewConnectionError|MaxRetryError|ProxyError|SSLError|RemoteDisconnected|IncompleteRead"
+    r"|ProtocolError|Temporary failure in name resolution|Name or service not known"
+    r"|HTTP error \d{3}|\b(403|404|429|5\d\d) Client Error|\b5\d\d Server Error|Could not fetch URL"
+    r"|DO NOT MATCH THE HASHES",
+    re.IGNORECASE)
+
+
+def normalize(url):
+    return url.strip().rstrip("/")
+
+
+def is_network_error(output):
+    """pip的输出是否表明失败由网络或下载源引起（而不是依赖解析或源码构建失败）。"""
+    return bool(output and NETWORK_ERRORS.search(output))
+
+
+def probe_mirror(url, project, timeout=PROBE_TIMEOUT):
+    """请求镜像上某个项目的simple页面，返回健康记录。"""
+    started = time.perf_counter()
+    request = urllib.request.Request(f"{url}/{project}/", headers={"User-Agent": "pip-mirror-probe"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            first = response.read(1)
+            latency = time.perf_counter() - started
+            data = first + response.read(PROBE_BYTES)
+        elapsed = time.perf_counter() - started
+    except Exception as e:
+        return {"ok": False, "error": str(e)[:200], "checked": time.time()}
+    if b"<a " not in data and b'"files"' not in data:
+        return {"ok": False, "error": "不是有效的simple索引页面", "checked": time.time()}
+    throughput = len(data) / max(elapsed - latency, 1e-3)
+    return {"ok": True, "latency": round(latency, 4), "throughput": round(throughput),
+            "checked": time.time()}
+
+
+class MirrorSelector:
+    """探测镜像、缓存健康分数并为pip参数选择镜像。线程安全。"""
+
+    def __init__(self, groups=None, cache_path=HEALTH_CACHE, ttl=HEALTH_TTL, timeout=PROBE_TIMEOUT):
+        self.groups = groups or MIRROR_GROUPS
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.health = self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(f"{self.cache_path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(self.health, f, indent=2, sort_keys=True)
+            os.replace(f"{self.cache_path}.tmp", self.cache_path)
+        except OSError as e:
+            LOGGER.warning(f"无法保存镜像健康缓存: {e}")
+
+    def score(self, url):
+        """越小越好；不健康或未探测的镜像为inf。失败一次分数翻倍。"""
+        entry = self.health.get(url)
+        if not entry or not entry.get("ok"):
+            return math.inf
+        base = entry["latency"] + REFERENCE_BYTES / max(entry["throughput"], 1)
+        return base * (2 ** entry.get("failures", 0))
+
+    def group_of(self, url):
+        url = normalize(url)
+        for name, group in self.groups.items():
+            if url == normalize(group["canonical"]) or url in group["mirrors"]:
+                return name
+        return None
+
+    def _stale(self, group):
+        now = time.time()
+        return any(now - self.health.get(url, {}).get("checked", 0) > self.ttl for url in group["mirrors"])
+
+    def probe(self, group_name):
+        """并发探测一组镜像并保存结果，已有的失败计数清零。"""
+        group = self.groups[group_name]
+        mirrors = group["mirrors"]
+        with ThreadPoolExecutor(max_workers=len(mirrors)) as executor:
+            results = list(executor.map(lambda url: probe_mirror(url, group["probe_project"], self.timeout),
+                                        mirrors))
+        with self.lock:
+            for url, result in zip(mirrors, results):
+                self.health[url] = result
+            self._save()
+        return dict(zip(mirrors, results))
+
+    def ranked(self, group_name):
+        """按分数排序的镜像列表；缓存过期时先重新探测。全部不健康时保持配置顺序。"""
+        group = self.groups[group_name]
+        if len(group["mirrors"]) > 1 and self._stale(group):
+            self.probe(group_name)
+        with self.lock:
+            return sorted(group["mirrors"], key=self.score)
+
+    def best(self, group_name):
+        return self.ranked(group_name)[0]
+
+    def pick(self, url, tried=()):
+        """返回url所在组中未尝试过的最佳镜像（都尝试过时重新从最佳镜像开始），不属于任何组的url原样返回。"""
+        group_name = self.group_of(url)
+        if not group_name:
+            return url
+        ranked = self.ranked(group_name)
+        return next((mirror for mirror in ranked if mirror not in tried), ranked[0])
+
+    def rewrite(self, args, tried=()):
+        """把pip参数中的下载源替换为镜像；install/download/wheel没有指定下载源时加上最佳PyPI镜像。"""
+        if not ENABLED:
+            return list(args)
+        result = []
+        has_index = no_index = False
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            option, _, value = arg.partition("=")
+            if option in INDEX_OPTIONS and value:
+                result.append(f"{option}={self.pick(value, tried)}")
+            elif arg in INDEX_OPTIONS and i + 1 < len(args):
+                result += [arg, self.pick(args[i + 1], tried)]
+                i += 1
+            else:
+                result.append(arg)
+            if option in ("-i", "--index-url"):
+                has_index = True
+            no_index = no_index or arg == "--no-index"
+            i += 1
+        if args and args[0] in INDEX_COMMANDS and not has_index and not no_index:
+            result += ["--index-url", self.pick(PYPI_INDEX_URL, tried)]
+        return result
+
+    def mirrors_in(self, args):
+        """返回pip参数中属于某个镜像组的下载源。"""
+        urls = []
+        for i, arg in enumerate(args):
+            option, _, value = arg.partition("=")
+            if option in INDEX_OPTIONS:
+                url = value or (args[i + 1] if i + 1 < len(args) else "")
+                if self.group_of(url):
+                    urls.append(normalize(url))
+        return urls
+
+    def report(self, args, ok):
+        """记录一次pip调用的结果：失败时增加所用镜像的失败计数，成功时清零。"""
+        urls = self.mirrors_in(args)
+        if not urls:
+            return
+        with self.lock:
+            for url in urls:
+                entry = self.health.setdefault(url, {"ok": False, "checked": 0})
+                entry["failures"] = 0 if ok else entry.get("failures", 0) + 1
+            self._save()
+
+
+_SELECTOR = None
+_SELECTOR_LOCK = threading.Lock()
+
+
+def get_selector():
+    """进程内共享的选择器。"""
+    global _SELECTOR
+    with _SELECTOR_LOCK:
+        if _SELECTOR is None:
+            _SELECTOR = MirrorSelector()
+        return _SELECTOR
+
+
+def log_ranking(selector, group_name):
+    LOGGER.info(f"--- 镜像组 '{group_name}' ---")
+    for url in selector.ranked(group_name):
+        entry = selector.health.get(url, {})
+        if entry.get("ok"):
+            LOGGER.info(f"✓ {url}: 延迟 {entry['latency'] * 1000:.0f} ms，吞吐 {entry['throughput'] / 1024:.0f} KB/s，"
+                        f"失败 {entry.get('failures', 0)} 次，分数 {selector.score(url):.1f}")
+        else:
+            LOGGER.info(f"✗ {url}: {entry.get('error', '未探测')}")
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="pip / PyTorch 下载源的自适应选择")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    probe_parser = subparsers.add_parser("probe", help="立即探测镜像并输出排名")
+    probe_parser.add_argument("--group", choices=sorted(MIRROR_GROUPS), help="只探测一组镜像")
+    best_parser = subparsers.add_parser("best", help="输出一组镜像中最快的健康镜像（使用缓存）")
+    best_parser.add_argument("group", choices=sorted(MIRROR_GROUPS))
+    args = parser.parse_args(argv)
+
+    selector = get_selector()
+    if args.command == "best":
+        print(selector.best(args.group))
+        return 0
+    for group_name in [args.group] if args.group else sorted(MIRROR_GROUPS):
+        selector.probe(group_name)
+        log_ranking(selector, group_name)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+在构建时并行预编译虚拟环境、ComfyUI和所有自定义节点的字节码。
+
+新容器第一次导入 /venv 和自定义节点时，如果没有可用的 .pyc（或者 __pycache__ 对UID 1001不可写），
+每次启动都要重新编译。本脚本使用 compileall 在所有CPU核心上并行编译，
+并生成基于哈希的pyc（默认 checked-hash）：它们不依赖源文件的mtime，
+因此之后的 chmod/chown 或mtime变化都不会使其失效；而源码内容变化（例如
+UPDATE_REPOSITORIES=true 时 install_custom_nodes.py --update 更新了自定义节点）时，
+解释器会发现哈希不一致并重新编译。
+unchecked-hash 从不检查源码，只适合源码永远不会改动的场景。
+
+使用 --measure 时，会分别在"没有可用pyc"和"使用预编译pyc"两种情况下，
+在全新的子进程中测量若干模块的导入时间，报告节省的启动时间。
+"""
+
+import argparse
+import compileall
+import importlib.util
+import logging
+import os
+import py_compile
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+# /app 包含ComfyUI源码和custom_nodes
+DEFAULT_ROOTS = [sys.prefix, "/app"]
+# 只排除 /app 下的数据目录，site-packages 中同名的包（例如 transformers/models）仍需编译
+EXCLUDE = re.compile(r"/(\.git|node_modules)/|^/app/(models|output|input|temp|user)/")
+INVALIDATION_MODES = {
+    "unchecked-hash": py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    "checked-hash": py_compile.PycInvalidationMode.CHECKED_HASH,
+}
+# 测量启动时间时导入的模块（未安装的模块会被跳过）
+MEASURE_MODULES = ["numpy", "PIL.Image", "safetensors", "torch", "torchvision", "transformers"]
+
+
+def find_sources(roots):
+    """列出roots下所有需要编译的.py文件。"""
+    sources = []
+    for root in roots:
+        for current, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if not EXCLUDE.search(os.path.join(current, d) + os.sep)]
+            sources.extend(os.path.join(current, name) for name in files if name.endswith(".py"))
+    return sources
+
+
+def pyc_state(source):
+    """返回源文件对应pyc的状态: 'missing'、'timestamp' 或 'hash'。"""
+    try:
+        with open(importlib.util.cache_from_source(source), 'rb') as f:
+            header = f.read(8)
+    except (OSError, ValueError):
+        return "missing"
+    if len(header) < 8 or header[:4] != importlib.util.MAGIC_NUMBER:
+        return "missing"
+    flags = int.from_bytes(header[4:8], "little")
+    return "hash" if flags & 0b1 else "timestamp"
+
+
+def count_states(sources):
+    counts = {"missing": 0, "timestamp": 0, "hash": 0}
+    for source in sources:
+        counts[pyc_state(source)] += 1
+    return counts
+
+
+def compile_roots(roots, mode, workers=0):
+    """
+    对每个根目录并行运行compileall，返回是否全部成功。
+    pip安装时生成的是基于时间戳的pyc，compileall会认为它们已是最新而跳过，因此这里强制重新编译。
+    """
+    ok = True
+    for root in roots:
+        LOGGER.info(f"正在编译 {root} (模式: {mode}, 进程数: {workers or os.cpu_count()})...")
+        ok &= compileall.compile_dir(
+            root, quiet=2, force=True, workers=workers, rx=EXCLUDE,
+            invalidation_mode=INVALIDATION_MODES[mode],
+        )
+    return ok
+
+
+def measure_import(module, without_pyc):
+    """在新的子进程中测量导入一个模块的耗时（秒），失败时返回None。"""
+    env = dict(os.environ)
+    with tempfile.TemporaryDirectory() as empty_cache:
+        if without_pyc:
+            # 把pyc查找重定向到空目录并禁止写入，相当于没有任何可用的pyc
+            env["PYTHONPYCACHEPREFIX"] = empty_cache
+            env["PYTHONDONTWRITEBYTECODE"] = "1"
+        code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+        try:
+            result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=600)
+        except subprocess.TimeoutExpired:
+            return None
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure(modules):
+    """报告每个模块在没有pyc和使用预编译pyc时的导入时间。"""
+    total_cold = total_warm = 0.0
+    for module in modules:
+        cold = measure_import(module, without_pyc=True)
+        if cold is None:
+            LOGGER.info(f"  {module}: 未安装或导入失败，跳过")
+            continue
+        warm = measure_import(module, without_pyc=False)
+        if warm is None:
+            continue
+        total_cold += cold
+        total_warm += warm
+        LOGGER.info(f"  {module}: 无pyc {cold:.2f}秒 -> 预编译 {warm:.2f}秒 (节省 {cold - warm:.2f}秒)")
+    LOGGER.info(f"测量的模块合计: {total_cold:.2f}秒 -> {total_warm:.2f}秒，每次冷启动节省约 {total_cold - total_warm:.2f}秒")
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="并行预编译虚拟环境与自定义节点的字节码")
+    parser.add_argument("roots", nargs="*", default=DEFAULT_ROOTS, help=f"要编译的目录（默认 {DEFAULT_ROOTS}）")
+    parser.add_argument("--mode", choices=sorted(INVALIDATION_MODES), default="checked-hash",
+                        help="pyc失效检查方式，两者都不依赖mtime；unchecked-hash 不会发现源码的修改")
+    parser.add_argument("--workers", type=int, default=0, help="并行进程数，0表示使用所有CPU核心")
+    parser.add_argument("--measure", action="store_true", help="测量预编译前后的模块导入时间")
+    parser.add_argument("--measure-modules", nargs="+", default=MEASURE_MODULES, help="测量导入时间的模块")
+    args = parser.parse_args(argv)
+
+    roots = [root for root in args.roots if os.path.isdir(root)]
+    started = time.time()
+    sources = find_sources(roots)
+    before = count_states(sources)
+    LOGGER.info(f"找到 {len(sources)} 个源文件: 已有哈希pyc {before['hash']} 个, "
+                f"基于时间戳的pyc {before['timestamp']} 个, 缺少pyc {before['missing']} 个")
+
+    ok = compile_roots(roots, args.mode, args.workers)
+    after = count_states(sources)
+    elapsed = time.time() - started
+    LOGGER.info(f"✓ 编译完成 ({elapsed:.1f}秒): {after['hash']}/{len(sources)} 个源文件已有基于哈希的pyc, "
+                f"新编译或转换 {after['hash'] - before['hash']} 个")
+    if after["missing"]:
+        # 通常是Python 2语法的示例脚本或故意不可导入的文件
+        LOGGER.warning(f"{after['missing']} 个源文件无法编译（语法错误等），导入时会照常报错")
+    if not ok:
+        LOGGER.info("部分文件编译失败，不影响其他文件的预编译结果。")
+
+    if args.measure:
+        measure(args.measure_modules)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
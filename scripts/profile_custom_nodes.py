@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+自定义节点导入耗时与内存分析，以及启动前应用的节点禁用列表。
+
+profile: 每个自定义节点在独立的子进程中导入（多个子进程并行）。子进程先按 main.py 的方式
+初始化ComfyUI（folder_paths、nodes、PromptServer），然后只导入一个节点，记录：
+    - 导入墙钟时间
+    - -X importtime 中耗时最多的模块
+    - 峰值RSS相对导入前RSS的增量
+    - 导入失败的异常
+结果按导入耗时排序写入报告（默认 /app/custom_nodes_profile.json）。
+并行运行的子进程会互相争用CPU和磁盘，耗时适合用来排序，绝对值会偏大；需要精确数值时使用 --jobs 1。
+
+apply: 在启动前把禁用列表中的节点目录重命名为 <节点>.disabled（ComfyUI不会加载这类目录），
+并恢复之前由本脚本禁用、但已不在列表中的节点。禁用列表来自：
+    - NODE_DENYLIST_FILE 文件（默认 /root/data/custom_nodes_denylist.txt，每行一个节点名或仓库URL，# 开头为注释）
+    - DISABLED_CUSTOM_NODES 环境变量（逗号分隔）
+因此每个部署可以单独禁用开销大的节点，而不需要修改镜像。
+
+用法：
+    python profile_custom_nodes.py profile [--jobs 4] [--deny-slower-than 10] [--deny-failed]
+    python profile_custom_nodes.py apply
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+COMFYUI_DIR = "/app"
+CUSTOM_NODES_DIR = "/app/custom_nodes"
+REPORT_FILE = os.environ.get("NODE_PROFILE_REPORT", "/app/custom_nodes_profile.json")
+DENYLIST_FILE = os.environ.get("NODE_DENYLIST_FILE", "/root/data/custom_nodes_denylist.txt")
+# 记录由本脚本禁用的节点，避免恢复用户通过其他方式禁用的节点
+STATE_FILE_NAME = ".denylist_state.json"
+DISABLED_SUFFIX = ".disabled"
+PROFILE_JOBS = int(os.environ.get("NODE_PROFILE_JOBS", str(min(4, os.cpu_count() or 1))))
+IMPORT_TIMEOUT = 600
+HOTSPOTS = 10
+
+# 子进程输出中的标记
+IMPORT_MARKER = "__NODE_IMPORT_START__"
+RESULT_PREFIX = "__NODE_PROFILE_RESULT__ "
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+# --- 子进程：初始化ComfyUI并导入单个节点 ---
+
+def current_rss_kb():
+    """当前进程的常驻内存（KB）。"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bootstrap_comfyui(comfy_dir=COMFYUI_DIR, comfy_args=()):
+    """
+    按 main.py 的顺序初始化ComfyUI，使节点可以像正常启动时一样导入
+    （许多节点在导入时就访问 folder_paths 或 PromptServer.instance）。
+    """
+    os.chdir(comfy_dir)
+    if comfy_dir not in sys.path:
+        sys.path.insert(0, comfy_dir)
+    # comfy.cli_args 在导入时解析 sys.argv
+    sys.argv = ["main.py", *comfy_args]
+
+    import asyncio
+    import folder_paths  # noqa: F401
+    import nodes  # noqa: F401
+    import server
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server.PromptServer(loop)
+
+
+def import_node(path):
+    """按ComfyUI加载自定义节点的方式导入一个节点目录或单文件节点，返回节点类数量。"""
+    name = os.path.splitext(os.path.basename(path.rstrip("/")))[0]
+    if os.path.isfile(path):
+        spec = importlib.util.spec_from_file_location(name, path)
+    else:
+        spec = importlib.util.spec_from_file_location(
+            name, os.path.join(path, "__init__.py"), submodule_search_locations=[path])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return len(getattr(module, "NODE_CLASS_MAPPINGS", None) or {})
+
+
+def run_child(path, comfy_dir, comfy_args):
+    """子进程入口：输出一行以RESULT_PREFIX开头的JSON结果。"""
+    result = {"bootstrap_seconds": None, "seconds": None, "node_classes": None, "error": None}
+    started = time.perf_counter()
+    try:
+        bootstrap_comfyui(comfy_dir, comfy_args)
+    except Exception as e:
+        result["error"] = f"ComfyUI初始化失败: {type(e).__name__}: {e}"
+        print(RESULT_PREFIX + json.dumps(result), flush=True)
+        return 1
+    result["bootstrap_seconds"] = round(time.perf_counter() - started, 3)
+    result["rss_before_kb"] = current_rss_kb()
+
+    print(IMPORT_MARKER, file=sys.stderr, flush=True)
+    started = time.perf_counter()
+    try:
+        result["node_classes"] = import_node(path)
+    except BaseException as e:
+        result["error"] = f"{type(e).__name__}: {e}"[:1000]
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    result["rss_after_kb"] = current_rss_kb()
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # 峰值RSS是整个进程的峰值；初始化阶段的峰值高于节点导入时，增量会被低估为0
+    result["peak_rss_delta_kb"] = max(0, result["peak_rss_kb"] - result["rss_before_kb"])
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+    return 0
+
+
+# --- 父进程：并行分析所有节点 ---
+
+def find_nodes(nodes_dir=CUSTOM_NODES_DIR):
+    """列出ComfyUI会加载的节点：包含__init__.py的目录和单个.py文件，跳过已禁用的节点。"""
+    found = []
+    for entry in sorted(os.scandir(nodes_dir), key=lambda e: e.name.lower()):
+        if entry.name.startswith(".") or entry.name.endswith(DISABLED_SUFFIX) or entry.name == "__pycache__":
+            continue
+        if entry.is_dir() and os.path.isfile(os.path.join(entry.path, "__init__.py")):
+            found.append(entry.path)
+        elif entry.is_file() and entry.name.endswith(".py"):
+            found.append(entry.path)
+    return found
+
+
+def parse_importtime(stderr):
+    """解析标记之后的 -X importtime 输出，返回按自身耗时排序的热点模块。"""
+    _, _, after = stderr.partition(IMPORT_MARKER)
+    modules = []
+    for line in after.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            modules.append({
+                "module": module,
+                "self_ms": round(int(self_us) / 1000, 1),
+                "cumulative_ms": round(int(cumulative_us) / 1000, 1),
+                "depth": len(indent) // 2,
+            })
+    modules.sort(key=lambda item: item["self_ms"], reverse=True)
+    return modules[:HOTSPOTS]
+
+
+def profile_node(path, comfy_dir, comfy_args, timeout=IMPORT_TIMEOUT):
+    """在独立子进程中导入一个节点，返回报告条目。"""
+    entry = {"name": os.path.basename(path), "path": path, "status": "failed", "seconds": None,
+             "peak_rss_delta_mb": None, "node_classes": None, "hotspots": [], "error": None}
+    command = [sys.executable, "-X", "importtime", os.path.abspath(__file__), "_child", path,
+               "--comfy-dir", comfy_dir, "--comfy-args", *comfy_args]
+    started = time.time()
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        entry.update(status="timeout", seconds=round(time.time() - started, 3),
+                     error=f"导入超过 {timeout} 秒")
+        return entry
+
+    result = None
+    for line in process.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            result = json.loads(line[len(RESULT_PREFIX):])
+    if result is None:
+        entry["error"] = (process.stderr.strip().splitlines() or [f"子进程退出码 {process.returncode}"])[-1][:1000]
+        return entry
+
+    entry.update(
+        status="failed" if result["error"] else "ok",
+        seconds=result["seconds"],
+        bootstrap_seconds=result["bootstrap_seconds"],
+        node_classes=result["node_classes"],
+        error=result["error"],
+        hotspots=parse_importtime(process.stderr),
+    )
+    if result.get("peak_rss_delta_kb") is not None:
+        entry["peak_rss_delta_mb"] = round(result["peak_rss_delta_kb"] / 1024, 1)
+        entry["rss_delta_mb"] = round((result["rss_after_kb"] - result["rss_before_kb"]) / 1024, 1)
+    return entry
+
+
+def profile_nodes(paths, comfy_dir=COMFYUI_DIR, comfy_args=(), jobs=PROFILE_JOBS, timeout=IMPORT_TIMEOUT):
+    """并行分析所有节点，返回按导入耗时从高到低排序的报告条目。"""
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        entries = list(executor.map(lambda path: profile_node(path, comfy_dir, comfy_args, timeout), paths))
+    return sorted(entries, key=lambda item: item["seconds"] or 0, reverse=True)
+
+
+def log_profile(entries):
+    LOGGER.info(f"{'节点':<40} {'状态':<8} {'导入(s)':>8} {'峰值RSS增量(MB)':>16} {'节点类':>6}  最慢的模块")
+    for entry in entries:
+        hotspot = entry["hotspots"][0]["module"] if entry["hotspots"] else ""
+        seconds = f"{entry['seconds']:.2f}" if entry["seconds"] is not None else "-"
+        rss = f"{entry['peak_rss_delta_mb']:.1f}" if entry["peak_rss_delta_mb"] is not None else "-"
+        classes = entry["node_classes"] if entry["node_classes"] is not None else "-"
+        LOGGER.info(f"{entry['name'][:40]:<40} {entry['status']:<8} {seconds:>8} {rss:>16} {classes:>6}  {hotspot}")
+    for entry in entries:
+        if entry["error"]:
+            LOGGER.error(f"✗ {entry['name']}: {entry['error']}")
+
+
+def write_report(entries, report_path, wall_time):
+    report = {
+        "generated": time.time(),
+        "wall_time": round(wall_time, 3),
+        "total_import_seconds": round(sum(entry["seconds"] or 0 for entry in entries), 3),
+        "failed": [entry["name"] for entry in entries if entry["status"] != "ok"],
+        "nodes": entries,
+    }
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    LOGGER.info(f"节点分析报告已写入: {report_path}")
+
+
+# --- 禁用列表 ---
+
+def normalize_node_name(entry):
+    """禁用列表中的项可以是目录名，也可以是custom_nodes.json中的仓库URL。"""
+    name = entry.strip().rstrip("/").rsplit("/", 1)[-1]
+    return name[:-4] if name.endswith(".git") else name
+
+
+def load_denylist(path=DENYLIST_FILE, env_value=None):
+    names = []
+    if path and os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            names.extend(line.split("#", 1)[0].strip() for line in f)
+    env_value = os.environ.get("DISABLED_CUSTOM_NODES", "") if env_value is None else env_value
+    names.extend(env_value.split(","))
+    return sorted({normalize_node_name(name) for name in names if name.strip()})
+
+
+def add_to_denylist(names, path=DENYLIST_FILE):
+    """把节点追加到禁用列表文件（已存在的不重复添加）。"""
+    existing = set(load_denylist(path, env_value=""))
+    new = [name for name in names if name not in existing]
+    if not new:
+        return []
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for name in new:
+            f.write(f"{name}\n")
+    return new
+
+
+def resolve_node_dir(name, nodes_dir):
+    """按目录名查找节点（先精确匹配，再忽略大小写），返回实际的目录名或None。"""
+    candidates = [entry for entry in os.listdir(nodes_dir) if not entry.endswith(DISABLED_SUFFIX)]
+    if name in candidates:
+        return name
+    lowered = {entry.lower(): entry for entry in candidates}
+    return lowered.get(name.lower())
+
+
+def apply_denylist(denylist, nodes_dir=CUSTOM_NODES_DIR):
+    """
+    把禁用列表中的节点重命名为 <节点>.disabled，恢复之前由本脚本禁用、但已不在列表中的节点。
+    返回 (新禁用的节点, 恢复的节点)。
+    """
+    state_path = os.path.join(nodes_dir, STATE_FILE_NAME)
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            previously_disabled = set(json.load(f).get("disabled", []))
+    except (OSError, ValueError):
+        previously_disabled = set()
+
+    wanted = set(denylist)
+    restored = []
+    for name in sorted(previously_disabled - wanted):
+        source = os.path.join(nodes_dir, name + DISABLED_SUFFIX)
+        target = os.path.join(nodes_dir, name)
+        if os.path.exists(source) and not os.path.exists(target):
+            os.rename(source, target)
+            restored.append(name)
+        previously_disabled.discard(name)
+
+    disabled = []
+    for name in denylist:
+        actual = resolve_node_dir(name, nodes_dir)
+        if actual is None:
+            if not os.path.exists(os.path.join(nodes_dir, name + DISABLED_SUFFIX)):
+                LOGGER.warning(f"禁用列表中的节点不存在: {name}")
+            continue
+        target = os.path.join(nodes_dir, actual + DISABLED_SUFFIX)
+        if os.path.exists(target):
+            LOGGER.warning(f"{target} 已存在，无法禁用 {actual}")
+            continue
+        os.rename(os.path.join(nodes_dir, actual), target)
+        disabled.append(actual)
+        previously_disabled.add(actual)
+
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump({"disabled": sorted(previously_disabled)}, f, indent=2, ensure_ascii=False)
+    return disabled, restored
+
+
+# --- 命令行 ---
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="自定义节点导入分析与禁用列表")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    profile_parser = subparsers.add_parser("profile", help="在独立子进程中逐个导入节点并生成报告")
+    profile_parser.add_argument("nodes", nargs="*", help="只分析这些节点（目录名），默认全部")
+    profile_parser.add_argument("--nodes-dir", default=CUSTOM_NODES_DIR)
+    profile_parser.add_argument("--comfy-dir", default=COMFYUI_DIR)
+    profile_parser.add_argument("--comfy-args", nargs=argparse.REMAINDER, default=[],
+                                help="传给ComfyUI参数解析的参数，例如 --cpu（必须放在最后）")
+    profile_parser.add_argument("--jobs", type=int, default=PROFILE_JOBS, help="并行导入的子进程数")
+    profile_parser.add_argument("--timeout", type=int, default=IMPORT_TIMEOUT, help="单个节点的导入超时（秒）")
+    profile_parser.add_argument("--report", default=REPORT_FILE)
+    profile_parser.add_argument("--deny-slower-than", type=float, metavar="SECONDS",
+                                help="把导入耗时超过该值的节点加入禁用列表")
+    profile_parser.add_argument("--deny-failed", action="store_true", help="把导入失败或超时的节点加入禁用列表")
+    profile_parser.add_argument("--denylist", default=DENYLIST_FILE)
+
+    apply_parser = subparsers.add_parser("apply", help="启动前应用禁用列表")
+    apply_parser.add_argument("--nodes-dir", default=CUSTOM_NODES_DIR)
+    apply_parser.add_argument("--denylist", default=DENYLIST_FILE)
+
+    child_parser = subparsers.add_parser("_child")
+    child_parser.add_argument("path")
+    child_parser.add_argument("--comfy-dir", default=COMFYUI_DIR)
+    child_parser.add_argument("--comfy-args", nargs=argparse.REMAINDER, default=[])
+
+    args = parser.parse_args(argv)
+
+    if args.command == "_child":
+        return run_child(args.path, args.comfy_dir, args.comfy_args)
+
+    if args.command == "apply":
+        if not os.path.isdir(args.nodes_dir):
+            return 0
+        disabled, restored = apply_denylist(load_denylist(args.denylist), args.nodes_dir)
+        for name in disabled:
+            LOGGER.info(f"✓ 已禁用节点: {name}")
+        for name in restored:
+            LOGGER.info(f"✓ 已恢复节点: {name}")
+        return 0
+
+    paths = find_nodes(args.nodes_dir)
+    if args.nodes:
+        wanted = {name.lower() for name in args.nodes}
+        paths = [path for path in paths if os.path.basename(path).lower() in wanted]
+    LOGGER.info(f"使用 {args.jobs} 个并行子进程分析 {len(paths)} 个节点的导入...")
+    started = time.time()
+    entries = profile_nodes(paths, args.comfy_dir, args.comfy_args, args.jobs, args.timeout)
+    log_profile(entries)
+    write_report(entries, args.report, time.time() - started)
+
+    deny = []
+    if args.deny_slower_than is not None:
+        deny += [entry["name"] for entry in entries
+                 if entry["seconds"] is not None and entry["seconds"] > args.deny_slower_than]
+    if args.deny_failed:
+        deny += [entry["name"] for entry in entries if entry["status"] != "ok"]
+    if deny:
+        added = add_to_denylist(sorted(set(deny)), args.denylist)
+        if added:
+            LOGGER.info(f"已加入禁用列表 {args.denylist}: {', '.join(added)}（下次启动时生效）")
+    return 1 if any(entry["status"] != "ok" for entry in entries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+快速扫描ComfyUI和自定义节点的依赖声明。
+
+与递归 glob("**/requirements*.txt") 相比：
+1. 基于 os.scandir 遍历，跳过 node_modules、.git、嵌套虚拟环境、模型权重目录等不可能包含依赖声明的大目录。
+2. 除 requirements*.txt 外，还读取节点根目录下的：
+   - pyproject.toml 中的 [project].dependencies（仅当节点根目录没有 requirements*.txt 时，与ComfyUI-Manager的行为一致）
+   - install.py 中 `pip install ...` 调用里写死的软件包（只做静态分析，不执行脚本）
+3. 支持完整的pip需求文件语法：行尾反斜杠续行、行内注释、${VAR} 环境变量、
+   -r/-c 引用（相对于引用它的文件）、环境标记、--index-url/--extra-index-url/--find-links/--trusted-host、
+   -e 和 git+ 等直接URL需求（带 #egg= 时转换为 `name @ url`）、以及每行的 --hash 等选项。
+4. 每个文件的解析结果按文件内容的sha256缓存（默认 /app/.cache/requirements_scan.json），
+   内容未变化的文件不再重新解析。
+
+用法：
+    from requirements_scanner import RequirementsScanner
+    scanner = RequirementsScanner()
+    result = scanner.scan(scanner.find_sources(["/app/requirements.txt"], "/app/custom_nodes"))
+    scanner.save()
+
+也可以直接运行，打印扫描结果：
+    python requirements_scanner.py [--nodes-dir /app/custom_nodes]
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+import tomllib
+
+from packaging.requirements import InvalidRequirement, Requirement
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+SCAN_CACHE_FILE = os.environ.get("REQUIREMENTS_SCAN_CACHE", "/app/.cache/requirements_scan.json")
+# 解析规则变化时递增，使旧的缓存失效
+CACHE_VERSION = 1
+
+# 遍历时跳过的目录（名称以 . 开头的目录同样跳过，与glob的行为一致）
+PRUNE_DIRS = {
+    "node_modules", "__pycache__", "venv", "env", "site-packages", "dist-packages",
+    "models", "checkpoints", "ckpts", "weights", "pretrained_models",
+}
+REQUIREMENTS_PATTERN = re.compile(r"^requirements.*\.txt$")
+
+# 需求文件中保留的下载源选项，-i/--index-url 作为额外的下载源处理，不会替换默认源
+INDEX_OPTIONS = {
+    "-i": "--index-url", "--index-url": "--index-url",
+    "--extra-index-url": "--extra-index-url",
+    "-f": "--find-links", "--find-links": "--find-links",
+    "--trusted-host": "--trusted-host",
+}
+INCLUDE_OPTIONS = {"-r": "requirement", "--requirement": "requirement", "-c": "constraint", "--constraint": "constraint"}
+EDITABLE_OPTIONS = {"-e", "--editable"}
+# pip install 中带参数的选项，分析install.py时需要跳过它们的参数
+PIP_OPTIONS_WITH_VALUE = {"-r", "--requirement", "-c", "--constraint", "-i", "--index-url", "--extra-index-url",
+                          "-f", "--find-links", "--trusted-host", "-t", "--target", "--prefix", "--root",
+                          "--platform", "--python-version", "--implementation", "--abi", "--no-binary",
+                          "--only-binary", "--progress-bar", "-e", "--editable"}
+
+COMMENT = re.compile(r"(^|\s+)#.*$")
+ENV_VAR = re.compile(r"\$\{([A-Z0-9_]+)\}")
+# 需求行末尾的每行选项，例如 --hash=sha256:...、--config-settings
+LINE_OPTIONS = re.compile(r"\s+--?[a-zA-Z][\w-]*(=|\s|$).*$")
+EGG = re.compile(r"#egg=([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+class ScanResult:
+    """一次扫描的结果。"""
+
+    def __init__(self):
+        self.requirements = []   # [(来源文件, Requirement)]
+        self.constraints = []    # [(来源文件, Requirement)]，来自 -c 引用的文件
+        self.index_options = []  # [(选项, 值, 来源文件)]
+        self.files = []          # 读取过的所有文件（包括被引用的文件），按读取顺序
+        self.errors = []         # [(来源文件, 内容, 错误)]
+
+
+def requirement_from_url(url):
+    """把 git+https://...#egg=name 之类的URL转换为 `name @ url` 需求，无法确定名称时返回None。"""
+    match = EGG.search(url)
+    if not match:
+        return None
+    return f"{match.group(1)} @ {url}"
+
+
+def split_option(line):
+    """把 '-r file'、'-rfile'、'--requirement=file' 拆分为 (选项, 值)。"""
+    if line.startswith("--"):
+        option, sep, value = line.partition("=")
+        if not sep:
+            option, _, value = line.partition(" ")
+        return option.strip(), value.strip()
+    return line[:2], line[2:].strip()
+
+
+def logical_lines(text):
+    """合并反斜杠续行、去掉注释并展开 ${VAR}，返回非空的逻辑行。"""
+    lines = []
+    buffer = ""
+    for raw in text.splitlines():
+        if raw.endswith("\\") and not COMMENT.search(raw):
+            buffer += raw[:-1] + " "
+            continue
+        line = COMMENT.sub("", buffer + raw).strip()
+        buffer = ""
+        if line:
+            lines.append(ENV_VAR.sub(lambda m: os.environ.get(m.group(1), m.group(0)), line))
+    if buffer.strip():
+        lines.append(COMMENT.sub("", buffer).strip())
+    return lines
+
+
+def parse_requirements_text(text):
+    """
+    解析pip需求文件的内容，返回条目列表：
+        {"kind": "requirement", "value": 需求字符串}
+        {"kind": "include", "mode": "requirement"|"constraint", "value": 相对路径}
+        {"kind": "index", "option": 选项, "value": 值}
+        {"kind": "error", "value": 原始行, "error": 原因}
+    """
+    entries = []
+    for line in logical_lines(text):
+        if line.startswith("-"):
+            option, value = split_option(line)
+            if option in INCLUDE_OPTIONS:
+                entries.append({"kind": "include", "mode": INCLUDE_OPTIONS[option], "value": value})
+            elif option in INDEX_OPTIONS:
+                entries.append({"kind": "index", "option": INDEX_OPTIONS[option], "value": value})
+            elif option in EDITABLE_OPTIONS:
+                spec = requirement_from_url(value)
+                if spec:
+                    entries.append({"kind": "requirement", "value": spec})
+                else:
+                    entries.append({"kind": "error", "value": line, "error": "无法确定可编辑安装的软件包名称"})
+            # 其他全局选项（--pre、--prefer-binary等）对依赖解析没有影响，忽略
+            continue
+
+        line = LINE_OPTIONS.sub("", line)
+        if re.match(r"^[a-z][a-z0-9+.-]*://", line) or line.startswith(("git+", "hg+", "svn+", "bzr+")):
+            spec = requirement_from_url(line)
+            if not spec:
+                entries.append({"kind": "error", "value": line, "error": "无法确定URL需求的软件包名称"})
+                continue
+            line = spec
+        try:
+            Requirement(line)
+        except InvalidRequirement as e:
+            entries.append({"kind": "error", "value": line, "error": str(e)})
+            continue
+        entries.append({"kind": "requirement", "value": line})
+    return entries
+
+
+def parse_pyproject(data):
+    """读取 pyproject.toml 中的 [project].dependencies。"""
+    try:
+        project = tomllib.loads(data.decode("utf-8")).get("project", {})
+    except (tomllib.TOMLDecodeError, UnicodeDecodeError) as e:
+        return [{"kind": "error", "value": "pyproject.toml", "error": str(e)}]
+    entries = []
+    for spec in project.get("dependencies", []) or []:
+        try:
+            Requirement(spec)
+            entries.append({"kind": "requirement", "value": spec})
+        except InvalidRequirement as e:
+            entries.append({"kind": "error", "value": spec, "error": str(e)})
+    return entries
+
+
+def _string_tokens(node):
+    """调用参数中的字符串常量拆分为token；无法静态确定的参数记为None。"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value.split()
+    if isinstance(node, (ast.List, ast.Tuple)):
+        tokens = []
+        for element in node.elts:
+            tokens.extend(_string_tokens(element))
+        return tokens
+    return [None]
+
+
+def _pip_install_targets(tokens):
+    """从一次调用的token中找出 `pip install` 之后写死的软件包。"""
+    targets = []
+    for i, token in enumerate(tokens):
+        if token != "install" or i == 0 or not (tokens[i - 1] or "").rsplit("/", 1)[-1].startswith("pip"):
+            continue
+        skip_next = False
+        for arg in tokens[i + 1:]:
+            if arg is None:
+                break
+            if skip_next:
+                skip_next = False
+                continue
+            if arg.startswith("-"):
+                skip_next = arg in PIP_OPTIONS_WITH_VALUE
+                continue
+            targets.append(arg)
+    return targets
+
+
+def parse_install_py(data):
+    """静态分析 install.py，提取 subprocess/os.system 调用中 `pip install` 写死的软件包。"""
+    try:
+        tree = ast.parse(data)
+    except (SyntaxError, ValueError) as e:
+        return [{"kind": "error", "value": "install.py", "error": str(e)}]
+    entries = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        tokens = []
+        for arg in node.args:
+            tokens.extend(_string_tokens(arg))
+        for target in _pip_install_targets(tokens):
+            if target.startswith((".", "/")) or "{" in target or "%" in target or target.endswith(".txt"):
+                continue
+            spec = requirement_from_url(target) if "://" in target else target
+            if not spec:
+                continue
+            try:
+                Requirement(spec)
+            except InvalidRequirement:
+                continue
+            entries.append({"kind": "requirement", "value": spec})
+    return entries
+
+
+def parse_file_content(path, data):
+    """按文件类型解析内容。"""
+    name = os.path.basename(path)
+    if name == "pyproject.toml":
+        return parse_pyproject(data)
+    if name == "install.py":
+        return parse_install_py(data)
+    return parse_requirements_text(data.decode("utf-8", errors="replace"))
+
+
+class RequirementsScanner:
+    """查找并解析依赖声明文件，解析结果按文件内容哈希缓存。"""
+
+    def __init__(self, cache_path=SCAN_CACHE_FILE):
+        self.cache_path = cache_path
+        self.cache = {}
+        self.used = set()
+        self.dirty = False
+        self.stats = {"parsed": 0, "cached": 0}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == CACHE_VERSION:
+            self.cache = data.get("files", {})
+
+    def save(self):
+        """保存缓存，只保留本次用到的条目。"""
+        if not self.cache_path or not (self.dirty or set(self.cache) - self.used):
+            return
+        self.cache = {key: entries for key, entries in self.cache.items() if key in self.used}
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": CACHE_VERSION, "files": self.cache}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            LOGGER.warning(f"无法写入需求扫描缓存 {self.cache_path}: {e}")
+
+    @staticmethod
+    def _walk(root):
+        """os.scandir遍历，跳过大目录和嵌套虚拟环境，返回找到的 requirements*.txt。"""
+        found = []
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            try:
+                with os.scandir(path) as iterator:
+                    entries = list(iterator)
+            except OSError:
+                continue
+            if any(entry.name == "pyvenv.cfg" for entry in entries):
+                continue
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in PRUNE_DIRS:
+                            stack.append(entry.path)
+                    elif REQUIREMENTS_PATTERN.match(entry.name) and entry.is_file():
+                        found.append(entry.path)
+                except OSError:
+                    continue
+        return found
+
+    def find_sources(self, root_files, nodes_dir):
+        """
+        返回需要解析的顶层文件：root_files中存在的文件、每个节点中的 requirements*.txt，
+        以及节点根目录下的 pyproject.toml（没有requirements文件时）和 install.py。
+        """
+        sources = [path for path in root_files if os.path.isfile(path)]
+        if not os.path.isdir(nodes_dir):
+            return sources
+        node_files = []
+        for entry in os.scandir(nodes_dir):
+            if entry.name.startswith("."):
+                continue
+            if entry.is_file() and REQUIREMENTS_PATTERN.match(entry.name):
+                node_files.append(entry.path)
+            if not entry.is_dir():
+                continue
+            found = self._walk(entry.path)
+            node_files.extend(found)
+            has_root_requirements = any(os.path.dirname(path) == entry.path for path in found)
+            pyproject = os.path.join(entry.path, "pyproject.toml")
+            if not has_root_requirements and os.path.isfile(pyproject):
+                node_files.append(pyproject)
+            install_py = os.path.join(entry.path, "install.py")
+            if os.path.isfile(install_py):
+                node_files.append(install_py)
+        return sources + sorted(node_files)
+
+    def parse_file(self, path):
+        """解析单个文件，内容未变化时直接使用缓存的结果。"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        key = f"{os.path.basename(path)}:{digest}"
+        self.used.add(key)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["cached"] += 1
+            return cached
+        entries = parse_file_content(path, data)
+        self.cache[key] = entries
+        self.dirty = True
+        self.stats["parsed"] += 1
+        return entries
+
+    def scan(self, sources):
+        """解析所有顶层文件并跟随 -r/-c 引用，返回ScanResult。"""
+        result = ScanResult()
+        seen = set()
+        for path in sources:
+            self._scan_file(path, "requirement", result, seen)
+        return result
+
+    def _scan_file(self, path, mode, result, seen):
+        path = os.path.normpath(path)
+        if (path, mode) in seen:
+            return
+        seen.add((path, mode))
+        try:
+            entries = self.parse_file(path)
+        except OSError as e:
+            result.errors.append((path, "", f"读取失败: {e}"))
+            return
+        if path not in result.files:
+            result.files.append(path)
+
+        for entry in entries:
+            kind = entry["kind"]
+            if kind == "requirement":
+                target = result.requirements if mode == "requirement" else result.constraints
+                target.append((path, Requirement(entry["value"])))
+            elif kind == "include":
+                if "://" in entry["value"]:
+                    result.errors.append((path, entry["value"], "不支持引用远程需求文件"))
+                    continue
+                # 约束文件中引用的文件同样只作为约束
+                include_mode = "constraint" if mode == "constraint" else entry["mode"]
+                self._scan_file(os.path.join(os.path.dirname(path), entry["value"]), include_mode, result, seen)
+            elif kind == "index":
+                result.index_options.append((entry["option"], entry["value"], path))
+            elif kind == "error":
+                result.errors.append((path, entry["value"], entry["error"]))
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="扫描ComfyUI和自定义节点的依赖声明")
+    parser.add_argument("--nodes-dir", default="/app/custom_nodes")
+    parser.add_argument("--root-requirements", nargs="*", default=["/app/requirements.txt"])
+    parser.add_argument("--cache", default=SCAN_CACHE_FILE, help="解析结果缓存文件，为空时不使用缓存")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    scanner = RequirementsScanner(args.cache)
+    sources = scanner.find_sources(args.root_requirements, args.nodes_dir)
+    result = scanner.scan(sources)
+    scanner.save()
+
+    for path, req in result.requirements:
+        print(f"{path}\t{req}")
+    for path, req in result.constraints:
+        print(f"{path}\t-c {req}")
+    for option, value, path in result.index_options:
+        print(f"{path}\t{option} {value}")
+    for path, value, error in result.errors:
+        LOGGER.warning(f"✗ {path}: '{value}' {error}")
+    LOGGER.info(f"✓ 扫描了 {len(result.files)} 个文件 (解析 {scanner.stats['parsed']} 个, "
+                f"使用缓存 {scanner.stats['cached']} 个): {len(result.requirements)} 条需求, "
+                f"{len(result.constraints)} 条约束, {len(result.index_options)} 个下载源选项 "
+                f"({time.time() - started:.2f}秒)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,43 +1,6 @@
 #!/bin/bash
+# 兼容旧的调用方式：权限设置已迁移到 fix_permissions.py。
+# 该脚本在一次遍历中应用所有者与权限规则，并行处理子目录，
+# 并通过目录mtime日志使后续启动只处理发生变化的目录。
 
-# 设置关键目录权限为1001:1001
-echo "设置目录权限为1001:1001..."
-
-# 设置models目录权限
-if [ -d "/app/models" ]; then
-    # 如果是软链接，设置目标目录权限
-    if [ -L "/app/models" ]; then
-        target_dir=$(readlink "/app/models")
-        if [ -d "$target_dir" ]; then
-            echo "设置软链接目标目录权限: $target_dir"
-            chown -R 1001:1001 "$target_dir" 2>/dev/null || echo "无法设置 $target_dir 权限，可能需要sudo权限"
-        fi
-    else
-        echo "设置/app/models权限"
-        chown -R 1001:1001 "/app/models" 2>/dev/null || echo "无法设置/app/models权限，可能需要sudo权限"
-    fi
-fi
-
-# 设置custom_nodes目录权限
-if [ -d "/app/custom_nodes" ]; then
-    # 如果是软链接，设置目标目录权限
-    if [ -L "/app/custom_nodes" ]; then
-        target_dir=$(readlink "/app/custom_nodes")
-        if [ -d "$target_dir" ]; then
-            echo "设置软链接目标目录权限: $target_dir"
-            chown -R 1001:1001 "$target_dir" 2>/dev/null || echo "无法设置 $target_dir 权限，可能需要sudo权限"
-        fi
-    else
-        echo "设置/app/custom_nodes权限"
-        chown -R 1001:1001 "/app/custom_nodes" 2>/dev/null || echo "无法设置/app/custom_nodes权限，可能需要sudo权限"
-    fi
-fi
-
-# 确保custom_nodes下的所有文件都有写权限
-if [ -d "/app/custom_nodes" ]; then
-    echo "确保custom_nodes下文件的写权限..."
-    find /app/custom_nodes -type f -exec chmod 664 {} \; 2>/dev/null || echo "部分文件权限设置失败"
-    find /app/custom_nodes -type d -exec chmod 775 {} \; 2>/dev/null || echo "部分目录权限设置失败"
-fi
-
-echo "权限设置完成" 
\ No newline at end of file
+exec python "$(dirname "$0")/fix_permissions.py" "$@"
@@ -70,4 +70,6 @@ else
     fi
 fi
 
+# 模型去重（MODEL_DEDUP=true）由 startup.py 的 model_dedup 步骤在本脚本之后单独执行
+
 echo "外部数据目录设置完成。" 
\ No newline at end of file
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+安装后的空间占用分析与精简。
+
+1. 统计虚拟环境中每个发行包以及每个自定义节点占用的字节数。
+2. 查找重复内容（只报告，不自动删除）：
+   - torch自带的CUDA库与 nvidia-* wheel、系统CUDA目录之间重复的共享库；
+   - _resolve_versions 本应统一掉、但仍被安装的 opencv-* 变体；
+   - 自定义节点仓库中内容相同的模型权重文件。
+3. 按策略删除可以安全去掉的内容：测试目录、其他解释器版本的 __pycache__ 文件等。
+   默认只统计（dry run），使用 --apply 才会真正删除，并输出前后对比报告。
+
+注意：Docker镜像中在后续层删除文件不会减小镜像体积，
+因此精简必须与安装在同一个RUN中执行（build_dependencies.py 在安装阶段之后自动调用）。
+
+策略文件（JSON）示例：
+    {"venv": {"remove_dirs": ["tests"], "keep": ["*/pandas/tests"], "foreign_pycache": true},
+     "custom_nodes": {"remove_dirs": [".github", "tests"], "keep": [], "foreign_pycache": true}}
+keep 中的模式按 fnmatch 匹配目录的绝对路径，匹配的目录不会被删除。
+"""
+
+import argparse
+import hashlib
+import importlib.metadata
+import json
+import logging
+import os
+import re
+import shutil
+import site
+import sys
+import time
+from collections import defaultdict
+from fnmatch import fnmatch
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+CUSTOM_NODES_DIR = "/app/custom_nodes"
+REPORT_FILE = os.environ.get("FOOTPRINT_REPORT_FILE", "/app/footprint_report.json")
+POLICY_FILE = os.environ.get("SLIM_POLICY_FILE", "")
+# 系统CUDA库目录，用于查找与wheel中CUDA库重复的文件
+SYSTEM_CUDA_DIRS = ["/usr/local/cuda/lib64"]
+
+DEFAULT_POLICY = {
+    "venv": {
+        "remove_dirs": ["tests"],
+        "keep": [],
+        "foreign_pycache": True,
+    },
+    "custom_nodes": {
+        "remove_dirs": [".github", "tests"],
+        "keep": [],
+        "foreign_pycache": True,
+    },
+}
+
+# 统一使用的OpenCV发行包，其余 opencv-* 变体视为残留
+OPENCV_KEEP = "opencv-contrib-python-headless"
+CUDA_LIBRARY = re.compile(
+    r"^(lib(?:cudnn\w*|cublas\w*|cufft\w*|curand|cusolver\w*|cusparse\w*|nccl|nvrtc\w*|cudart|"
+    r"nvJitLink|cupti|nvToolsExt))\.so(?:\.[\d.]+)?$"
+)
+WEIGHT_SUFFIXES = (".safetensors", ".ckpt", ".pt", ".pth", ".bin", ".onnx", ".pkl", ".h5")
+MIN_WEIGHT_SIZE = 1024 * 1024
+PYCACHE_TAG = re.compile(r"\.(cpython-\d+|pypy\d+)[^.]*\.pyc$")
+
+
+def human_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def site_packages_dirs():
+    """当前解释器（应为/venv中的python）的site-packages目录。"""
+    return [path for path in site.getsitepackages() if os.path.isdir(path)]
+
+
+def load_policy(path=POLICY_FILE):
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            for scope, rules in json.load(f).items():
+                policy.setdefault(scope, {}).update(rules)
+    return policy
+
+
+def distribution_sizes(site_dirs):
+    """{发行包名: 字节数}，按RECORD中记录的文件统计。"""
+    sizes = {}
+    for dist in importlib.metadata.distributions(path=site_dirs):
+        total = 0
+        for file in dist.files or []:
+            try:
+                total += os.lstat(dist.locate_file(file)).st_size
+            except OSError:
+                pass
+        sizes[dist.metadata["Name"]] = sizes.get(dist.metadata["Name"], 0) + total
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+
+def node_sizes(nodes_dir):
+    if not os.path.isdir(nodes_dir):
+        return {}
+    sizes = {entry.name: directory_size(entry.path)
+             for entry in os.scandir(nodes_dir) if entry.is_dir(follow_symlinks=False)}
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+
+def find_cuda_duplicates(site_dirs):
+    """按库名分组查找出现在多个位置的CUDA共享库。"""
+    groups = defaultdict(list)
+    for root_dir in site_dirs + [d for d in SYSTEM_CUDA_DIRS if os.path.isdir(d)]:
+        for root, _, files in os.walk(root_dir):
+            for name in files:
+                match = CUDA_LIBRARY.match(name)
+                path = os.path.join(root, name)
+                if match and not os.path.islink(path):
+                    groups[match.group(1)].append({"path": path, "size": os.lstat(path).st_size})
+    duplicates = []
+    for library, copies in sorted(groups.items()):
+        if len(copies) > 1:
+            sizes = sorted(copy["size"] for copy in copies)
+            duplicates.append({"library": library, "copies": copies, "redundant_bytes": sum(sizes[:-1])})
+    return duplicates
+
+
+def find_opencv_leftovers(site_dirs):
+    """查找除统一版本之外仍被安装的opencv-*发行包。"""
+    leftovers = []
+    for dist in importlib.metadata.distributions(path=site_dirs):
+        name = dist.metadata["Name"].lower().replace("_", "-")
+        if name.startswith("opencv-") and name != OPENCV_KEEP:
+            leftovers.append({"name": dist.metadata["Name"], "version": dist.version})
+    return leftovers
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_duplicate_weights(nodes_dir):
+    """查找自定义节点中内容相同的模型权重文件：先按大小分组，只对同大小的文件计算哈希。"""
+    by_size = defaultdict(list)
+    if not os.path.isdir(nodes_dir):
+        return []
+    for root, dirs, files in os.walk(nodes_dir):
+        dirs[:] = [d for d in dirs if d != ".git"]
+        for name in files:
+            if not name.endswith(WEIGHT_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if st.st_size >= MIN_WEIGHT_SIZE and not os.path.islink(path):
+                by_size[st.st_size].append(path)
+
+    duplicates = []
+    for size, paths in by_size.items():
+        if len(paths) < 2:
+            continue
+        by_hash = defaultdict(list)
+        for path in paths:
+            by_hash[sha256_file(path)].append(path)
+        for digest, same in by_hash.items():
+            if len(same) > 1:
+                duplicates.append({"sha256": digest, "size": size, "paths": sorted(same),
+                                   "redundant_bytes": size * (len(same) - 1)})
+    return sorted(duplicates, key=lambda item: item["redundant_bytes"], reverse=True)
+
+
+def collect_removals(root, rules):
+    """
+    按策略找出root下可以删除的目录和文件，返回 {规则: [(路径, 字节数)]}。
+    """
+    remove_dirs = set(rules.get("remove_dirs", []))
+    keep = rules.get("keep", [])
+    current_tag = sys.implementation.cache_tag
+    removals = defaultdict(list)
+    for current, dirs, files in os.walk(root):
+        kept = []
+        for name in dirs:
+            path = os.path.join(current, name)
+            if name in remove_dirs and not any(fnmatch(path, pattern) for pattern in keep):
+                removals[f"dir:{name}"].append((path, directory_size(path)))
+            else:
+                kept.append(name)
+        dirs[:] = kept
+        if rules.get("foreign_pycache") and os.path.basename(current) == "__pycache__":
+            for name in files:
+                match = PYCACHE_TAG.search(name)
+                if match and match.group(1) != current_tag:
+                    path = os.path.join(current, name)
+                    removals["foreign_pycache"].append((path, os.lstat(path).st_size))
+    return removals
+
+
+def apply_removals(removals):
+    removed = 0
+    for entries in removals.values():
+        for path, size in entries:
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                removed += size
+            except OSError as e:
+                LOGGER.warning(f"无法删除 {path}: {e}")
+    return removed
+
+
+def slim(scope="all", apply=False, policy=None, report_path=REPORT_FILE,
+         site_dirs=None, nodes_dir=CUSTOM_NODES_DIR):
+    """分析并（可选地）精简虚拟环境和自定义节点，返回报告。"""
+    started = time.time()
+    policy = policy or load_policy()
+    site_dirs = site_dirs if site_dirs is not None else site_packages_dirs()
+    targets = []
+    if scope in ("all", "venv"):
+        targets += [("venv", path) for path in site_dirs]
+    if scope in ("all", "nodes") and os.path.isdir(nodes_dir):
+        targets.append(("custom_nodes", nodes_dir))
+
+    report = {"scope": scope, "applied": apply, "before": {}, "after": {}, "removals": {}}
+    for kind, path in targets:
+        report["before"][path] = directory_size(path)
+
+    if scope in ("all", "venv"):
+        report["distributions"] = distribution_sizes(site_dirs)
+        report["cuda_duplicates"] = find_cuda_duplicates(site_dirs)
+        report["opencv_leftovers"] = find_opencv_leftovers(site_dirs)
+    if scope in ("all", "nodes"):
+        report["custom_nodes"] = node_sizes(nodes_dir)
+        report["duplicate_weights"] = find_duplicate_weights(nodes_dir)
+
+    for kind, path in targets:
+        removals = collect_removals(path, policy.get(kind, {}))
+        for rule, entries in removals.items():
+            summary = report["removals"].setdefault(rule, {"count": 0, "bytes": 0})
+            summary["count"] += len(entries)
+            summary["bytes"] += sum(size for _, size in entries)
+        if apply:
+            apply_removals(removals)
+
+    for kind, path in targets:
+        report["after"][path] = directory_size(path) if apply else report["before"][path]
+    report["seconds"] = round(time.time() - started, 3)
+
+    if report_path:
+        try:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            LOGGER.warning(f"无法写入空间占用报告 {report_path}: {e}")
+    log_report(report)
+    return report
+
+
+def log_report(report):
+    if report.get("distributions"):
+        LOGGER.info("占用空间最大的发行包:")
+        for name, size in list(report["distributions"].items())[:15]:
+            LOGGER.info(f"  {human_size(size):>10}  {name}")
+    if report.get("custom_nodes"):
+        LOGGER.info("占用空间最大的自定义节点:")
+        for name, size in list(report["custom_nodes"].items())[:10]:
+            LOGGER.info(f"  {human_size(size):>10}  {name}")
+    for item in report.get("cuda_duplicates", []):
+        LOGGER.warning(f"CUDA库 {item['library']} 存在 {len(item['copies'])} 份 "
+                       f"(冗余 {human_size(item['redundant_bytes'])}): "
+                       f"{', '.join(copy['path'] for copy in item['copies'])}")
+    for item in report.get("opencv_leftovers", []):
+        LOGGER.warning(f"残留的OpenCV变体: {item['name']}=={item['version']}（与{OPENCV_KEEP}共用cv2目录，请在构建时避免安装）")
+    for item in report.get("duplicate_weights", [])[:10]:
+        LOGGER.warning(f"重复的模型权重 (冗余 {human_size(item['redundant_bytes'])}): {', '.join(item['paths'])}")
+    for rule, summary in sorted(report["removals"].items()):
+        verb = "已删除" if report["applied"] else "可删除"
+        LOGGER.info(f"{verb} [{rule}]: {summary['count']} 项, {human_size(summary['bytes'])}")
+    before = sum(report["before"].values())
+    after = sum(report["after"].values())
+    LOGGER.info(f"✓ 空间占用: {human_size(before)} -> {human_size(after)} "
+                f"({'已精简' if report['applied'] else '预览，使用--apply执行'}, {report['seconds']:.1f}秒)")
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="分析并精简虚拟环境和自定义节点的空间占用")
+    parser.add_argument("--scope", choices=["all", "venv", "nodes"], default="all", help="分析范围")
+    parser.add_argument("--apply", action="store_true", help="按策略删除可安全删除的内容（默认只预览）")
+    parser.add_argument("--policy", default=POLICY_FILE, help="JSON策略文件，覆盖默认策略")
+    parser.add_argument("--nodes-dir", default=CUSTOM_NODES_DIR, help="自定义节点目录")
+    parser.add_argument("--report", default=REPORT_FILE, help="JSON报告输出路径")
+    args = parser.parse_args(argv)
+
+    slim(args.scope, args.apply, load_policy(args.policy), args.report, nodes_dir=args.nodes_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
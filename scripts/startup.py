@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+容器启动编排器。
+
+entrypoint.sh 原先逐个执行所有启动步骤。这里把这些步骤声明为依赖图：
+    - 依赖已完成的步骤并发执行（例如网络配置、外部数据目录、模型下载、依赖验证互不依赖）
+    - 输入（脚本、配置文件、目录mtime、环境变量）自上次成功以来没有变化的步骤直接跳过
+    - 每个步骤有独立的超时时间（STARTUP_TIMEOUT_<步骤名大写>，单位秒，0表示不限制）
+    - 结束时输出每个步骤的耗时表，随后由 entrypoint.sh exec ComfyUI
+
+跳过状态保存在 STARTUP_STATE_FILE（默认在持久化数据目录 /root/data 中，不存在时放在 /app/.cache），
+因此Pod重新调度到新容器后，镜像内容未变化的步骤（例如依赖验证）同样可以跳过。
+只影响容器自身文件系统的步骤（软链接、pip配置等）标记为per_container，它们的指纹包含容器ID，
+在新容器中总会重新执行。
+
+必需的步骤失败或超时时，依赖它的步骤不会执行，编排器以非零状态退出；
+非必需的步骤（例如模型下载）失败只输出警告。
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# --- 基本设置 ---
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - [%(levelname)s] - %(message)s',
+    stream=sys.stdout
+)
+LOGGER = logging.getLogger(__name__)
+
+# --- 配置 ---
+SCRIPTS_DIR = "/app/scripts"
+DATA_DIR = "/root/data"
+STATE_FILE = os.environ.get(
+    "STARTUP_STATE_FILE",
+    os.path.join(DATA_DIR, ".startup_state.json") if os.path.isdir(DATA_DIR) else "/app/.cache/startup_state.json",
+)
+# 保存在容器文件系统中，新容器中不存在，用于区分per_container步骤的状态
+CONTAINER_ID_FILE = "/app/.cache/.container_id"
+STARTUP_JOBS = int(os.environ.get("STARTUP_JOBS", "4"))
+FORCE_STARTUP = os.environ.get("STARTUP_FORCE", "false").lower() in ("true", "1", "yes")
+# 目录的指纹使用mtime，文件的指纹使用内容哈希；超过该大小的文件改用大小和mtime
+MAX_HASH_SIZE = 16 * 1024 * 1024
+
+# 依赖失败时会阻止后续步骤的状态
+FAILED_STATUSES = ("failed", "timeout", "blocked")
+
+
+def env_flag(name, default="false"):
+    return os.environ.get(name, default).lower() in ("true", "1", "yes")
+
+
+class Step:
+    """
+    启动图中的一个步骤。
+
+    command: 命令列表，或者不带参数、返回是否成功的Python函数
+    inputs:  决定能否跳过的文件或目录，None表示每次都执行
+    env:     同样参与指纹计算的环境变量名
+    """
+
+    def __init__(self, name, command, deps=(), inputs=None, env=(), per_container=True,
+                 required=True, timeout=600, enabled=True):
+        self.name = name
+        self.command = command
+        self.deps = list(deps)
+        self.inputs = inputs
+        self.env = list(env)
+        self.per_container = per_container
+        self.required = required
+        self.timeout = int(os.environ.get(f"STARTUP_TIMEOUT_{name.upper()}", timeout))
+        self.enabled = enabled
+
+
+class StepResult:
+    def __init__(self, status, started=0.0, duration=0.0, detail=""):
+        self.status = status
+        self.started = started
+        self.duration = duration
+        self.detail = detail
+
+
+def script(name):
+    return os.path.join(SCRIPTS_DIR, name)
+
+
+def check_directories():
+    """确保ComfyUI的可写目录存在，并测试用户目录的写权限。"""
+    for path in ("/app/user", "/app/output", "/app/temp"):
+        os.makedirs(path, exist_ok=True)
+    print(f"当前用户: UID {os.getuid()}, GID {os.getgid()}")
+    test_dir = f"/app/user/test_{int(time.time())}_{os.getpid()}"
+    try:
+        os.makedirs(test_dir)
+        os.rmdir(test_dir)
+        print("✓ 用户目录写权限正常")
+    except OSError as e:
+        # 与原先的启动流程一致，写权限异常只提示，不阻止启动
+        print(f"✗ 用户目录写权限异常: {e}")
+    return True
+
+
+def build_steps():
+    """声明启动步骤及其依赖关系。"""
+    manifest = os.environ.get("MODEL_MANIFEST", "/app/models_manifest.json")
+    update = env_flag("UPDATE_REPOSITORIES")
+    permissions_command = (["python", script("fix_permissions.py")] if os.path.exists(script("fix_permissions.py"))
+                           else ["bash", script("set_permissions.sh")])
+    return [
+        Step("network", ["bash", script("fix_network_timeout.sh")],
+             inputs=[script("fix_network_timeout.sh"), script("pip_mirrors.py")], timeout=120,
+             enabled=os.path.exists(script("fix_network_timeout.sh"))),
+        Step("external_data", ["bash", script("setup_external_data.sh")],
+             inputs=[script("setup_external_data.sh"), os.path.join(DATA_DIR, "models"),
+                     os.path.join(DATA_DIR, "custom_nodes")],
+             env=["SKIP_MODELS_SYMLINK", "SKIP_CUSTOM_NODES_SYMLINK"],
+             timeout=3600, enabled=os.path.exists(script("setup_external_data.sh"))),
+        # 第一次去重要计算整个模型目录的哈希，可能耗时很久，因此不设超时且不阻塞其他步骤
+        Step("model_dedup", ["python", script("model_store.py"), "--root", "/app/models"],
+             deps=["external_data"], env=["MODEL_STORE_DIR", "MODEL_STORE_LINK_MODE"],
+             required=False, timeout=0,
+             enabled=env_flag("MODEL_DEDUP") and os.path.exists(script("model_store.py"))),
+        # 节点更新本身是增量的（ls-remote对比锁文件），启用时每次都执行。
+        # 构建时删除了 /app/.git，ComfyUI本身只在仍是git仓库时更新，其结果不影响节点更新
+        Step("update_repositories",
+             ["bash", "-c", "if [ -d /app/.git ]; then git -C /app pull || echo '警告: ComfyUI更新失败'; "
+                            "else echo '/app 不是git仓库（构建时已删除.git），跳过ComfyUI更新'; fi; "
+                            f"python {script('install_custom_nodes.py')} --update --resolve-dependencies"],
+             deps=["network", "external_data"], timeout=3600, enabled=update),
+        # 快照服务以后台进程启动，只等待端口就绪几秒，不阻塞启动
+        Step("manager_snapshot", ["python", script("manager_snapshot.py"), "start"],
+             required=False, timeout=30, enabled=os.path.exists(script("manager_snapshot.py"))),
+        # 更新会重置节点仓库中的修改，因此Manager配置在更新之后进行；
+        # 只有快照服务确实在运行时才把channel_url指向它。服务是否在运行不体现在任何输入文件上，
+        # 因此每次都执行（配置脚本只在内容变化时写文件，补丁按校验和验证，开销很小）
+        Step("manager_config", ["python", script("configure_comfyui_manager.py")],
+             deps=["external_data", "update_repositories", "manager_snapshot"],
+             timeout=120, enabled=os.path.exists(script("configure_comfyui_manager.py"))),
+        Step("node_denylist", ["python", script("profile_custom_nodes.py"), "apply"],
+             deps=["external_data", "update_repositories"],
+             inputs=[os.environ.get("NODE_DENYLIST_FILE", os.path.join(DATA_DIR, "custom_nodes_denylist.txt")),
+                     "/app/custom_nodes"],
+             env=["DISABLED_CUSTOM_NODES"], required=False, timeout=120,
+             enabled=os.path.exists(script("profile_custom_nodes.py"))),
+        # 前面的步骤会在custom_nodes中创建文件，最后统一修正所有者和权限（fix_permissions.py自带增量日志）
+        Step("permissions", permissions_command,
+             deps=["external_data", "update_repositories", "manager_config", "node_denylist"],
+             timeout=1800),
+        # 下载器自己会跳过已存在且完整的文件；去重替换文件时不同时写入模型目录
+        Step("download_models", ["python", script("download_models.py")],
+             deps=["network", "external_data", "model_dedup"], required=False, timeout=0,
+             enabled=os.path.exists(manifest) and os.path.exists(script("download_models.py"))),
+        Step("model_index", ["python", script("model_index.py")],
+             deps=["download_models"], required=False, timeout=600,
+             enabled=os.path.exists(script("model_index.py"))),
+        Step("directories", check_directories, deps=["external_data"], timeout=0),
+        # site-packages只会在构建或依赖更新时变化，新容器中镜像内容相同时可以跳过
+        Step("verify_dependencies", ["python", script("verify_dependencies.py")],
+             deps=["network", "update_repositories"],
+             inputs=[script("verify_dependencies.py"), script("pinned_packages.py"),
+                     "/app/final_requirements.lock.json",
+                     os.path.join(sys.prefix, "lib", f"python{sys.version_info[0]}.{sys.version_info[1]}",
+                                  "site-packages")],
+             per_container=False, timeout=1800,
+             enabled=os.path.exists(script("verify_dependencies.py"))),
+    ]
+
+
+def container_id(path=CONTAINER_ID_FILE):
+    """读取或创建当前容器的ID。"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        pass
+    value = uuid.uuid4().hex
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(value)
+    except OSError as e:
+        LOGGER.warning(f"无法保存容器ID {path}: {e}")
+    return value
+
+
+def input_signature(path):
+    """文件使用内容哈希，目录使用mtime，不存在时记为missing。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    if os.path.isdir(path):
+        return f"dir:{st.st_mtime_ns}"
+    if st.st_size > MAX_HASH_SIZE:
+        return f"file:{st.st_size}:{st.st_mtime_ns}"
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def step_fingerprint(step, container):
+    """计算步骤的输入指纹；inputs为None的步骤返回None（不可跳过）。"""
+    if step.inputs is None:
+        return None
+    payload = {
+        "command": step.command if isinstance(step.command, list) else step.command.__name__,
+        "inputs": {path: input_signature(path) for path in step.inputs},
+        "env": {name: os.environ.get(name) for name in step.env},
+        "container": container if step.per_container else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def load_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(path, state):
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        LOGGER.warning(f"无法保存启动状态 {path}: {e}")
+
+
+class Orchestrator:
+    """按依赖图并发执行启动步骤。"""
+
+    def __init__(self, steps, state_path=STATE_FILE, jobs=STARTUP_JOBS, force=FORCE_STARTUP):
+        self.steps = {step.name: step for step in steps}
+        self.state_path = state_path
+        self.state = load_state(state_path)
+        self.fingerprints = self.state.setdefault("fingerprints", {})
+        self.jobs = jobs
+        self.force = force
+        self.container = container_id()
+        self.results = {}
+        self.output_lock = threading.Lock()
+        self.started = time.time()
+
+    def _print(self, name, line):
+        with self.output_lock:
+            sys.stdout.write(f"[{name}] {line}")
+            if not line.endswith("\n"):
+                sys.stdout.write("\n")
+            sys.stdout.flush()
+
+    def _run_command(self, step):
+        """运行命令并逐行转发输出，超时时终止整个进程组。返回 (状态, 说明)。"""
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        process = subprocess.Popen(step.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                   errors="replace", env=env, start_new_session=True)
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+        timer = threading.Timer(step.timeout, kill) if step.timeout > 0 else None
+        if timer:
+            timer.start()
+        try:
+            for line in process.stdout:
+                self._print(step.name, line)
+            returncode = process.wait()
+        finally:
+            if timer:
+                timer.cancel()
+        if timed_out.is_set():
+            return "timeout", f"超过 {step.timeout} 秒"
+        if returncode != 0:
+            return "failed", f"退出码 {returncode}"
+        return "ok", ""
+
+    def _run_step(self, step):
+        started = time.time() - self.started
+        fingerprint = step_fingerprint(step, self.container)
+        if not self.force and fingerprint and self.fingerprints.get(step.name) == fingerprint:
+            return StepResult("skipped", started, 0.0, "输入未变化")
+
+        LOGGER.info(f"▶ 开始: {step.name}")
+        begin = time.time()
+        try:
+            if callable(step.command):
+                status, detail = ("ok", "") if step.command() else ("failed", "")
+            else:
+                status, detail = self._run_command(step)
+        except Exception as e:
+            status, detail = "failed", f"{type(e).__name__}: {e}"
+        duration = time.time() - begin
+
+        if status == "ok" and step.inputs is not None:
+            # 步骤可能修改自己的输入（例如Manager配置），使用执行后的指纹
+            self.fingerprints[step.name] = step_fingerprint(step, self.container)
+        elif status != "ok":
+            self.fingerprints.pop(step.name, None)
+        marker = "✓" if status == "ok" else "✗"
+        LOGGER.info(f"{marker} {step.name}: {status} ({duration:.1f}秒){' ' + detail if detail else ''}")
+        return StepResult(status, started, duration, detail)
+
+    def _blocking_dependency(self, step):
+        for dep in step.deps:
+            result = self.results.get(dep)
+            if result and result.status in FAILED_STATUSES and self.steps[dep].required:
+                return dep
+        return None
+
+    def run(self):
+        """执行所有步骤，返回是否所有必需步骤都成功。"""
+        pending = dict(self.steps)
+        for step in pending.values():
+            unknown = [dep for dep in step.deps if dep not in self.steps]
+            if unknown:
+                raise ValueError(f"步骤 {step.name} 依赖未知的步骤: {unknown}")
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as executor:
+            while pending or running:
+                progressed = True
+                while progressed:
+                    progressed = False
+                    for name, step in list(pending.items()):
+                        if any(dep not in self.results for dep in step.deps):
+                            continue
+                        del pending[name]
+                        progressed = True
+                        now = time.time() - self.started
+                        if not step.enabled:
+                            self.results[name] = StepResult("disabled", now)
+                            continue
+                        blocker = self._blocking_dependency(step)
+                        if blocker:
+                            self.results[name] = StepResult("blocked", now, 0.0, f"依赖 {blocker} 失败")
+                            LOGGER.error(f"✗ {name}: 依赖 {blocker} 失败，未执行")
+                            continue
+                        running[executor.submit(self._run_step, step)] = name
+                if not running:
+                    if pending:
+                        raise ValueError(f"启动步骤存在循环依赖: {sorted(pending)}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.results[running.pop(future)] = future.result()
+
+        self.state["last_run"] = {
+            "finished": time.time(),
+            "steps": {name: {"status": result.status, "duration": round(result.duration, 3)}
+                      for name, result in self.results.items()},
+        }
+        save_state(self.state_path, self.state)
+        return not any(result.status in FAILED_STATUSES and self.steps[name].required
+                       for name, result in self.results.items())
+
+    def log_timings(self):
+        """输出每个步骤的开始时间和耗时，以及总耗时与串行执行耗时的对比。"""
+        wall = time.time() - self.started
+        LOGGER.info("=" * 64)
+        LOGGER.info(f"{'步骤':<22} {'状态':<9} {'开始(s)':>8} {'耗时(s)':>8}  说明")
+        for name, result in sorted(self.results.items(), key=lambda item: (item[1].started, item[0])):
+            LOGGER.info(f"{name:<22} {result.status:<9} {result.started:>8.1f} {result.duration:>8.1f}  {result.detail}")
+        serial = sum(result.duration for result in self.results.values())
+        LOGGER.info(f"启动步骤总耗时 {wall:.1f}秒（串行执行需要 {serial:.1f}秒）")
+        LOGGER.info("=" * 64)
+
+
+def main(argv=None):
+    """主函数"""
+    parser = argparse.ArgumentParser(description="按依赖图并发执行容器启动步骤")
+    parser.add_argument("--jobs", type=int, default=STARTUP_JOBS, help="同时执行的步骤数")
+    parser.add_argument("--force", action="store_true", default=FORCE_STARTUP, help="忽略跳过状态，执行所有步骤")
+    parser.add_argument("--state", default=STATE_FILE, help="跳过状态文件")
+    parser.add_argument("--list", action="store_true", help="只打印启动步骤及其依赖")
+    args = parser.parse_args(argv)
+
+    steps = build_steps()
+    if args.list:
+        for step in steps:
+            flags = [] if step.enabled else ["已禁用"]
+            flags += ["每次执行"] if step.inputs is None else []
+            flags += [] if step.required else ["非必需"]
+            print(f"{step.name:<22} <- {', '.join(step.deps) or '-':<50} {' '.join(flags)}")
+        return 0
+
+    orchestrator = Orchestrator(steps, args.state, args.jobs, args.force)
+    ok = orchestrator.run()
+    orchestrator.log_timings()
+    if not ok:
+        LOGGER.error("✗ 有必需的启动步骤失败，ComfyUI不会启动。")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,12 +13,19 @@ import sys
 import subprocess
 import logging
 import os
+import hashlib
+import json
+import shutil
+import time
 try:
     from importlib import metadata as importlib_metadata
 except ImportError:
     # 兼容 Python < 3.8
     import importlib_metadata
 
+from pinned_packages import PINNED_PACKAGES as BUILD_PINNED_PACKAGES
+from pip_mirrors import PYPI_INDEX_URL, TORCH_INDEX_URL, get_selector, is_network_error
+
 # --- 基本设置 ---
 logging.basicConfig(
     level=logging.INFO,
@@ -30,95 +37,275 @@ LOGGER = logging.getLogger(__name__)
 # --- 配置 ---
 # 这些是项目的核心依赖，必须固定到特定版本。
 # 此脚本将在每次容器启动时强制安装这些版本，以覆盖任何由自定义节点引起的不兼容更改。
+# 版本取自与build_dependencies.py共用的 pinned_packages.py，修复和烘焙不会装回构建刻意避开的版本。
+CORE_PACKAGES = ["torch", "torchvision", "torchaudio", "xformers", "numpy"]
+PINNED_PACKAGES = {name: BUILD_PINNED_PACKAGES[name] for name in CORE_PACKAGES}
+
+# 下载源使用规范地址，run_pip 通过 pip_mirrors 替换为最快的健康镜像
+PIP_INDEX_URL = PYPI_INDEX_URL
+
+# 记录上一次验证通过时site-packages状态的指纹文件。
+# 指纹未变化时直接退出，不调用importlib.metadata，也不启动任何子进程。
+STAMP_FILE = os.environ.get("VERIFY_STAMP_FILE", os.path.join(sys.prefix, ".verify_dependencies.stamp"))
+
+# 构建时烘焙进镜像的固定版本wheel存储。修复时优先从这里离线安装，
+# 只有存储中缺失或校验失败的包才会访问网络。
+CORE_WHEEL_STORE = os.environ.get("CORE_WHEEL_STORE", "/opt/core-wheels")
+CORE_WHEEL_MANIFEST = "manifest.json"
+
+def run_pip(args, retries=1):
+    """运行pip命令并处理输出。失败后换用尚未尝试过的镜像重试，最多retries次；只有网络类错误才记为镜像失败。"""
+    mirrors = get_selector()
+    tried = set()
+    for attempt in range(retries):
+        attempt_args = mirrors.rewrite(args, tried)
+        tried.update(mirrors.mirrors_in(attempt_args))
+        command = [sys.executable, "-m", "pip"] + attempt_args
+        try:
+            # 使用subprocess.run而不是直接打印，以更好地控制日志记录
+            result = subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8')
+            LOGGER.info(result.stdout)
+            if result.stderr:
+                LOGGER.warning(result.stderr)
+            mirrors.report(attempt_args, ok=True)
+            return
+        except subprocess.CalledProcessError as e:
+            LOGGER.error(f"执行失败: {' '.join(command)}")
+            LOGGER.error(f"Pip stdout:\n{e.stdout}")
+            LOGGER.error(f"Pip stderr:\n{e.stderr}")
+            if is_network_error(e.stderr):
+                mirrors.report(attempt_args, ok=False)
+            if attempt + 1 == retries or mirrors.rewrite(args, tried) == attempt_args:
+                raise
+            LOGGER.warning(f"将换用下一个镜像重试 ({attempt + 2}/{retries})...")
+
+def site_packages_dirs():
+    """返回当前解释器使用的所有site-packages目录。"""
+    return [path for path in sys.path
+            if os.path.basename(path) in ("site-packages", "dist-packages") and os.path.isdir(path)]
+
+
+def compute_fingerprint():
+    """根据固定版本表以及各site-packages中dist-info目录的名称和修改时间计算指纹。"""
+    digest = hashlib.sha256(json.dumps(PINNED_PACKAGES, sort_keys=True).encode("utf-8"))
+    for directory in site_packages_dirs():
+        digest.update(f"{directory}:{os.stat(directory).st_mtime_ns}\n".encode("utf-8"))
+        entries = sorted((entry.name, entry.stat().st_mtime_ns) for entry in os.scandir(directory)
+                         if entry.name.endswith((".dist-info", ".egg-info")))
+        for name, mtime in entries:
+            digest.update(f"{name}:{mtime}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def read_stamp():
+    try:
+        with open(STAMP_FILE, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
 
-# "numpy": "1.26.4"
+def write_stamp(fingerprint):
+    try:
+        with open(STAMP_FILE, 'w', encoding='utf-8') as f:
+            f.write(fingerprint)
+    except OSError as e:
+        LOGGER.warning(f"无法写入验证指纹文件 {STAMP_FILE}: {e}")
+
+
+def find_drift(force_reinstall=False):
+    """
+    按PEP 440比较已安装版本与固定版本，一次性返回所有不一致的包。
 
-# PINNED_PACKAGES = {
-#     "torch": "2.5.1",
-#     "torchvision": "0.20.1",
-#     "torchaudio": "2.5.1",
-#     "xformers": "0.0.29.post1"
-# }
+    返回 [(name, 固定版本, 已安装版本或None), ...]。
+    本地版本标签（如 +cu124）不参与比较，因此 2.6.0+cu124 满足 ==2.6.0。
+    """
+    from packaging.specifiers import SpecifierSet
+
+    drift = []
+    for name, version in PINNED_PACKAGES.items():
+        try:
+            installed_version = importlib_metadata.version(name)
+        except importlib_metadata.PackageNotFoundError:
+            drift.append((name, version, None))
+            continue
+        if force_reinstall or not SpecifierSet(f"=={version}").contains(installed_version, prereleases=True):
+            drift.append((name, version, installed_version))
+        else:
+            LOGGER.info(f"✓ {name}=={installed_version} 版本正确，无需操作。")
+    return drift
 
-PINNED_PACKAGES = {
-    "torch": "2.6.0",
-    "torchvision": "0.21.0",
-    "torchaudio": "2.6.0",
-    "xformers": "v0.0.29.post2",
-    "numpy": "1.26.4"
-}
 
-# PyPI 镜像源
-PIP_INDEX_URL = "https://pypi.tuna.tsinghua.edu.cn/simple"
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-# PyTorch专用下载源
-TORCH_INDEX_URL = "https://download.pytorch.org/whl/cu121"
 
-def run_pip(args):
-    """运行pip命令并处理输出。"""
-    command = [sys.executable, "-m", "pip"] + args
+def load_store_manifest():
+    """读取wheel存储的清单，返回 {name: {version, filename, sha256, size}}。"""
+    manifest_path = os.path.join(CORE_WHEEL_STORE, CORE_WHEEL_MANIFEST)
     try:
-        # 使用subprocess.run而不是直接打印，以更好地控制日志记录
-        result = subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8')
-        LOGGER.info(result.stdout)
-        if result.stderr:
-            LOGGER.warning(result.stderr)
-    except subprocess.CalledProcessError as e:
-        LOGGER.error(f"执行失败: {' '.join(command)}")
-        LOGGER.error(f"Pip stdout:\n{e.stdout}")
-        LOGGER.error(f"Pip stderr:\n{e.stderr}")
-        raise
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def find_stored_wheels(drift):
+    """返回可以从本地存储离线修复的 {name: wheel路径}，缺失或校验失败的包不包含在内。"""
+    manifest = load_store_manifest()
+    stored = {}
+    for name, version, _ in drift:
+        entry = manifest.get(name)
+        if not entry or entry.get("version") != version:
+            continue
+        path = os.path.join(CORE_WHEEL_STORE, entry["filename"])
+        if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+            LOGGER.warning(f"本地存储中的 {entry['filename']} 缺失或大小不符，将在线修复。")
+            continue
+        if sha256_file(path) != entry["sha256"]:
+            LOGGER.warning(f"本地存储中的 {entry['filename']} 校验失败，将在线修复。")
+            continue
+        stored[name] = path
+    return stored
+
+
+def online_index_args(names):
+    # 包含torch相关包时使用专用源，并以配置的镜像源作为补充
+    if any(name.lower() in ["torch", "torchvision", "torchaudio"] for name in names):
+        return ["--index-url", TORCH_INDEX_URL, "--extra-index-url", PIP_INDEX_URL]
+    return ["--index-url", PIP_INDEX_URL]
+
+
+def repair(drift):
+    """
+    重新安装所有不一致的包：存储中有的从本地wheel离线安装，其余的使用一次在线pip调用。
+    """
+    # 使用--force-reinstall确保即使已安装正确版本也会重新链接，以修复潜在的损坏
+    # 使用--no-deps防止在重新安装核心包时牵连到其他包
+    base_args = ["install", "--force-reinstall", "--no-dependencies"]
+    stored = find_stored_wheels(drift)
+    online = [(name, version) for name, version, _ in drift if name not in stored]
+
+    if stored:
+        started = time.perf_counter()
+        run_pip(base_args + sorted(stored.values()) + ["--no-index", "--find-links", CORE_WHEEL_STORE])
+        LOGGER.info(f"已从本地wheel存储离线修复 {sorted(stored)}，耗时 {time.perf_counter() - started:.2f} 秒。")
+
+    if online:
+        started = time.perf_counter()
+        names = [name for name, _ in online]
+        run_pip(base_args + [f"{name}=={version}" for name, version in online] + online_index_args(names), retries=3)
+        LOGGER.info(f"已在线修复 {names}，耗时 {time.perf_counter() - started:.2f} 秒。")
+
+
+def find_wheelhouse_wheel(wheelhouse_dir, name, version):
+    """
+    在构建阶段的wheel缓存中查找与固定版本匹配的wheel。
+
+    只查找当前Python标签和CUDA标签对应的子目录，并要求wheel标签与当前解释器兼容，
+    避免把其他Python版本或其他CUDA版本（例如+cu118）的wheel烘焙进镜像。
+    """
+    from packaging.specifiers import SpecifierSet
+    from packaging.tags import sys_tags
+    from packaging.utils import canonicalize_name, parse_wheel_filename
+
+    from build_dependencies import Wheelhouse
+
+    if not wheelhouse_dir or not os.path.isdir(wheelhouse_dir):
+        return None
+    path = Wheelhouse(wheelhouse_dir).path
+    spec = SpecifierSet(f"=={version}")
+    supported = set(sys_tags())
+    for filename in sorted(os.listdir(path)):
+        if not filename.endswith(".whl"):
+            continue
+        try:
+            wheel_name, wheel_version, _, wheel_tags = parse_wheel_filename(filename)
+        except Exception:
+            continue
+        if (wheel_name == canonicalize_name(name) and spec.contains(wheel_version, prereleases=True)
+                and not wheel_tags.isdisjoint(supported)):
+            return os.path.join(path, filename)
+    return None
+
+
+def bake_store():
+    """构建阶段：把所有固定版本的wheel保存到本地存储，并写入带校验和的清单。"""
+    LOGGER.info(f"正在将核心依赖的wheel烘焙到 {CORE_WHEEL_STORE}...")
+    os.makedirs(CORE_WHEEL_STORE, exist_ok=True)
+    manifest = {}
+    wheelhouse_dir = os.environ.get("WHEELHOUSE_DIR", "")
+
+    for name, version in PINNED_PACKAGES.items():
+        source = find_wheelhouse_wheel(wheelhouse_dir, name, version)
+        if source:
+            shutil.copy2(source, CORE_WHEEL_STORE)
+            filename = os.path.basename(source)
+        else:
+            before = set(os.listdir(CORE_WHEEL_STORE))
+            run_pip(["download", "--no-deps", "--only-binary=:all:", "--dest", CORE_WHEEL_STORE,
+                     f"{name}=={version}"] + online_index_args([name]), retries=3)
+            new_files = sorted(set(os.listdir(CORE_WHEEL_STORE)) - before)
+            if not new_files:
+                LOGGER.error(f"✗ 未能获取 {name}=={version} 的wheel。")
+                continue
+            filename = new_files[0]
+        path = os.path.join(CORE_WHEEL_STORE, filename)
+        manifest[name] = {
+            "version": version,
+            "filename": filename,
+            "sha256": sha256_file(path),
+            "size": os.path.getsize(path),
+        }
+        LOGGER.info(f"✓ {name}=={version} -> {filename} ({manifest[name]['size'] / 1024 / 1024:.1f} MB)")
+
+    with open(os.path.join(CORE_WHEEL_STORE, CORE_WHEEL_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    LOGGER.info(f"核心依赖wheel存储已完成: {len(manifest)}/{len(PINNED_PACKAGES)} 个。")
+    return 0 if len(manifest) == len(PINNED_PACKAGES) else 1
+
 
 def verify_and_install():
     """验证并强制安装所有固定版本的包。"""
-    LOGGER.info("开始核心依赖验证和安装...")
-
+    started = time.perf_counter()
     force_reinstall = os.environ.get('FORCE_REINSTALL_CORE_DEPS', 'false').lower() in ('true', '1', 'yes')
+
+    fingerprint = compute_fingerprint()
+    if not force_reinstall and read_stamp() == fingerprint:
+        LOGGER.info(f"site-packages 未发生变化，跳过核心依赖验证 ({(time.perf_counter() - started) * 1000:.1f} ms)。")
+        return
+
+    LOGGER.info("开始核心依赖验证和安装...")
     if force_reinstall:
         LOGGER.warning("环境变量 FORCE_REINSTALL_CORE_DEPS 已设置，将强制重新安装所有核心依赖。")
 
-    for name, version in PINNED_PACKAGES.items():
-        should_install = False
-        reason = ""
+    drift = find_drift(force_reinstall)
+    if drift:
+        LOGGER.warning(f"发现 {len(drift)} 个核心依赖需要安装/更新:")
+        for name, version, installed_version in drift:
+            LOGGER.warning(f"  {name}: 已安装 {installed_version or '未安装'}，需要 {version}")
+        repair_started = time.perf_counter()
+        try:
+            repair(drift)
+        except Exception as e:
+            LOGGER.error(f"✗ 安装核心依赖失败。错误: {e}")
+            return
+        LOGGER.info(f"核心依赖修复耗时 {time.perf_counter() - repair_started:.2f} 秒。")
+        remaining = find_drift()
+        if remaining:
+            LOGGER.error(f"✗ 修复后仍有 {len(remaining)} 个核心依赖版本不正确: {[name for name, _, _ in remaining]}")
+            return
+        LOGGER.info(f"✓ {len(drift)} 个核心依赖已成功安装/验证。")
 
-        if force_reinstall:
-            should_install = True
-            reason = "接收到强制重新安装指令。"
-        else:
-            try:
-                installed_version = importlib_metadata.version(name)
-                # 使用startswith而不是==，以兼容带有构建元数据（如 +cu124）的版本号
-                if not installed_version.startswith(version):
-                    should_install = True
-                    reason = f"版本不匹配 (已安装: {installed_version}, 需要: {version})。"
-                else:
-                    LOGGER.info(f"✓ {name}>={version} 版本正确，无需操作。")
-            except importlib_metadata.PackageNotFoundError:
-                should_install = True
-                reason = "包未找到。"
-        
-        if should_install:
-            package_spec = f"{name}=={version}"
-            LOGGER.info(f"正在安装/更新 {package_spec} 因为: {reason}")
-            # 使用--force-reinstall确保即使已安装正确版本也会重新链接，以修复潜在的损坏
-            # 使用--no-deps防止在重新安装核心包时牵连到其他包
-            install_args = ["install", "--force-reinstall", "--no-dependencies", package_spec]
-
-            # 对torch相关包使用专用源，其他包使用配置的镜像源
-            if name.lower() in ["torch", "torchvision", "torchaudio"]:
-                install_args.extend(["--index-url", TORCH_INDEX_URL, "--extra-index-url", PIP_INDEX_URL])
-            else:
-                install_args.extend(["--index-url", PIP_INDEX_URL])
-
-            try:
-                run_pip(install_args)
-                LOGGER.info(f"✓ {package_spec} 已成功安装/验证。")
-            except Exception as e:
-                LOGGER.error(f"✗ 安装 {package_spec} 失败。错误: {e}")
-                # 即使有一个失败，也继续尝试安装其他的
-                continue
+    write_stamp(compute_fingerprint())
+    LOGGER.info(f"核心依赖验证和安装完成 ({time.perf_counter() - started:.2f} 秒)。")
 
-    LOGGER.info("核心依赖验证和安装完成。")
 
 if __name__ == "__main__":
+    if "--bake" in sys.argv[1:]:
+        sys.exit(bake_store())
     verify_and_install() 
\ No newline at end of file